@@ -22,6 +22,17 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
+# Defined by migrations only and deliberately not mapped on the models
+UNMAPPED_OBJECTS = {"email_search", "ix_emails_offer_data"}
+# Expression indexes managed by `python -m app.field_indexes`
+UNMAPPED_PREFIX = "ix_emails_field_"
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Keep autogenerate from dropping database-only objects."""
+    unmapped = name in UNMAPPED_OBJECTS or (name or "").startswith(UNMAPPED_PREFIX)
+    return not (reflected and compare_to is None and unmapped)
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
@@ -29,6 +40,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -47,7 +59,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
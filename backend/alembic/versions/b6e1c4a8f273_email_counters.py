@@ -0,0 +1,112 @@
+"""email_counters
+
+Revision ID: b6e1c4a8f273
+Revises: a3d7e2f90b14
+Create Date: 2026-10-17 17:11:05.902614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6e1c4a8f273'
+down_revision: Union[str, None] = 'a3d7e2f90b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Statement-level triggers aggregate each statement's rows by account and
+# status first, so a bulk insert or delete touches each counter row once.
+# Counter rows are upserted in key order so concurrent writers can't
+# deadlock. Emails without a status are counted as pending, like the API
+# shows them. Transition tables can't be combined with an `UPDATE OF`
+# column list, so updates that don't move a row between counters are
+# filtered out by the HAVING clause instead.
+APPLY_FUNCTION = """
+CREATE FUNCTION email_counters_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO email_counters (gmail_account_id, status, count)
+        SELECT gmail_account_id, COALESCE(status, 'PENDING'), count(*)
+        FROM new_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (gmail_account_id, status)
+        DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO email_counters (gmail_account_id, status, count)
+        SELECT gmail_account_id, COALESCE(status, 'PENDING'), -count(*)
+        FROM old_rows
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (gmail_account_id, status)
+        DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO email_counters (gmail_account_id, status, count)
+        SELECT gmail_account_id, status, sum(delta)
+        FROM (
+            SELECT gmail_account_id, COALESCE(status, 'PENDING') AS status, -1 AS delta FROM old_rows
+            UNION ALL
+            SELECT gmail_account_id, COALESCE(status, 'PENDING'), 1 FROM new_rows
+        ) AS changes
+        GROUP BY 1, 2
+        HAVING sum(delta) <> 0
+        ORDER BY 1, 2
+        ON CONFLICT (gmail_account_id, status)
+        DO UPDATE SET count = email_counters.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('email_counters',
+    sa.Column('gmail_account_id', sa.Integer(), nullable=False),
+    sa.Column('status', postgresql.ENUM('PENDING', 'PARSING', 'PARSED', 'REVIEWED', 'FAILED', name='emailstatus', create_type=False), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['gmail_account_id'], ['gmail_accounts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('gmail_account_id', 'status')
+    )
+    # ### end Alembic commands ###
+
+    # Lock out writers while the counters are seeded and the triggers installed
+    op.execute("LOCK TABLE emails IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(APPLY_FUNCTION)
+    op.execute("""
+        CREATE TRIGGER email_counters_insert AFTER INSERT ON emails
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_apply()
+    """)
+    op.execute("""
+        CREATE TRIGGER email_counters_update AFTER UPDATE ON emails
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_apply()
+    """)
+    op.execute("""
+        CREATE TRIGGER email_counters_delete AFTER DELETE ON emails
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION email_counters_apply()
+    """)
+    op.execute("""
+        INSERT INTO email_counters (gmail_account_id, status, count)
+        SELECT gmail_account_id, COALESCE(status, 'PENDING'), count(*)
+        FROM emails
+        GROUP BY 1, 2
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER email_counters_delete ON emails")
+    op.execute("DROP TRIGGER email_counters_update ON emails")
+    op.execute("DROP TRIGGER email_counters_insert ON emails")
+    op.execute("DROP FUNCTION email_counters_apply()")
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('email_counters')
+    # ### end Alembic commands ###
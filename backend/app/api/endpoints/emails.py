@@ -1,45 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import Optional, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, desc, func, select, text, tuple_
+from sqlalchemy.orm import selectinload
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
+import asyncio
+import base64
+import httpx
+import json
 
 from app.core.database import get_db
 from app.models.email import Email, EmailStatus
+from app.models.email_changes import EmailChanges
+from app.models.gmail_account import GmailAccount
+from app.services.email_export import (
+    EXPORT_FORMATS, export_query, export_records, schema_fields, ndjson_chunks, csv_chunks, parquet_chunks,
+)
+from app.services.email_ingest import EmailIngest, iter_lines
+from app.services.email_leases import lease_holder
+from app.services.gmail_sync import gmail_sync
+from app.services.email_search import search_emails
+from app.services.field_filters import FIELD_PARAM_PREFIX, build_field_filters
+from app.services.response_cache import (
+    response_cache, email_etag, list_etag, etag_matches, not_modified_since, not_modified, render_json, json_response,
+)
+from app.services.schema_registry import schema_registry
 
 router = APIRouter()
 
+# What the email list shows; bodies and JSON blobs never leave the database
+SUMMARY_COLUMNS = [
+    Email.id, Email.subject, Email.sender, Email.sender_name, Email.received_at,
+    Email.status, Email.gmail_account_id,
+    Email.has_parsed_data.label("has_parsed_data"),
+    Email.has_corrections.label("has_corrections"),
+]
+
 
 @router.get("/")
 async def list_emails(
+    request: Request,
     status: Optional[str] = Query(None, description="Filter by status: pending, parsed, reviewed, failed"),
     account_id: Optional[int] = Query(None, description="Filter by Gmail account"),
-    page: int = Query(1, ge=1),
+    page: int = Query(1, ge=1, description="Page number; ignored when a cursor is given"),
     page_size: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    count: str = Query("exact", pattern="^(exact|estimate|none)$", description="How to compute total"),
+    db: AsyncSession = Depends(get_db),
 ):
-    """List emails with optional filtering."""
-    query = db.query(Email)
+    """
+    List emails with optional filtering, newest first.
+    
+    Follow `next_cursor` for deep pages: it seeks straight to the page
+    through the (received_at, id) indexes, where `page` has to skip every
+    earlier row. Counting every match is the other cost on large inboxes;
+    pass count=estimate for the planner's estimate or count=none to skip it.
+    
+    Filter on extracted offer fields (the correction when there is one)
+    with `field.<path>[__<op>]=<value>`, e.g. `field.offer_type=guest_post`
+    or `field.price.amount__lt=200`. Operators: eq, ne, lt, lte, gt, gte,
+    in (comma-separated), contains, exists. Fields and value types come
+    from the active parsing schema.
+    """
+    query = select(*SUMMARY_COLUMNS)
+    
+    field_params = [
+        (key, value) for key, value in request.query_params.multi_items()
+        if key.startswith(FIELD_PARAM_PREFIX)
+    ]
+    if field_params:
+        compiled = await asyncio.to_thread(schema_registry.get_active)
+        try:
+            conditions = build_field_filters(field_params, compiled.schema, db.bind.dialect.name)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(*conditions)
     
     # Apply filters
     if status:
         try:
             status_enum = EmailStatus(status)
-            query = query.filter(Email.status == status_enum)
+            query = query.where(Email.status == status_enum)
         except ValueError:
             pass  # Invalid status, ignore filter
     
     if account_id:
-        query = query.filter(Email.gmail_account_id == account_id)
+        query = query.where(Email.gmail_account_id == account_id)
+    
+    # Validate on the trigger-maintained change count (one row) before
+    # counting matches or reading the page; read first, so a change made
+    # meanwhile makes the tag stale rather than the response
+    version = await db.scalar(select(EmailChanges.version))
+    etag = list_etag(request.url.query, version)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    cache_key = f"emails?{request.url.query}"
+    body = response_cache.get(cache_key, etag)
+    if body is not None:
+        return json_response(body, etag)
     
     # Get total count
-    total = query.count()
+    if count == "exact":
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    elif count == "estimate":
+        total = await estimate_count(db, query)
+    else:
+        total = None
+    
+    # Apply pagination and ordering; id breaks ties between equal timestamps
+    query = query.order_by(desc(Email.received_at), desc(Email.id))
+    if cursor:
+        received_at, last_id = decode_cursor(cursor)
+        query = query.where(tuple_(Email.received_at, Email.id) < tuple_(received_at, last_id))
+    else:
+        query = query.offset((page - 1) * page_size)
+    
+    # One extra row tells whether there is a next page
+    query = query.limit(page_size + 1)
     
-    # Apply pagination and ordering
-    emails = query.order_by(desc(Email.received_at)).offset((page - 1) * page_size).limit(page_size).all()
+    emails = (await db.execute(query)).all()
+    next_cursor = encode_cursor(emails[page_size - 1]) if len(emails) > page_size else None
+    email_ids = [e.id for e in emails]
+    emails = emails[:page_size]
     
     # Format response
-    return {
+    body = render_json({
         "emails": [
             {
                 "id": e.id,
@@ -49,34 +135,187 @@ async def list_emails(
                 "received_at": e.received_at.isoformat() if e.received_at else None,
                 "status": e.status.value if e.status else "pending",
                 "gmail_account_id": e.gmail_account_id,
-                "has_parsed_data": e.parsed_data is not None,
-                "has_corrections": e.corrected_data is not None,
+                "has_parsed_data": bool(e.has_parsed_data),
+                "has_corrections": bool(e.has_corrections),
             }
             for e in emails
         ],
         "total": total,
         "page": page,
         "page_size": page_size,
+        "next_cursor": next_cursor,
+    })
+    response_cache.put(cache_key, etag, body, email_ids)
+    return json_response(body, etag)
+
+
+@router.post("/bulk")
+async def bulk_ingest_emails(
+    request: Request,
+    on_conflict: str = Query("skip", pattern="^(skip|update)$", description="What to do with emails that already exist"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Ingest emails from an NDJSON request body, one `EmailCreate` object per line.
+    
+    The body is streamed and written in batches, so exports of any size
+    can be sent in one request. Emails are matched on
+    (gmail_account_id, gmail_message_id); re-sending the same export
+    inserts nothing new.
+    
+    Returns:
+        Counts of received, inserted, updated, duplicate and invalid lines,
+        plus the first errors with their line numbers
+    """
+    try:
+        ingest = EmailIngest(db, update=on_conflict == "update")
+    except ValueError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return await ingest.run(iter_lines(request.stream()))
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=500, description="Words, \"phrases\", OR, -excluded"),
+    status: Optional[str] = Query(None, description="Filter by status: pending, parsed, reviewed, failed"),
+    account_id: Optional[int] = Query(None, description="Filter by Gmail account"),
+    page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Full-text search over subjects, senders and bodies, best match first.
+    
+    Matches are wrapped in <mark> tags in `subject_highlight` and
+    `snippet`; the rest of the text is HTML-escaped.
+    """
+    status_enum = None
+    if status:
+        try:
+            status_enum = EmailStatus(status)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+    
+    after = decode_search_cursor(cursor) if cursor else None
+    results = await search_emails(db, q, status_enum, account_id, limit=page_size + 1, after=after)
+    next_cursor = encode_search_cursor(results[page_size - 1]) if len(results) > page_size else None
+    
+    return {
+        "results": results[:page_size],
+        "page_size": page_size,
+        "next_cursor": next_cursor,
     }
 
 
+@router.get("/export")
+async def export_emails(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    status: Optional[str] = Query(None, description="Filter by status: parsed, reviewed, failed"),
+    account_id: Optional[int] = Query(None, description="Filter by Gmail account"),
+    received_after: Optional[datetime] = Query(None, description="Only emails received at or after this time"),
+    received_before: Optional[datetime] = Query(None, description="Only emails received before this time"),
+):
+    """
+    Stream every parsed or corrected email with its extracted offer.
+    
+    Each record carries the email metadata plus `corrected_data` when a
+    human corrected it, `parsed_data` otherwise (`source` says which).
+    NDJSON nests the offer under `data`; CSV and Parquet flatten the
+    active schema's fields into columns. Results of any size are streamed
+    with constant memory.
+    """
+    query = export_query()
+    if status:
+        try:
+            query = query.where(Email.status == EmailStatus(status))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unknown status: {status}")
+    if account_id:
+        query = query.where(Email.gmail_account_id == account_id)
+    if received_after:
+        query = query.where(Email.received_at >= received_after)
+    if received_before:
+        query = query.where(Email.received_at < received_before)
+    
+    records = export_records(query)
+    if format == "ndjson":
+        body = ndjson_chunks(records)
+    else:
+        compiled = await asyncio.to_thread(schema_registry.get_active)
+        fields = schema_fields(compiled.schema)
+        body = csv_chunks(records, fields) if format == "csv" else parquet_chunks(records, fields)
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="emails.{extension}"'},
+    )
+
+
+@router.post("/{account_id}/fetch")
+async def fetch_emails(
+    account_id: int,
+    full: bool = Query(False, description="Re-list the whole mailbox instead of reading history"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Sync an account's mailbox into PENDING emails.
+    
+    The first sync imports the mailbox; later ones only fetch messages
+    added since the last sync.
+    """
+    if await db.get(GmailAccount, account_id) is None:
+        raise HTTPException(status_code=404, detail="Gmail account not found")
+    try:
+        return await gmail_sync.sync_account(account_id, full=full)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=502, detail=f"Gmail API error: {e.response.status_code}")
+    except httpx.TransportError as e:
+        raise HTTPException(status_code=502, detail=f"Gmail API unreachable: {e!r}")
+
+
 @router.get("/{email_id}")
-async def get_email(email_id: int, db: Session = Depends(get_db)):
-    """Get a specific email with its parsed data."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+async def get_email(email_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Get a specific email with its content and parsed data.
+    
+    Tagged with an ETag and Last-Modified from `updated_at`. A matching
+    If-None-Match (or If-Modified-Since) gets a 304 after looking up
+    that one column, without loading the email.
+    """
+    current = (await db.execute(select(Email.updated_at).where(Email.id == email_id))).first()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    
+    etag = email_etag(email_id, current.updated_at)
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (
+        if_none_match is None and not_modified_since(request.headers.get("if-modified-since"), current.updated_at)
+    ):
+        return not_modified(etag, current.updated_at)
+    cache_key = f"emails/{email_id}"
+    body = response_cache.get(cache_key, etag)
+    if body is not None:
+        return json_response(body, etag, current.updated_at)
+    
+    email = await db.get(Email, email_id, options=[selectinload(Email.content)])
     
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
-    return {
+    body = render_json({
         "id": email.id,
         "gmail_account_id": email.gmail_account_id,
         "gmail_message_id": email.gmail_message_id,
         "subject": email.subject,
         "sender": email.sender,
         "sender_name": email.sender_name,
-        "body_text": email.body_text,
-        "body_html": email.body_html,
+        "body_text": email.content.body_text if email.content else "",
+        "body_html": email.content.body_html if email.content else None,
+        "headers": email.content.headers if email.content else None,
         "received_at": email.received_at.isoformat() if email.received_at else None,
         "status": email.status.value if email.status else "pending",
         "parsed_data": email.parsed_data,
@@ -85,17 +324,29 @@ async def get_email(email_id: int, db: Session = Depends(get_db)):
         "parsed_at": email.parsed_at.isoformat() if email.parsed_at else None,
         "corrected_at": email.corrected_at.isoformat() if email.corrected_at else None,
         "created_at": email.created_at.isoformat() if email.created_at else None,
-    }
+    })
+    # Tag what is sent, in case the email changed since the lookup
+    etag = email_etag(email.id, email.updated_at)
+    response_cache.put(cache_key, etag, body, [email.id])
+    return json_response(body, etag, email.updated_at)
 
 
 @router.patch("/{email_id}")
 async def update_email(
     email_id: int,
     body: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Update email with corrections or status change."""
-    email = db.query(Email).filter(Email.id == email_id).first()
+    """
+    Update email with corrections or status change.
+    
+    Returns 409 while the email is queued or being parsed, since the
+    parse would overwrite the update.
+    """
+    # Locked so a worker can't claim the email between the check and the save
+    email = (await db.execute(
+        select(Email).where(Email.id == email_id).with_for_update()
+    )).scalar_one_or_none()
     
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
@@ -103,6 +354,9 @@ async def update_email(
     corrected_data = body.get("corrected_data")
     status = body.get("status")
     
+    if (corrected_data is not None or status) and lease_holder(email):
+        raise HTTPException(status_code=409, detail="Email is queued or being parsed")
+    
     if corrected_data is not None:
         # Calculate diff between parsed and corrected
         diff = calculate_diff(email.parsed_data or {}, corrected_data)
@@ -115,9 +369,13 @@ async def update_email(
             email.status = EmailStatus(status)
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+        # Drop what's left of an expired lease
+        email.lease_owner = None
+        email.lease_expires_at = None
     
-    db.commit()
-    db.refresh(email)
+    await db.commit()
+    await db.refresh(email)
+    response_cache.invalidate(email.id)
     
     return {
         "message": "Email updated successfully",
@@ -145,3 +403,45 @@ def calculate_diff(original: dict, corrected: dict) -> list:
             diff.append({"field": key, "old_value": old_val, "new_value": new_val, "change_type": "modified"})
     
     return diff
+
+
+def encode_cursor(email) -> str:
+    """Opaque cursor pointing just past an email in the list order."""
+    raw = json.dumps([email.received_at.isoformat(), email.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        received_at, email_id = json.loads(raw)
+        return datetime.fromisoformat(received_at), int(email_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_search_cursor(result: dict) -> str:
+    """Opaque cursor pointing just past a search result."""
+    raw = json.dumps([result["rank"], result["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, email_id = json.loads(raw)
+        return float(rank), int(email_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def estimate_count(db: AsyncSession, query: Select) -> int:
+    """Row count from the PostgreSQL planner's estimate; exact on other databases."""
+    dialect = db.bind.dialect
+    if dialect.name != "postgresql":
+        return await db.scalar(select(func.count()).select_from(query.subquery()))
+    statement = query.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {statement}"))
+    if isinstance(plan, str):
+        plan = json.loads(plan)  # asyncpg returns json columns undecoded
+    return int(plan[0]["Plan"]["Plan Rows"])
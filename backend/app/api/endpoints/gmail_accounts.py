@@ -1,25 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
 from app.core.database import get_db
 from app.models.gmail_account import GmailAccount
 from app.models.email import Email
+from app.services.email_stats import account_totals
 
 router = APIRouter()
 
+SUMMARY_COLUMNS = [
+    GmailAccount.id, GmailAccount.email, GmailAccount.display_name,
+    GmailAccount.is_active, GmailAccount.last_sync, GmailAccount.created_at,
+]
+
 
 @router.get("/")
-async def list_gmail_accounts(db: Session = Depends(get_db)):
+async def list_gmail_accounts(db: AsyncSession = Depends(get_db)):
     """List all connected Gmail accounts."""
-    accounts = db.query(GmailAccount).all()
+    # OAuth tokens are never needed for the listing
+    accounts = (await db.scalars(select(GmailAccount).options(load_only(*SUMMARY_COLUMNS)))).all()
+    
+    email_counts = await account_totals(db)
     
     result = []
     for account in accounts:
-        # Get email count for this account
-        email_count = db.query(func.count(Email.id)).filter(
-            Email.gmail_account_id == account.id
-        ).scalar()
+        email_count = email_counts.get(account.id, 0)
         
         result.append({
             "id": account.id,
@@ -42,23 +49,23 @@ async def initiate_gmail_connection():
 
 
 @router.post("/callback")
-async def gmail_oauth_callback(code: str, db: Session = Depends(get_db)):
+async def gmail_oauth_callback(code: str, db: AsyncSession = Depends(get_db)):
     """Handle OAuth callback from Google."""
     # TODO: Implement OAuth callback handling
     return {"message": "OAuth callback not yet implemented"}
 
 
 @router.delete("/{account_id}")
-async def disconnect_gmail_account(account_id: int, db: Session = Depends(get_db)):
+async def disconnect_gmail_account(account_id: int, db: AsyncSession = Depends(get_db)):
     """Disconnect a Gmail account."""
-    account = db.query(GmailAccount).filter(GmailAccount.id == account_id).first()
+    account = await db.get(GmailAccount, account_id)
     
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
     # Delete associated emails first
-    db.query(Email).filter(Email.gmail_account_id == account_id).delete()
-    db.delete(account)
-    db.commit()
+    await db.execute(delete(Email).where(Email.gmail_account_id == account_id))
+    await db.delete(account)
+    await db.commit()
     
     return {"message": "Account disconnected", "id": account_id}
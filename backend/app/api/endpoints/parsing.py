@@ -1,103 +1,40 @@
 """Parsing endpoints for email processing."""
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request
+from fastapi.responses import StreamingResponse
+from jsonschema.exceptions import SchemaError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 from datetime import datetime
+import asyncio
 import json
-import os
 import logging
+import uuid
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.services.openai_parser import parse_email as openai_parse_email
+from app.services.email_leases import email_leases, job_lease_owner, lease_holder
+from app.services.job_queue import get_job_queue
+from app.services.parse_cache import parse_cache
+from app.services.parsing_engine import parsing_engine
+from app.services.rate_limiter import rate_limiter
+from app.services.response_cache import response_cache
+from app.services.schema_registry import schema_registry
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# File-based schema storage (simple approach for MVP)
-SCHEMA_FILE = "/app/data/parsing_schema.json"
-
-# Default JSON schema for parsing commercial offers
-DEFAULT_PARSING_SCHEMA = {
-    "type": "object",
-    "properties": {
-        "company_name": {
-            "type": "string",
-            "description": "Name of the company making the offer"
-        },
-        "contact_email": {
-            "type": "string",
-            "description": "Contact email address"
-        },
-        "contact_name": {
-            "type": "string",
-            "description": "Name of the contact person"
-        },
-        "website_url": {
-            "type": "string",
-            "description": "Website URL being offered"
-        },
-        "offer_type": {
-            "type": "string",
-            "description": "Type of offer (e.g., partnership, advertising, guest_post, link_exchange, acquisition, sponsored)"
-        },
-        "price": {
-            "type": "object",
-            "properties": {
-                "amount": {"type": "number", "description": "Price amount if mentioned"},
-                "currency": {"type": "string", "description": "Currency code (USD, EUR, etc.)"}
-            }
-        },
-        "description": {
-            "type": "string",
-            "description": "Brief summary of what is being offered"
-        },
-        "metrics": {
-            "type": "object",
-            "properties": {
-                "monthly_traffic": {"type": "string", "description": "Monthly visitors/traffic if mentioned"},
-                "domain_authority": {"type": "number", "description": "DA score if mentioned"},
-                "page_authority": {"type": "number", "description": "PA score if mentioned"}
-            },
-            "description": "Website metrics if mentioned in the email"
-        }
-    },
-    "required": ["company_name", "offer_type"]
-}
-
-
-def load_schema() -> Dict[str, Any]:
-    """Load schema from file or return default."""
-    try:
-        if os.path.exists(SCHEMA_FILE):
-            with open(SCHEMA_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading schema: {e}")
-    return DEFAULT_PARSING_SCHEMA
-
-
-def save_schema(schema: Dict[str, Any]) -> None:
-    """Save schema to file."""
-    try:
-        os.makedirs(os.path.dirname(SCHEMA_FILE), exist_ok=True)
-        with open(SCHEMA_FILE, 'w') as f:
-            json.dump(schema, f, indent=2)
-        logger.info(f"Schema saved to {SCHEMA_FILE}")
-    except Exception as e:
-        logger.error(f"Error saving schema: {e}")
-        raise
-
 
 @router.get("/schema")
 async def get_parsing_schema():
-    """Get the current JSON schema used for parsing."""
-    schema = load_schema()
-    return {"schema": schema}
+    """Get the active JSON schema used for parsing."""
+    compiled = await asyncio.to_thread(schema_registry.get_active)
+    return {"schema": compiled.schema, "version": compiled.version}
 
 
 @router.put("/schema")
 async def update_parsing_schema(body: Dict[str, Any] = Body(...)):
-    """Update the JSON schema used for parsing."""
+    """Publish a new version of the JSON schema used for parsing."""
     schema = body.get("schema")
     if not schema:
         raise HTTPException(status_code=400, detail="Schema is required in request body")
@@ -106,168 +43,271 @@ async def update_parsing_schema(body: Dict[str, Any] = Body(...)):
         raise HTTPException(status_code=400, detail="Schema must be an object")
     
     try:
-        save_schema(schema)
+        compiled = await asyncio.to_thread(schema_registry.publish, schema)
+    except SchemaError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON schema: {e.message}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save schema: {str(e)}")
     
-    return {"message": "Schema updated successfully", "schema": schema}
+    return {"message": "Schema updated successfully", "schema": compiled.schema, "version": compiled.version}
+
+
+@router.get("/schema/versions")
+async def list_schema_versions():
+    """List all published schema versions, newest first."""
+    return {"versions": await asyncio.to_thread(schema_registry.list_versions)}
+
+
+@router.get("/schema/versions/{version}")
+async def get_schema_version(version: int):
+    """Get a specific schema version."""
+    compiled = await asyncio.to_thread(schema_registry.get_version, version)
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Schema version not found")
+    return {"schema": compiled.schema, "version": compiled.version}
+
+
+@router.post("/schema/versions/{version}/activate")
+async def activate_schema_version(version: int):
+    """Make an existing schema version active again (e.g. to roll back)."""
+    compiled = await asyncio.to_thread(schema_registry.activate, version)
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Schema version not found")
+    return {"message": f"Schema version {version} activated", "version": compiled.version}
 
 
 @router.post("/parse/{email_id}")
-async def parse_email(email_id: int, db: Session = Depends(get_db)):
+async def parse_email(email_id: int, db: AsyncSession = Depends(get_db)):
     """
-    Parse a specific email using OpenAI and the current schema.
+    Queue a specific email for parsing with OpenAI and the current schema.
     
-    This will:
+    A worker will:
     1. Load the email from database
     2. Load the current parsing schema
     3. Send to OpenAI for parsing
     4. Save the parsed data back to the email record
+    
+    Poll `GET /parsing/jobs/{job_id}` for progress. Returns 409 if the
+    email is already queued or being parsed.
     """
-    from app.models.email import Email, EmailStatus
+    from app.models.email import Email
+    from app.models.email_content import EmailContent
     
     # Get the email
-    email = db.query(Email).filter(Email.id == email_id).first()
+    email = (await db.execute(
+        select(Email.id, EmailContent.body_text, EmailContent.body_html)
+        .outerjoin(EmailContent, EmailContent.email_id == Email.id)
+        .where(Email.id == email_id)
+    )).first()
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
     # Check if email has content
-    if not email.body_text:
+    if not email.body_text and not email.body_html:
         raise HTTPException(status_code=400, detail="Email has no content to parse")
     
-    # Update status to parsing
-    email.status = EmailStatus.PARSING
-    db.commit()
+    # Reserved for the job until a worker takes it over
+    job_id = uuid.uuid4().hex
+    claimed = await asyncio.to_thread(
+        email_leases.claim_email, email_id, job_lease_owner(job_id), settings.PARSE_QUEUE_LEASE_SECONDS,
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Email is already queued or being parsed")
     
     try:
-        # Load current schema
-        schema = load_schema()
-        
-        # Call OpenAI parser with full metadata
-        result = openai_parse_email(
-            email_body=email.body_text,
-            schema=schema,
-            subject=email.subject or "",
-            sender_email=email.sender or "",
-            sender_name=email.sender_name or "",
-            received_at=email.received_at,
-            headers=email.headers,  # Additional headers like Reply-To, CC
-        )
-        
-        if result["success"]:
-            # Save parsed data and clear any previous corrections
-            email.parsed_data = result["data"]
-            email.parsing_model = result.get("model", "gpt-4-turbo-preview")
-            email.parsed_at = datetime.utcnow()
-            email.status = EmailStatus.PARSED
-            email.error_message = None
-            # Clear corrections when re-parsing - user wants fresh AI output
-            email.corrected_data = None
-            email.correction_diff = None
-            email.corrected_at = None
-            
-            db.commit()
-            
-            return {
-                "success": True,
-                "email_id": email_id,
-                "parsed_data": result["data"],
-                "model": result.get("model"),
-                "usage": result.get("usage"),
-            }
-        else:
-            # Parsing failed
-            email.status = EmailStatus.FAILED
-            email.error_message = result.get("error", "Unknown parsing error")
-            db.commit()
-            
-            raise HTTPException(
-                status_code=500,
-                detail=f"Parsing failed: {result.get('error', 'Unknown error')}"
-            )
-            
-    except HTTPException:
+        job_id = await get_job_queue().enqueue_parse([email_id], job_id=job_id)
+    except Exception:
+        # No job will take the email over; don't hold it for PARSE_QUEUE_LEASE_SECONDS
+        await asyncio.to_thread(email_leases.release, job_lease_owner(job_id), [email_id])
         raise
-    except Exception as e:
-        # Unexpected error
-        email.status = EmailStatus.FAILED
-        email.error_message = str(e)
-        db.commit()
-        
-        logger.error(f"Unexpected error parsing email {email_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Parsing error: {str(e)}")
+    
+    return {
+        "job_id": job_id,
+        "queued": 1,
+        "email_ids": [email_id],
+    }
 
 
 @router.post("/parse-batch")
-async def parse_batch(
-    body: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db),
-):
+async def parse_batch(body: Dict[str, Any] = Body(...)):
     """
     Queue a batch of pending emails for parsing.
     
+    Emails are claimed atomically, so concurrent batches (and workers)
+    never get the same email; claimed emails show as `parsing` until
+    their result is saved.
+    
     Body:
         - count: Number of emails to process (default 10, max 100)
+        - stream: If true, parse in this request instead of queueing and
+          stream one NDJSON line per email as it finishes; emails without
+          a line when the client disconnects go back to pending
+        - pack: With stream, pack short emails into shared completions
+          (default: PACKING_ENABLED)
     
     Returns:
+        - job_id: ID to poll with `GET /parsing/jobs/{job_id}`
         - queued: Number of emails queued
         - email_ids: List of email IDs that will be processed
     """
-    from app.models.email import Email, EmailStatus
-    
     count = min(body.get("count", 10), 100)  # Cap at 100
     
-    # Get pending emails
-    pending_emails = db.query(Email).filter(
-        Email.status == EmailStatus.PENDING
-    ).limit(count).all()
+    # Claim pending emails: for this process when streaming, else for the job until workers take them over
+    job_id = uuid.uuid4().hex
+    owner = parsing_engine.lease_owner if body.get("stream") else job_lease_owner(job_id)
+    email_ids = await asyncio.to_thread(
+        email_leases.claim_pending, owner, count, settings.PARSE_QUEUE_LEASE_SECONDS,
+    )
     
-    if not pending_emails:
+    if not email_ids:
         return {
             "queued": 0,
             "email_ids": [],
             "message": "No pending emails to process"
         }
     
-    email_ids = [e.id for e in pending_emails]
-    
-    # Process each email (sequential for now, will be async later)
-    results = []
-    for email_id in email_ids:
-        try:
-            result = await parse_email(email_id, db)
-            results.append({"email_id": email_id, "success": True})
-        except Exception as e:
-            results.append({"email_id": email_id, "success": False, "error": str(e)})
+    if body.get("stream"):
+        schema = await asyncio.to_thread(schema_registry.get_active)
+        
+        async def stream_results():
+            results = parsing_engine.parse_many(email_ids, schema, pack=body.get("pack"))
+            settled = set()
+            
+            async def release_unsettled():
+                # Cancel the parses still running first, so none settles
+                # an email after it's been handed back
+                await results.aclose()
+                unsettled = [email_id for email_id in email_ids if email_id not in settled]
+                if unsettled:
+                    await asyncio.to_thread(email_leases.release, parsing_engine.lease_owner, unsettled)
+            
+            try:
+                async for result in results:
+                    settled.add(result["email_id"])
+                    yield json.dumps(result) + "\n"
+            finally:
+                # The client went away: hand back the emails it won't get
+                # rather than holding them for PARSE_QUEUE_LEASE_SECONDS.
+                # Shielded, since a disconnect cancels this request
+                await asyncio.shield(release_unsettled())
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
     
-    successful = sum(1 for r in results if r["success"])
+    try:
+        job_id = await get_job_queue().enqueue_parse(email_ids, job_id=job_id)
+    except Exception:
+        # No job will take the emails over; don't hold them for PARSE_QUEUE_LEASE_SECONDS
+        await asyncio.to_thread(email_leases.release, owner, email_ids)
+        raise
     
     return {
-        "processed": len(results),
-        "successful": successful,
-        "failed": len(results) - successful,
-        "results": results,
+        "job_id": job_id,
+        "queued": len(email_ids),
+        "email_ids": email_ids,
     }
 
 
+@router.get("/jobs/{job_id}")
+async def get_parse_job(job_id: str):
+    """Get the status and progress of a parse job."""
+    job = await get_job_queue().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_parse_job_events(job_id: str, request: Request):
+    """
+    Follow a parse job live, as Server-Sent Events.
+    
+    Starts with a `progress` event for where the job stands, then sends
+    `parsed`, `failed` and `retrying` events (email ID, attempt, model,
+    token usage, errors) as workers settle each email, each followed by
+    a `progress` event. The stream ends after the job completes; a client
+    that reconnects gets the current progress again.
+    """
+    queue = get_job_queue()
+    if not await queue.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def stream_events():
+        events = queue.events(job_id, keepalive=settings.JOB_EVENTS_KEEPALIVE_SECONDS)
+        try:
+            async for event in events:
+                if await request.is_disconnected():
+                    break
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/dead-letters")
+async def list_dead_letters(limit: int = Query(100, ge=1, le=1000)):
+    """List parse tasks that exhausted their retries, newest first."""
+    return {"dead_letters": await get_job_queue().dead_letters(limit)}
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Parse cache hit/miss counters for this API process."""
+    return parse_cache.get_stats()
+
+
+@router.delete("/cache")
+async def clear_cache():
+    """Drop all cached parse results, e.g. after a prompt change."""
+    await asyncio.to_thread(parse_cache.clear)
+    return {"message": "Parse cache cleared"}
+
+
+@router.get("/rate-limit")
+async def get_rate_limit_stats():
+    """LLM rate limiter state and retry counters for this API process."""
+    return rate_limiter.get_stats()
+
+
 @router.post("/correct/{email_id}")
 async def save_correction(
     email_id: int,
     body: Dict[str, Any] = Body(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Save human correction for a parsed email."""
+    """
+    Save human correction for a parsed email.
+    
+    Returns 409 while the email is queued or being parsed, since the
+    parse would overwrite the correction.
+    """
     from app.models.email import Email, EmailStatus
     
-    email = db.query(Email).filter(Email.id == email_id).first()
+    # Locked so a worker can't claim the email between the check and the save
+    email = (await db.execute(
+        select(Email).where(Email.id == email_id).with_for_update()
+    )).scalar_one_or_none()
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
     corrected_data = body.get("corrected_data")
     if corrected_data:
+        if lease_holder(email):
+            raise HTTPException(status_code=409, detail="Email is queued or being parsed")
         email.corrected_data = corrected_data
         email.corrected_at = datetime.utcnow()
         email.status = EmailStatus.REVIEWED
-        db.commit()
+        # Drop what's left of an expired lease
+        email.lease_owner = None
+        email.lease_expires_at = None
+        await db.commit()
+        response_cache.invalidate(email.id)
     
     return {"message": "Correction saved", "email_id": email_id}
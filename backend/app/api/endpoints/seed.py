@@ -1,12 +1,16 @@
 """Seed endpoint for development - adds sample data to database."""
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 import random
 
 from app.core.database import get_db
 from app.models.gmail_account import GmailAccount
 from app.models.email import Email, EmailStatus
+from app.models.email_content import content_hash
+from app.services.email_contents import store_contents
+from app.services.near_duplicates import email_simhash
 
 router = APIRouter()
 
@@ -175,11 +179,11 @@ Brand Promo Team""",
 
 
 @router.post("/")
-async def seed_database(db: Session = Depends(get_db)):
+async def seed_database(db: AsyncSession = Depends(get_db)):
     """Seed the database with sample data for development."""
     
     # Check if data already exists
-    existing = db.query(GmailAccount).first()
+    existing = await db.scalar(select(GmailAccount).limit(1))
     if existing:
         return {"message": "Database already seeded", "seeded": False}
     
@@ -194,9 +198,10 @@ async def seed_database(db: Session = Depends(get_db)):
         last_sync=datetime.utcnow(),
     )
     db.add(gmail_account)
-    db.flush()  # Get the ID
+    await db.flush()  # Get the ID
     
     # Create sample emails
+    emails = []
     for i, email_data in enumerate(SAMPLE_EMAILS):
         email = Email(
             gmail_account_id=gmail_account.id,
@@ -204,15 +209,30 @@ async def seed_database(db: Session = Depends(get_db)):
             subject=email_data["subject"],
             sender=email_data["sender"],
             sender_name=email_data["sender_name"],
-            body_text=email_data["body_text"],
+            content_hash=content_hash(email_data["body_text"], None, None),
+            simhash=email_simhash(email_data["body_text"]),
             received_at=datetime.utcnow() - timedelta(hours=i * 3),
             status=email_data["status"],
             parsed_data=email_data["parsed_data"],
             parsed_at=datetime.utcnow() if email_data["parsed_data"] else None,
         )
         db.add(email)
+        emails.append(email)
+    await db.flush()
     
-    db.commit()
+    await store_contents(db, [
+        {
+            "email_id": email.id,
+            "subject": email.subject,
+            "sender": email.sender,
+            "sender_name": email.sender_name,
+            "body_text": email_data["body_text"],
+            "body_html": None,
+            "headers": None,
+        }
+        for email, email_data in zip(emails, SAMPLE_EMAILS)
+    ])
+    await db.commit()
     
     return {
         "message": "Database seeded successfully",
@@ -223,10 +243,10 @@ async def seed_database(db: Session = Depends(get_db)):
 
 
 @router.delete("/")
-async def clear_seed_data(db: Session = Depends(get_db)):
+async def clear_seed_data(db: AsyncSession = Depends(get_db)):
     """Clear all seeded data (for development only)."""
-    db.query(Email).delete()
-    db.query(GmailAccount).delete()
-    db.commit()
+    await db.execute(delete(Email))
+    await db.execute(delete(GmailAccount))
+    await db.commit()
     return {"message": "All data cleared"}
 
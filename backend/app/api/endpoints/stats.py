@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.services.email_stats import get_stats
+
+router = APIRouter()
+
+
+@router.get("/")
+async def email_stats(db: AsyncSession = Depends(get_db)):
+    """Email counts by status, overall and per Gmail account."""
+    return await get_stats(db)
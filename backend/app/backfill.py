@@ -0,0 +1,41 @@
+"""
+Offline backfill command.
+
+Parses pending emails through the provider's Batch API instead of the
+real-time job queue. Suited to nightly runs over thousands of emails:
+
+    python -m app.backfill                 # submit everything pending and wait
+    python -m app.backfill --no-wait       # submit, or collect finished batches, and exit
+    python -m app.backfill --resume-only   # only advance runs that already exist
+
+Progress is checkpointed in the `backfill_runs` table, so an interrupted
+backfill resumes where it stopped when the command is run again.
+"""
+import argparse
+import json
+import logging
+
+from app.services.backfill import Backfill
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse pending emails with the provider Batch API")
+    parser.add_argument("--limit", type=int, default=None, help="Max pending emails to submit (default: all)")
+    parser.add_argument("--no-wait", action="store_true", help="Advance each run once instead of polling to completion")
+    parser.add_argument("--resume-only", action="store_true", help="Don't submit new emails")
+    parser.add_argument("--poll-seconds", type=float, default=None, help="Seconds between polls (default: BACKFILL_POLL_SECONDS)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    backfill = Backfill()
+    try:
+        summaries = backfill.run(
+            limit=args.limit,
+            wait=not args.no_wait,
+            resume_only=args.resume_only,
+            poll_seconds=args.poll_seconds,
+        )
+    finally:
+        backfill.client.close()
+
+    for summary in summaries:
+        print(json.dumps(summary))
@@ -11,6 +11,20 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Job queue
+    JOB_QUEUE_BACKEND: str = "redis"  # "redis", or "memory" to run jobs in the API process
+    WORKER_CONCURRENCY: int = 4  # Parallel tasks per worker process
+    JOB_MAX_RETRIES: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0  # Doubles with each attempt
+    JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0  # Comment sent on idle job event streams so proxies keep them open
+    WORKER_HEARTBEAT_TTL_SECONDS: float = 60.0  # A worker silent this long is presumed dead and its tasks requeued
+    
+    # Parse leases (an email claimed for parsing is reserved for its claimant)
+    PARSE_LEASE_SECONDS: int = 300  # Reservation without a heartbeat before the email is requeued
+    PARSE_LEASE_HEARTBEAT_SECONDS: float = 60.0  # How often parsers extend the leases they hold
+    PARSE_QUEUE_LEASE_SECONDS: int = 3600  # Reservation of emails queued by /parse-batch until a worker starts them
+    PARSE_LEASE_REAP_SECONDS: float = 30.0  # How often workers requeue emails with expired leases
+    
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
@@ -18,9 +32,94 @@ class Settings(BaseSettings):
     # Google OAuth
     GOOGLE_CLIENT_ID: Optional[str] = None
     GOOGLE_CLIENT_SECRET: Optional[str] = None
+    GOOGLE_TOKEN_URL: str = "https://oauth2.googleapis.com/token"
+    
+    # Gmail sync
+    GMAIL_API_BASE_URL: str = "https://gmail.googleapis.com/gmail/v1"
+    GMAIL_SYNC_QUERY: Optional[str] = None  # Gmail search query limiting the full import, e.g. "newer_than:1y"
+    GMAIL_PAGE_SIZE: int = 500  # Message IDs per list or history page (Gmail's maximum)
+    GMAIL_FETCH_CONCURRENCY: int = 10  # In-flight message fetches per account
+    GMAIL_SYNC_ACCOUNT_CONCURRENCY: int = 4  # Accounts synced at once
+    
+    # LLM backend
+    LLM_BACKEND: str = "openai"  # "openai", "local" (OpenAI-compatible server), or "mock"
+    LLM_MODEL: str = "gpt-4-turbo-preview"  # Must support JSON mode
     
     # OpenAI
     OPENAI_API_KEY: Optional[str] = None
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    
+    # Local OpenAI-compatible server (vLLM, Ollama, or `python -m app.mock_llm`)
+    LOCAL_LLM_BASE_URL: str = "http://localhost:8001/v1"
+    LOCAL_LLM_API_KEY: Optional[str] = None
+    LOCAL_LLM_MODEL: str = "local"
+    
+    # Mock LLM for load testing
+    MOCK_LLM_LATENCY: str = "lognormal"  # "fixed", "uniform", or "lognormal"
+    MOCK_LLM_LATENCY_MS: float = 800.0  # Median latency
+    MOCK_LLM_LATENCY_SPREAD: float = 0.5  # Lognormal sigma, or +/- share for uniform
+    MOCK_LLM_ERROR_RATE: float = 0.0  # Share of calls failing with a 500
+    MOCK_LLM_RATE_LIMIT_RATE: float = 0.0  # Share of calls failing with a 429
+    MOCK_LLM_SEED: int = 0
+    
+    # LLM rate limiting (per process; split the account quota across workers)
+    LLM_RPM_LIMIT: int = 500  # Requests per minute, 0 for no limit
+    LLM_TPM_LIMIT: int = 150_000  # Tokens per minute, 0 for no limit
+    LLM_MAX_CONCURRENCY: int = 16  # Ceiling for the adaptive in-flight limit
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_MAX_RETRIES: int = 5  # For rate limits, timeouts, connection errors and 5xx
+    LLM_BACKOFF_BASE_SECONDS: float = 1.0  # Doubles with each attempt, with jitter
+    LLM_BACKOFF_MAX_SECONDS: float = 60.0
+    LLM_REQUEST_TIMEOUT_SECONDS: float = 60.0
+    
+    # Bulk email ingest
+    INGEST_BATCH_SIZE: int = 1000  # Rows per INSERT ... ON CONFLICT statement
+    
+    # Email contents (bodies and headers, stored zstd-compressed)
+    CONTENT_COMPRESSION_LEVEL: int = 3  # zstd level, 1-22; higher is smaller and slower to write
+    
+    # Offer field filters
+    FIELD_INDEXES: str = "offer_type,price.amount"  # Comma-separated fields to index (python -m app.field_indexes)
+    
+    # Export
+    EXPORT_BATCH_SIZE: int = 1000  # Rows fetched per cursor round trip, and per Parquet row group
+    
+    # Parsing
+    PARSING_CONCURRENCY: int = 8  # Max in-flight LLM calls per batch
+    NORMALIZE_EMAIL_BODIES: bool = True  # Strip quotes, footers and HTML noise before parsing
+    PROMPT_TOKEN_BUDGET: int = 6000  # Max tokens in the user prompt
+    PROMPT_TAIL_RATIO: float = 0.3  # Share of a truncated body kept from the end
+    TOKENIZER_ENCODING: str = "cl100k_base"
+    
+    # Rule-based pre-extraction ahead of the LLM
+    PRE_EXTRACT_ENABLED: bool = True
+    PRE_EXTRACT_MIN_CONFIDENCE: float = 0.85  # Values this sure are trusted; the LLM is skipped if all required fields are
+    
+    # Near-duplicate (template sibling) reuse
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6  # Max differing SimHash bits (always found up to 3, usually up to 6)
+    
+    # Packed parsing (several short emails per completion)
+    PACKING_ENABLED: bool = False
+    PACK_TOKEN_BUDGET: int = 6000  # Max user prompt tokens per packed request
+    PACK_MAX_EMAILS: int = 8
+    PACK_MAX_EMAIL_TOKENS: int = 1000  # Longer emails are always parsed alone
+    PACK_OUTPUT_TOKENS_PER_EMAIL: int = 400
+    
+    # Offline backfill through the provider batch API
+    BACKFILL_DIR: str = "/tmp/backfill"  # Where batch input files are written
+    BACKFILL_MAX_REQUESTS: int = 10_000  # Emails per batch
+    BACKFILL_POLL_SECONDS: float = 60.0
+    BACKFILL_APPLY_CHUNK_SIZE: int = 500  # Result lines written back per commit
+    
+    # Parse result cache
+    PARSE_CACHE_ENABLED: bool = True
+    PARSE_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60  # 30 days
+    PARSE_CACHE_MEMORY_SIZE: int = 1000  # Entries kept in the in-process LRU
+    PARSE_CACHE_MAX_ENTRIES: int = 100_000  # Rows kept in the database
+    
+    # Rendered email list and detail responses kept per API process; 0 disables
+    EMAIL_RESPONSE_CACHE_SIZE: int = 500
     
     # Frontend
     FRONTEND_URL: str = "http://localhost:3000"
@@ -0,0 +1,29 @@
+"""
+Offer field index command.
+
+Builds expression indexes for the offer fields named in FIELD_INDEXES,
+typed after the active parsing schema, so `field.` filters on them are
+served from an index (PostgreSQL only):
+
+    python -m app.field_indexes             # create missing, drop unlisted
+    python -m app.field_indexes --rebuild   # after a field changed type
+
+Indexes are built concurrently; the API keeps serving meanwhile.
+"""
+import argparse
+import json
+import logging
+
+from app.core.config import settings
+from app.services.field_filters import sync_field_indexes
+from app.services.schema_registry import schema_registry
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index offer fields for filtering")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and rebuild every field index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    paths = [path.strip() for path in settings.FIELD_INDEXES.split(",") if path.strip()]
+    result = sync_field_indexes(paths, schema_registry.get_active().schema, rebuild=args.rebuild)
+    print(json.dumps(result))
@@ -0,0 +1,44 @@
+"""
+Gmail sync command.
+
+Imports new mail from connected accounts as PENDING emails:
+
+    python -m app.gmail_sync                   # sync every active account once
+    python -m app.gmail_sync --account 3 --full
+    python -m app.gmail_sync --interval 60     # keep polling every minute
+
+The first sync of an account imports its mailbox; later runs only read
+Gmail's history from the account's stored `last_history_id`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from app.services.gmail_sync import gmail_sync
+
+
+async def main(args: argparse.Namespace) -> None:
+    while True:
+        if args.account is not None:
+            results = [await gmail_sync.sync_account(args.account, full=args.full)]
+        else:
+            results = await gmail_sync.sync_all(full=args.full)
+        for result in results:
+            print(json.dumps(result))
+        if not args.interval:
+            return
+        # Only the first pass is a forced full sync
+        args.full = False
+        await asyncio.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync Gmail accounts into pending emails")
+    parser.add_argument("--account", type=int, default=None, help="Gmail account ID (default: all active accounts)")
+    parser.add_argument("--full", action="store_true", help="Re-list whole mailboxes instead of reading history")
+    parser.add_argument("--interval", type=float, default=None, help="Seconds between syncs (default: sync once and exit)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    asyncio.run(main(args))
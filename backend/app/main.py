@@ -1,8 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.api import router as api_router
+from app.core.database import async_engine
+from app.services.job_queue import get_job_queue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start an in-process worker when the job queue lives in memory."""
+    worker = None
+    if settings.JOB_QUEUE_BACKEND == "memory":
+        from app.worker import run_worker
+        worker = asyncio.create_task(run_worker(worker_id="api"))
+    
+    yield
+    
+    if worker:
+        worker.cancel()
+    await get_job_queue().backend.close()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="Email Parsing Agent API",
@@ -10,6 +32,7 @@ app = FastAPI(
     version="0.1.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS Configuration
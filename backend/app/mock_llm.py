@@ -0,0 +1,191 @@
+"""
+Local mock LLM server.
+
+Serves an OpenAI-compatible `/v1/chat/completions` endpoint backed by the
+mock backend, so load tests go through real HTTP without network access
+or API costs:
+
+    python -m app.mock_llm --port 8001
+    LLM_BACKEND=local LOCAL_LLM_BASE_URL=http://localhost:8001/v1 uvicorn app.main:app
+
+Latency, error rates and the seed come from the MOCK_LLM_* settings.
+Simulated failures are returned with their real status codes and
+Retry-After headers.
+
+It also stands in for the Batch API (`/v1/files` and `/v1/batches`), so
+backfills run end to end against it:
+
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=mock python -m app.backfill
+
+Batches are run through the same mock backend as soon as they're
+created; files and batches are kept in memory.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, Optional, Set
+
+import openai
+import uvicorn
+from fastapi import FastAPI, Body, File, Form, UploadFile
+from fastapi.responses import JSONResponse, Response
+
+from app.services.llm_backends import MockBackend
+
+app = FastAPI(title="Mock LLM")
+backend = MockBackend()
+
+# Batch API state
+files: Dict[str, bytes] = {}
+batches: Dict[str, Dict[str, Any]] = {}
+_batch_tasks: Set[asyncio.Task] = set()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: dict = Body(...)):
+    try:
+        completion = await backend.acreate(request)
+    except openai.APIStatusError as e:
+        headers = {k: v for k, v in e.response.headers.items() if k.startswith("retry-after")}
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"error": {"message": e.message, "type": "mock_error"}},
+            headers=headers,
+        )
+    except openai.APITimeoutError:
+        return JSONResponse(status_code=504, content={"error": {"message": "Mock timeout", "type": "mock_error"}})
+    return completion.model_dump()
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_mock{uuid.uuid4().hex[:16]}"
+
+
+def _not_found(what: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"error": {"message": f"No such {what}", "type": "invalid_request_error"}})
+
+
+def _store_file(lines: list) -> Optional[str]:
+    if not lines:
+        return None
+    file_id = _new_id("file")
+    files[file_id] = "".join(json.dumps(line) + "\n" for line in lines).encode()
+    return file_id
+
+
+async def _run_batch(batch: Dict[str, Any]) -> None:
+    """Answer every request of a batch, writing output and error files like the provider."""
+    outputs, errors = [], []
+    batch["status"] = "in_progress"
+    for line in files[batch["input_file_id"]].decode().splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        result = {"id": _new_id("batch_req"), "custom_id": request["custom_id"], "error": None}
+        try:
+            completion = await backend.acreate(request["body"])
+        except openai.APIStatusError as e:
+            result["response"] = {
+                "status_code": e.status_code,
+                "body": {"error": {"message": e.message, "type": "mock_error"}},
+            }
+            errors.append(result)
+        except openai.APITimeoutError:
+            result["response"] = {"status_code": 504, "body": {"error": {"message": "Mock timeout", "type": "mock_error"}}}
+            errors.append(result)
+        else:
+            result["response"] = {"status_code": 200, "body": completion.model_dump()}
+            outputs.append(result)
+        batch["request_counts"]["completed"] = len(outputs)
+        batch["request_counts"]["failed"] = len(errors)
+
+    batch["output_file_id"] = _store_file(outputs)
+    batch["error_file_id"] = _store_file(errors)
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    content = await file.read()
+    file_id = _new_id("file")
+    files[file_id] = content
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": file.filename,
+        "purpose": purpose,
+    }
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        return _not_found("file")
+    return Response(files[file_id], media_type="application/jsonl")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: dict = Body(...)):
+    input_file_id = request.get("input_file_id")
+    if input_file_id not in files:
+        return _not_found("file")
+    total = sum(1 for line in files[input_file_id].decode().splitlines() if line.strip())
+    batch = {
+        "id": _new_id("batch"),
+        "object": "batch",
+        "endpoint": request.get("endpoint"),
+        "input_file_id": input_file_id,
+        "completion_window": request.get("completion_window"),
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "errors": None,
+        "created_at": int(time.time()),
+        "completed_at": None,
+        "request_counts": {"total": total, "completed": 0, "failed": 0},
+        "metadata": request.get("metadata") or {},
+    }
+    batches[batch["id"]] = batch
+    task = asyncio.create_task(_run_batch(batch))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    return batch
+
+
+@app.get("/v1/batches")
+async def list_batches(limit: int = 20, after: Optional[str] = None):
+    # Newest first, like the provider
+    ordered = list(batches.values())[::-1]
+    start = 0
+    if after is not None:
+        ids = [batch["id"] for batch in ordered]
+        start = ids.index(after) + 1 if after in ids else len(ordered)
+    page = ordered[start:start + limit]
+    return {
+        "object": "list",
+        "data": page,
+        "first_id": page[0]["id"] if page else None,
+        "last_id": page[-1]["id"] if page else None,
+        "has_more": start + limit < len(ordered),
+    }
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    if batch_id not in batches:
+        return _not_found("batch")
+    return batches[batch_id]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -1,7 +1,11 @@
 # SQLAlchemy models
 from app.models.gmail_account import GmailAccount
 from app.models.email import Email
+from app.models.email_content import EmailContent
+from app.models.parse_cache import ParseCacheEntry
+from app.models.parsing_schema import ParsingSchema
+from app.models.backfill_run import BackfillRun
+from app.models.email_counter import EmailCounter
+from app.models.email_changes import EmailChanges
 
-__all__ = ["GmailAccount", "Email"]
-
-
+__all__ = ["GmailAccount", "Email", "EmailContent", "ParseCacheEntry", "ParsingSchema", "BackfillRun", "EmailCounter", "EmailChanges"]
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, JSON
+from datetime import datetime
+import enum
+
+from app.core.database import Base
+
+
+class BackfillStatus(enum.Enum):
+    """Backfill run stage; each one is a checkpoint the run resumes from."""
+    PREPARED = "prepared"    # Batch input file written, emails marked PARSING
+    UPLOADED = "uploaded"    # Input file uploaded to the provider
+    SUBMITTED = "submitted"  # Batch created, waiting for the provider
+    APPLYING = "applying"    # Batch finished, results being written back
+    APPLIED = "applied"      # All results written back
+    FAILED = "failed"
+
+
+class BackfillRun(Base):
+    """One provider batch of offline parses."""
+
+    __tablename__ = "backfill_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(Enum(BackfillStatus), default=BackfillStatus.PREPARED, nullable=False, index=True)
+    error_message = Column(Text, nullable=True)
+
+    # What was parsed and how
+    email_ids = Column(JSON, nullable=False)
+    schema_version = Column(Integer, nullable=True)
+    parsing_model = Column(String(50), nullable=True)
+    input_path = Column(String(500), nullable=True)  # Local JSONL batch file
+
+    # Provider identifiers
+    input_file_id = Column(String(100), nullable=True)
+    batch_id = Column(String(100), nullable=True)
+    output_file_id = Column(String(100), nullable=True)
+    error_file_id = Column(String(100), nullable=True)
+
+    # Progress; the offsets are result-file lines already applied
+    request_count = Column(Integer, default=0, nullable=False)
+    cached_count = Column(Integer, default=0, nullable=False)  # Resolved from the parse cache or pre-extractor
+    parsed_count = Column(Integer, default=0, nullable=False)
+    failed_count = Column(Integer, default=0, nullable=False)
+    output_offset = Column(Integer, default=0, nullable=False)
+    error_offset = Column(Integer, default=0, nullable=False)
+
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<BackfillRun {self.id}: {self.status.value}>"
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Enum, JSON, Index, UniqueConstraint, Computed, DDL, and_, cast, event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -15,10 +17,31 @@ class EmailStatus(enum.Enum):
     FAILED = "failed"
 
 
+# JSONB on PostgreSQL so offer fields can be indexed and filtered in SQL;
+# None is stored as SQL NULL rather than a JSON 'null'
+OfferData = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
+
+def _json_present(column):
+    return and_(column.isnot(None), cast(column, Text) != "null")
+
+
+def _simhash_band(band: int) -> Computed:
+    # Bits 16 * band to 16 * band + 15 of the signature (see services/near_duplicates.py)
+    return Computed(f"CAST((simhash >> {16 * band}) & 65535 AS INTEGER)", persisted=True)
+
+
 class Email(Base):
     """Model for stored emails."""
     
     __tablename__ = "emails"
+    __table_args__ = (
+        UniqueConstraint("gmail_account_id", "gmail_message_id", name="uq_emails_account_message"),
+        # Keyset pagination of the email list, unfiltered and per filter
+        Index("ix_emails_received_at_id", "received_at", "id"),
+        Index("ix_emails_status_received_at_id", "status", "received_at", "id"),
+        Index("ix_emails_account_received_at_id", "gmail_account_id", "received_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     
@@ -27,27 +50,38 @@ class Email(Base):
     gmail_message_id = Column(String(100), nullable=False, index=True)
     thread_id = Column(String(100), nullable=True)
     
-    # Email content
+    # Email metadata; bodies and headers live in email_contents (`content`)
     subject = Column(String(500), nullable=True)
     sender = Column(String(255), nullable=False)
     sender_name = Column(String(255), nullable=True)
-    body_text = Column(Text, nullable=False)
-    body_html = Column(Text, nullable=True)
-    headers = Column(JSON, nullable=True)
     received_at = Column(DateTime, nullable=False)
+    content_hash = Column(String(32), nullable=True)  # See email_content.content_hash()
+    
+    normalized_version = Column(Integer, nullable=True)  # NORMALIZER_VERSION of content.normalized_text
+    simhash = Column(BigInteger, nullable=True)  # Near-duplicate signature of the normalized body
+    # Its four 16-bit bands, derived by the database and indexed for near-duplicate lookups
+    simhash_band0 = Column(Integer, _simhash_band(0), index=True)
+    simhash_band1 = Column(Integer, _simhash_band(1), index=True)
+    simhash_band2 = Column(Integer, _simhash_band(2), index=True)
+    simhash_band3 = Column(Integer, _simhash_band(3), index=True)
     
     # Processing status
     status = Column(Enum(EmailStatus), default=EmailStatus.PENDING, index=True)
     error_message = Column(Text, nullable=True)
     
+    # Who is parsing a PARSING email, and until when (see services/email_leases.py)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)  # NULL: held until released
+    
     # Parsed data
-    parsed_data = Column(JSON, nullable=True)
+    parsed_data = Column(OfferData, nullable=True)
     parsing_model = Column(String(50), nullable=True)
+    schema_version = Column(Integer, nullable=True)  # ParsingSchema.version used
     confidence_score = Column(Integer, nullable=True)  # 0-100
     parsed_at = Column(DateTime, nullable=True)
     
     # Human corrections
-    corrected_data = Column(JSON, nullable=True)
+    corrected_data = Column(OfferData, nullable=True)
     correction_diff = Column(JSON, nullable=True)
     corrected_by = Column(String(255), nullable=True)
     corrected_at = Column(DateTime, nullable=True)
@@ -58,8 +92,46 @@ class Email(Base):
     
     # Relationships
     gmail_account = relationship("GmailAccount", back_populates="emails")
+    content = relationship(
+        "EmailContent", back_populates="email", uselist=False,
+        cascade="all, delete-orphan", passive_deletes=True,
+    )
+    
+    # Presence flags that list queries can select without loading the JSON.
+    # JSON 'null' values written before the columns were none_as_null count as empty.
+    @hybrid_property
+    def has_parsed_data(self):
+        return self.parsed_data is not None
+    
+    @has_parsed_data.expression
+    def has_parsed_data(cls):
+        return _json_present(cls.parsed_data)
+    
+    @hybrid_property
+    def has_corrections(self):
+        return self.corrected_data is not None
+    
+    @has_corrections.expression
+    def has_corrections(cls):
+        return _json_present(cls.corrected_data)
     
     def __repr__(self):
         return f"<Email {self.id}: {self.subject[:50] if self.subject else 'No Subject'}>"
 
 
+
+
+# Full-text search. PostgreSQL keeps it in the email_search table (see the
+# email_contents migration); SQLite databases created with `create_all`
+# (tests) get an FTS5 table instead. Both are written by
+# app.services.email_contents.store_contents(), since bodies are stored
+# compressed where the database can't read them.
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE emails_fts USING fts5(subject, sender, body, tokenize='porter unicode61')",
+    # Also drops the content: SQLite doesn't enforce the ON DELETE CASCADE unless asked to
+    "CREATE TRIGGER emails_delete AFTER DELETE ON emails BEGIN "
+    "DELETE FROM emails_fts WHERE rowid = old.id; DELETE FROM email_contents WHERE email_id = old.id; END",
+]
+for _statement in SQLITE_FTS_DDL:
+    event.listen(Email.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Email.__table__, "before_drop", DDL("DROP TABLE IF EXISTS emails_fts").execute_if(dialect="sqlite"))
@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, BigInteger, DDL, event
+
+from app.core.database import Base
+from app.models.email import Email
+
+
+class EmailChanges(Base):
+    """
+    Number of statements that changed `emails`; a single row.
+
+    Bumped by triggers on `emails` (see the email_changes migration) in
+    the writing transaction, so a new version becomes visible exactly
+    when the change commits, whatever the clocks of the hosts writing
+    say; never write to it from the application.
+    """
+
+    __tablename__ = "email_changes"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<EmailChanges {self.version}>"
+
+
+# SQLite databases created with `create_all` (tests) get row-level
+# triggers; PostgreSQL's are installed by the migration
+SQLITE_DDL = [
+    f"CREATE TRIGGER email_changes_{op.lower()} AFTER {op} ON emails BEGIN "
+    "UPDATE email_changes SET version = version + 1; END"
+    for op in ("INSERT", "UPDATE", "DELETE")
+]
+event.listen(
+    EmailChanges.__table__, "after_create",
+    DDL("INSERT INTO email_changes (id, version) VALUES (1, 0)").execute_if(dialect="sqlite"),
+)
+for _statement in SQLITE_DDL:
+    event.listen(Email.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
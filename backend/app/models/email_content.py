@@ -0,0 +1,77 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+import zstandard
+from sqlalchemy import Column, Integer, ForeignKey, LargeBinary
+from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+
+from app.core.config import settings
+from app.core.database import Base
+
+
+class ZstdText(TypeDecorator):
+    """Text stored zstd-compressed; reads and writes plain strings."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return zstandard.compress(self.serialize(value).encode("utf-8"), settings.CONTENT_COMPRESSION_LEVEL)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.deserialize(zstandard.decompress(value).decode("utf-8"))
+
+    def serialize(self, value: Any) -> str:
+        return value
+
+    def deserialize(self, value: str) -> Any:
+        return value
+
+
+class ZstdJSON(ZstdText):
+    """JSON stored zstd-compressed."""
+
+    cache_ok = True
+
+    def serialize(self, value: Any) -> str:
+        return json.dumps(value)
+
+    def deserialize(self, value: str) -> Any:
+        return json.loads(value)
+
+
+def content_hash(body_text: str, body_html: Optional[str], headers: Optional[Dict[str, Any]]) -> str:
+    """Fingerprint of an email's content, kept on the email row to spot changes without loading it."""
+    canonical = json.dumps([body_text, body_html, headers], sort_keys=True)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmailContent(Base):
+    """
+    Bodies and headers of an email, compressed.
+
+    Kept out of `emails` so status scans and updates there touch narrow
+    rows; loaded only when an email is shown or parsed (`Email.content`).
+    """
+
+    __tablename__ = "email_contents"
+
+    email_id = Column(Integer, ForeignKey("emails.id", ondelete="CASCADE"), primary_key=True)
+
+    body_text = Column(ZstdText, nullable=False)
+    body_html = Column(ZstdText, nullable=True)
+    headers = Column(ZstdJSON, nullable=True)
+
+    # Body as sent to the parser (quotes, footers and HTML noise removed)
+    normalized_text = Column(ZstdText, nullable=True)
+
+    email = relationship("Email", back_populates="content")
+
+    def __repr__(self):
+        return f"<EmailContent {self.email_id}>"
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey, Enum
+
+from app.core.database import Base
+from app.models.email import EmailStatus
+
+
+class EmailCounter(Base):
+    """
+    Number of emails per account and status.
+
+    Maintained by triggers on `emails` (see the email_counters migration)
+    in the same transaction as the change, so it never drifts from the
+    table; never write to it from the application.
+    """
+
+    __tablename__ = "email_counters"
+
+    gmail_account_id = Column(
+        Integer, ForeignKey("gmail_accounts.id", ondelete="CASCADE"), primary_key=True
+    )
+    status = Column(Enum(EmailStatus), primary_key=True)
+    count = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<EmailCounter {self.gmail_account_id}/{self.status.value}: {self.count}>"
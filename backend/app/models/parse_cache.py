@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class ParseCacheEntry(Base):
+    """Persisted parse result, keyed by a hash of the parser inputs."""
+
+    __tablename__ = "parse_cache_entries"
+
+    key = Column(String(64), primary_key=True)  # sha256 hex digest
+
+    data = Column(JSON, nullable=False)
+    parsing_model = Column(String(50), nullable=True)
+
+    hit_count = Column(Integer, default=0, nullable=False)
+    last_hit_at = Column(DateTime, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ParseCacheEntry {self.key[:12]}>"
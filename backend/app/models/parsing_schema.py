@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, Index, text
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class ParsingSchema(Base):
+    """A published version of the JSON schema used for parsing."""
+
+    __tablename__ = "parsing_schemas"
+    __table_args__ = (
+        # At most one active version, whatever concurrent publishes and activations do
+        Index(
+            "uq_parsing_schemas_active", "is_active", unique=True,
+            postgresql_where=text("is_active"), sqlite_where=text("is_active"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, unique=True, nullable=False, index=True)
+
+    schema = Column(JSON, nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the canonical schema JSON
+
+    # Exactly one version is active at a time
+    is_active = Column(Boolean, default=False, nullable=False, index=True)
+
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ParsingSchema v{self.version}{' (active)' if self.is_active else ''}>"
@@ -0,0 +1,469 @@
+"""Offline bulk parsing of pending emails through the provider Batch API."""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from openai.types.chat import ChatCompletion
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.backfill_run import BackfillRun, BackfillStatus
+from app.models.email import Email, EmailStatus
+from app.services.batch_client import BatchClient, TERMINAL_STATES
+from app.services.openai_parser import email_parser
+from app.services.parse_cache import parse_cache, make_cache_key
+from app.services.parsing_engine import prompt_inputs, apply_parse_result
+from app.services.response_cache import response_cache
+from app.services.pre_extractor import pre_extract, merge_known_fields
+from app.services.schema_registry import schema_registry
+
+logger = logging.getLogger(__name__)
+
+# The provider rejects batch input files over 200 MB
+MAX_BATCH_FILE_BYTES = 190 * 1024 * 1024
+
+ACTIVE_STATUSES = [
+    BackfillStatus.PREPARED,
+    BackfillStatus.UPLOADED,
+    BackfillStatus.SUBMITTED,
+    BackfillStatus.APPLYING,
+]
+
+
+def _custom_id(email_id: int) -> str:
+    return f"email-{email_id}"
+
+
+def _email_id(custom_id: str) -> int:
+    return int(custom_id.removeprefix("email-"))
+
+
+def _lease_owner(run_id: int) -> str:
+    return f"backfill:{run_id}"
+
+
+class Backfill:
+    """
+    Parses large numbers of pending emails with the provider's Batch API.
+
+    Batch requests are billed at a discount and don't count against the
+    real-time rate limit, at the cost of results taking up to 24 hours.
+    Each run moves through the BackfillStatus stages and commits its
+    progress at every step, including every chunk of results written
+    back, so an interrupted backfill picks up where it stopped.
+
+    Emails in a run are marked PARSING, leased to the run with no expiry,
+    until their result is applied; any that get no result are put back
+    to PENDING.
+    """
+
+    def __init__(
+        self,
+        client: Optional[BatchClient] = None,
+        max_requests: Optional[int] = None,
+        apply_chunk_size: Optional[int] = None,
+    ):
+        self.client = client or BatchClient()
+        self.max_requests = max_requests or settings.BACKFILL_MAX_REQUESTS
+        self.apply_chunk_size = apply_chunk_size or settings.BACKFILL_APPLY_CHUNK_SIZE
+
+    def prepare(self, max_emails: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """
+        Write the batch input file for the next pending emails.
+
+        Emails with a cached parse or that the pre-extractor fully covers
+        are resolved straight away and emails with no content are marked
+        FAILED; the rest become batch requests.
+
+        Returns:
+            (run ID, number of emails taken), or None if nothing is pending.
+        """
+        limit = min(max_emails or self.max_requests, self.max_requests)
+        schema = schema_registry.get_active()
+
+        db = SessionLocal()
+        try:
+            emails = (
+                db.query(Email)
+                .options(selectinload(Email.content))
+                .filter(Email.status == EmailStatus.PENDING)
+                .order_by(Email.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)  # Held until the commit; claimants skip them
+                .all()
+            )
+            if not emails:
+                return None
+
+            run = BackfillRun(
+                status=BackfillStatus.PREPARED,
+                email_ids=[],
+                schema_version=schema.version,
+                parsing_model=email_parser.model,
+            )
+            db.add(run)
+            db.flush()
+
+            os.makedirs(settings.BACKFILL_DIR, exist_ok=True)
+            run.input_path = os.path.join(settings.BACKFILL_DIR, f"backfill-{run.id}.jsonl")
+
+            email_ids = []
+            taken = 0
+            with open(run.input_path, "w") as f:
+                for email in emails:
+                    content = email.content
+                    if content is None or (not content.body_text and not content.body_html):
+                        apply_parse_result(email, {"success": False, "error": "Email has no content to parse"})
+                        run.failed_count += 1
+                        taken += 1
+                        continue
+
+                    inputs = prompt_inputs(email)
+                    cached = self._cache_get(inputs, schema.fingerprint)
+                    if cached:
+                        apply_parse_result(email, cached, schema.version, model=email_parser.model)
+                        run.cached_count += 1
+                        taken += 1
+                        continue
+
+                    inputs, pre_extracted = pre_extract(inputs, schema)
+                    if pre_extracted:
+                        apply_parse_result(email, pre_extracted, schema.version, model=email_parser.model)
+                        run.cached_count += 1
+                        taken += 1
+                        continue
+
+                    request, _ = email_parser._build_request(
+                        schema=schema.schema,
+                        system_prompt=schema.system_prompt,
+                        **inputs,
+                    )
+                    line = json.dumps({
+                        "custom_id": _custom_id(email.id),
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": request,
+                    }) + "\n"
+                    if email_ids and f.tell() + len(line.encode()) > MAX_BATCH_FILE_BYTES:
+                        break  # Left for the next run
+
+                    f.write(line)
+                    email.status = EmailStatus.PARSING
+                    email.lease_owner = _lease_owner(run.id)
+                    email.lease_expires_at = None
+                    email_ids.append(email.id)
+                    taken += 1
+
+            run.email_ids = email_ids
+            run.request_count = len(email_ids)
+            if not email_ids:
+                # Everything was resolved without the provider
+                self._finish_run(run, BackfillStatus.APPLIED)
+
+            db.commit()
+            logger.info(
+                f"Backfill run {run.id} prepared: {run.request_count} requests, "
+                f"{run.cached_count} cached, {run.failed_count} without content"
+            )
+            return run.id, taken
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def advance(self, run_id: int) -> BackfillStatus:
+        """Move a run through as many stages as it can without waiting on the provider."""
+        db = SessionLocal()
+        try:
+            run = db.get(BackfillRun, run_id)
+            if run.status == BackfillStatus.PREPARED:
+                self._upload(db, run)
+            if run.status == BackfillStatus.UPLOADED:
+                self._submit(db, run)
+            if run.status == BackfillStatus.SUBMITTED:
+                self._poll(db, run)
+            if run.status == BackfillStatus.APPLYING:
+                self._apply(db, run)
+            return run.status
+        finally:
+            db.close()
+
+    def active_runs(self) -> List[int]:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(BackfillRun.id)
+                .filter(BackfillRun.status.in_(ACTIVE_STATUSES))
+                .order_by(BackfillRun.id)
+                .all()
+            )
+            return [row.id for row in rows]
+        finally:
+            db.close()
+
+    def get_summary(self, run_id: int) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            run = db.get(BackfillRun, run_id)
+            return {
+                "run_id": run.id,
+                "status": run.status.value,
+                "batch_id": run.batch_id,
+                "requests": run.request_count,
+                "cached": run.cached_count,
+                "parsed": run.parsed_count,
+                "failed": run.failed_count,
+                "error": run.error_message,
+            }
+        finally:
+            db.close()
+
+    def run(
+        self,
+        limit: Optional[int] = None,
+        wait: bool = True,
+        resume_only: bool = False,
+        poll_seconds: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Resume unfinished runs, start new ones for up to `limit` pending
+        emails, and (with `wait`) poll until all of them are applied.
+
+        Without `wait` every run is advanced once; call again later to
+        pick up finished batches.
+
+        Returns a summary of every run touched.
+        """
+        poll_seconds = settings.BACKFILL_POLL_SECONDS if poll_seconds is None else poll_seconds
+        touched = self.active_runs()
+
+        if not resume_only:
+            remaining = limit
+            while remaining is None or remaining > 0:
+                prepared = self.prepare(remaining)
+                if prepared is None:
+                    break
+                run_id, taken = prepared
+                touched.append(run_id)
+                if remaining is not None:
+                    remaining -= taken
+
+        while True:
+            for run_id in self.active_runs():
+                try:
+                    self.advance(run_id)
+                except Exception as e:
+                    # Progress is checkpointed; the next pass retries this stage
+                    logger.error(f"Backfill run {run_id} error: {e}")
+
+            if not wait or not self.active_runs():
+                break
+            time.sleep(poll_seconds)
+
+        return [self.get_summary(run_id) for run_id in touched]
+
+    def _upload(self, db, run: BackfillRun) -> None:
+        if not run.input_path or not os.path.exists(run.input_path):
+            self._fail_run(db, run, "Batch input file is missing")
+            return
+
+        run.input_file_id = self.client.upload_file(run.input_path)
+        run.status = BackfillStatus.UPLOADED
+        db.commit()
+        logger.info(f"Backfill run {run.id} uploaded as {run.input_file_id}")
+
+    def _submit(self, db, run: BackfillRun) -> None:
+        batch = None
+        if run.submitted_at is not None:
+            # An earlier attempt may have created the batch before it could
+            # record the ID; adopt that one rather than paying for another
+            batch = self.client.find_batch(run.input_file_id)
+            if batch is not None:
+                logger.warning(f"Backfill run {run.id} adopting batch {batch['id']} from an interrupted submit")
+        else:
+            # Checkpoint the attempt before creating, so a resume knows to look
+            run.submitted_at = datetime.utcnow()
+            db.commit()
+        if batch is None:
+            batch = self.client.create_batch(run.input_file_id, metadata={"backfill_run_id": str(run.id)})
+        run.batch_id = batch["id"]
+        run.status = BackfillStatus.SUBMITTED
+        db.commit()
+        logger.info(f"Backfill run {run.id} submitted as batch {run.batch_id}")
+
+    def _poll(self, db, run: BackfillRun) -> None:
+        batch = self.client.get_batch(run.batch_id)
+        if batch["status"] not in TERMINAL_STATES:
+            counts = batch.get("request_counts") or {}
+            logger.info(
+                f"Backfill run {run.id} batch {batch['status']}: "
+                f"{counts.get('completed', 0)}/{counts.get('total', run.request_count)} done"
+            )
+            return
+
+        # Expired and cancelled batches can still have partial results
+        run.output_file_id = batch.get("output_file_id")
+        run.error_file_id = batch.get("error_file_id")
+        if batch["status"] != "completed":
+            errors = (batch.get("errors") or {}).get("data") or []
+            details = "; ".join(e.get("message", "") for e in errors if isinstance(e, dict))
+            run.error_message = f"Batch {batch['status']}" + (f": {details}" if details else "")
+        run.status = BackfillStatus.APPLYING
+        db.commit()
+
+    def _apply(self, db, run: BackfillRun) -> None:
+        """Write back results, then release emails that got none."""
+        if run.output_file_id:
+            self._apply_file(db, run, run.output_file_id, "output_offset")
+        if run.error_file_id:
+            self._apply_file(db, run, run.error_file_id, "error_offset")
+
+        released = self._release_emails(db, run)
+        if released:
+            logger.warning(f"Backfill run {run.id}: {released} emails got no result and are pending again")
+
+        self._finish_run(run, BackfillStatus.FAILED if run.error_message else BackfillStatus.APPLIED)
+        db.commit()
+        logger.info(
+            f"Backfill run {run.id} {run.status.value}: "
+            f"{run.parsed_count} parsed, {run.failed_count} failed"
+        )
+
+    def _apply_file(self, db, run: BackfillRun, file_id: str, offset_field: str) -> None:
+        """Apply a result file in chunks, checkpointing the line offset after each."""
+        offset = getattr(run, offset_field)
+        chunk = []
+        for index, record in enumerate(self.client.iter_file_lines(file_id)):
+            if index < offset:
+                continue  # Applied before an interruption
+            chunk.append(record)
+            if len(chunk) >= self.apply_chunk_size:
+                self._apply_chunk(db, run, chunk, offset_field)
+                chunk = []
+        if chunk:
+            self._apply_chunk(db, run, chunk, offset_field)
+
+    def _apply_chunk(self, db, run: BackfillRun, records: List[Dict[str, Any]], offset_field: str) -> None:
+        results = {}
+        for record in records:
+            try:
+                email_id = _email_id(record["custom_id"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Backfill run {run.id}: skipping result line without an email ID")
+                continue
+            try:
+                results[email_id] = self._record_result(record, run.parsing_model)
+            except Exception as e:
+                # One malformed line fails its email, not the whole run
+                results[email_id] = {"success": False, "error": f"Unreadable batch result: {e}", "model": run.parsing_model}
+
+        # Emails corrected, re-parsed or taken over since the run started are left alone
+        emails = (
+            db.query(Email)
+            .options(selectinload(Email.content))
+            .filter(
+                Email.id.in_(list(results)),
+                Email.status == EmailStatus.PARSING,
+                Email.lease_owner == _lease_owner(run.id),
+            )
+            .all()
+        )
+        schema = schema_registry.get_version(run.schema_version) if run.schema_version else None
+        for email in emails:
+            result = results[email.id]
+            if result["success"] and schema:
+                # Rebuild the inputs the request was made from to merge pre-extracted values
+                inputs, _ = pre_extract(prompt_inputs(email), schema)
+                merge_known_fields(result["data"], inputs.get("known_fields"))
+                self._cache_put(inputs, schema.fingerprint, run.parsing_model, result)
+
+            apply_parse_result(email, result, run.schema_version, model=run.parsing_model)
+            if result["success"]:
+                run.parsed_count += 1
+            else:
+                run.failed_count += 1
+
+        setattr(run, offset_field, getattr(run, offset_field) + len(records))
+        db.commit()
+        for email in emails:
+            response_cache.invalidate(email.id)
+
+    def _record_result(self, record: Dict[str, Any], model: str) -> Dict[str, Any]:
+        """Convert one line of a batch output or error file into a parse result."""
+        response = record.get("response") or {}
+
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or (response.get("body") or {}).get("error") or {}
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            return {
+                "success": False,
+                "error": f"Batch request failed: {message or response.get('status_code')}",
+                "model": model,
+            }
+
+        completion = ChatCompletion.model_validate(response["body"])
+        return email_parser._handle_response(completion, {"tokens_saved": 0})
+
+    def _release_emails(self, db, run: BackfillRun) -> int:
+        """Put emails still waiting on this run back to PENDING."""
+        if not run.email_ids:
+            return 0
+        released = (
+            db.query(Email)
+            .filter(
+                Email.id.in_(run.email_ids),
+                Email.status == EmailStatus.PARSING,
+                Email.lease_owner == _lease_owner(run.id),
+            )
+            .update(
+                {Email.status: EmailStatus.PENDING, Email.lease_owner: None, Email.lease_expires_at: None},
+                synchronize_session=False,
+            )
+        )
+        return released
+
+    def _fail_run(self, db, run: BackfillRun, message: str) -> None:
+        logger.error(f"Backfill run {run.id} failed: {message}")
+        run.error_message = message
+        self._release_emails(db, run)
+        self._finish_run(run, BackfillStatus.FAILED)
+        db.commit()
+
+    def _finish_run(self, run: BackfillRun, status: BackfillStatus) -> None:
+        run.status = status
+        run.completed_at = datetime.utcnow()
+        if run.input_path and os.path.exists(run.input_path):
+            os.remove(run.input_path)
+
+    def _cache_get(self, inputs: Dict[str, Any], schema_fingerprint: str) -> Optional[Dict[str, Any]]:
+        if not settings.PARSE_CACHE_ENABLED:
+            return None
+        cached = parse_cache.get(self._cache_key(inputs, schema_fingerprint, email_parser.model))
+        if not cached:
+            return None
+        return {"success": True, "data": cached["data"], "model": cached["model"]}
+
+    def _cache_put(self, inputs: Dict[str, Any], schema_fingerprint: str, model: str, result: Dict[str, Any]) -> None:
+        # Best effort: a failed cache write must not lose the result
+        if settings.PARSE_CACHE_ENABLED:
+            try:
+                key = self._cache_key(inputs, schema_fingerprint, model)
+                parse_cache.put(key, result["data"], result.get("model"))
+            except Exception as e:
+                logger.warning(f"Could not cache backfill result: {e}")
+
+    def _cache_key(self, inputs: Dict[str, Any], schema_fingerprint: str, model: str) -> str:
+        return make_cache_key(
+            email_body=inputs["email_body"],
+            subject=inputs["subject"],
+            sender_email=inputs["sender_email"],
+            sender_name=inputs["sender_name"],
+            headers=inputs["headers"],
+            schema_fingerprint=schema_fingerprint,
+            model=model,
+        )
@@ -0,0 +1,96 @@
+"""Client for the OpenAI Batch API (file upload, batch create/poll, results)."""
+import json
+import logging
+from typing import Dict, Any, Iterator, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Batch states after which the provider does no more work
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchClient:
+    """
+    Thin synchronous wrapper over the `/files` and `/batches` endpoints.
+
+    The pinned openai SDK predates the Batch API, so this talks to it over
+    httpx directly. Point OPENAI_BASE_URL at a stand-in server to run
+    backfills without the real provider.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, timeout: float = 60.0):
+        self.base_url = (base_url or settings.OPENAI_BASE_URL).rstrip("/")
+        self.api_key = api_key or settings.OPENAI_API_KEY
+        self.timeout = timeout
+        self._client: Optional[httpx.Client] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """Lazy initialization of the HTTP client."""
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("OPENAI_API_KEY is not configured")
+            self._client = httpx.Client(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+            )
+        return self._client
+
+    def upload_file(self, path: str) -> str:
+        """Upload a JSONL batch input file and return its file ID."""
+        with open(path, "rb") as f:
+            response = self.client.post(
+                "/files",
+                data={"purpose": "batch"},
+                files={"file": (path.rsplit("/", 1)[-1], f, "application/jsonl")},
+            )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def create_batch(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Start a batch of chat completions over an uploaded input file."""
+        response = self.client.post("/batches", json={
+            "input_file_id": input_file_id,
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+            "metadata": metadata or {},
+        })
+        response.raise_for_status()
+        return response.json()
+
+    def find_batch(self, input_file_id: str) -> Optional[Dict[str, Any]]:
+        """The batch created over an input file, if there is one."""
+        params: Dict[str, Any] = {"limit": 100}
+        while True:
+            response = self.client.get("/batches", params=params)
+            response.raise_for_status()
+            page = response.json()
+            for batch in page["data"]:
+                if batch.get("input_file_id") == input_file_id:
+                    return batch
+            if not page.get("has_more") or not page["data"]:
+                return None
+            params["after"] = page["data"][-1]["id"]
+
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        response = self.client.get(f"/batches/{batch_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def iter_file_lines(self, file_id: str) -> Iterator[Dict[str, Any]]:
+        """Stream a result file, yielding one decoded JSONL record per line."""
+        with self.client.stream("GET", f"/files/{file_id}/content") as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
@@ -0,0 +1,45 @@
+"""Writing email bodies and headers, and keeping the search index in step."""
+from typing import Any, Dict, List
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.email_content import EmailContent
+from app.services.email_search import index_statements
+
+# Columns replaced when an email's content is written again
+CONTENT_FIELDS = ["body_text", "body_html", "headers"]
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def store_contents(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """
+    Insert or replace the content of emails, and index them for search.
+
+    Bodies are compressed on the way in, so the database can't index them
+    by itself; the search index is written from the same rows. Normalized
+    text is cleared, to be recomputed on the next parse. Doesn't commit.
+
+    Args:
+        db: Database session
+        rows: email_id, body_text, body_html and headers of each email, plus
+            the subject, sender and sender_name to index
+    """
+    if not rows:
+        return
+    dialect = db.bind.dialect.name
+    statement = _INSERTS[dialect](EmailContent)
+    statement = statement.on_conflict_do_update(
+        index_elements=[EmailContent.email_id],
+        set_={
+            **{field: statement.excluded[field] for field in CONTENT_FIELDS},
+            "normalized_text": None,
+        },
+    )
+    await db.execute(statement, [
+        {"email_id": row["email_id"], **{field: row[field] for field in CONTENT_FIELDS}}
+        for row in rows
+    ])
+    for index_statement, params in index_statements(dialect, rows):
+        await db.execute(index_statement, params)
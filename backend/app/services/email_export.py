@@ -0,0 +1,199 @@
+"""Streaming export of extracted offers as NDJSON, CSV or Parquet."""
+import csv
+import io
+import json
+import logging
+from typing import Dict, Any, AsyncIterator, List, Tuple
+
+from sqlalchemy import Select, or_, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.email import Email
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Email metadata leading every record; the extracted fields follow
+METADATA_COLUMNS = [
+    "id", "gmail_account_id", "gmail_message_id", "thread_id", "subject",
+    "sender", "sender_name", "received_at", "status", "source",
+]
+
+
+def export_query() -> Select:
+    """Emails with something to export, oldest ID first."""
+    return (
+        select(
+            Email.id, Email.gmail_account_id, Email.gmail_message_id, Email.thread_id,
+            Email.subject, Email.sender, Email.sender_name, Email.received_at, Email.status,
+            Email.parsed_data, Email.corrected_data,
+        )
+        .where(or_(Email.has_parsed_data, Email.has_corrections))
+        .order_by(Email.id)
+    )
+
+
+def schema_fields(schema: Dict[str, Any], prefix: str = "") -> List[Tuple[str, str]]:
+    """
+    Flatten a parsing schema into (column, JSON type) pairs.
+
+    Nested objects become dotted columns (`price.amount`); arrays and
+    untyped fields are exported as JSON text.
+    """
+    fields = []
+    for name, spec in (schema.get("properties") or {}).items():
+        column = f"{prefix}{name}"
+        if spec.get("type") == "object" and spec.get("properties"):
+            fields.extend(schema_fields(spec, prefix=f"{column}."))
+        else:
+            json_type = spec.get("type")
+            fields.append((column, json_type if json_type in ("string", "number", "integer", "boolean") else "json"))
+    return fields
+
+
+def _lookup(data: Dict[str, Any], column: str) -> Any:
+    for key in column.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _coerce(value: Any, json_type: str) -> Any:
+    """Fit an extracted value to its column type; values that don't fit are dropped."""
+    if value is None:
+        return None
+    if json_type == "json":
+        return json.dumps(value)
+    if json_type == "boolean":
+        return value if isinstance(value, bool) else None
+    if json_type in ("number", "integer"):
+        if isinstance(value, bool):
+            return None
+        try:
+            return int(value) if json_type == "integer" else float(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+async def export_records(query: Select) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield export records in chunks of EXPORT_BATCH_SIZE.
+
+    Rows are read through a server-side cursor (`yield_per`), so memory
+    stays flat however many emails match. The session is opened here
+    rather than taken from the request, since the response body is
+    streamed after the request's dependencies have been closed.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield [
+                {
+                    "id": row.id,
+                    "gmail_account_id": row.gmail_account_id,
+                    "gmail_message_id": row.gmail_message_id,
+                    "thread_id": row.thread_id,
+                    "subject": row.subject,
+                    "sender": row.sender,
+                    "sender_name": row.sender_name,
+                    "received_at": row.received_at,
+                    "status": row.status.value if row.status else None,
+                    # Human corrections take precedence over the model's output
+                    "source": "corrected" if row.corrected_data is not None else "parsed",
+                    "data": row.corrected_data if row.corrected_data is not None else row.parsed_data,
+                }
+                for row in rows
+            ]
+
+
+def _with_iso_dates(record: Dict[str, Any]) -> Dict[str, Any]:
+    received_at = record["received_at"]
+    return {**record, "received_at": received_at.isoformat() if received_at else None}
+
+
+async def ndjson_chunks(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """One JSON object per line, with the extracted data nested under `data`."""
+    async for records in chunks:
+        yield "".join(json.dumps(_with_iso_dates(record)) + "\n" for record in records).encode()
+
+
+async def csv_chunks(chunks: AsyncIterator[List[Dict[str, Any]]], fields: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    """A header row, then one row per email with the schema's fields flattened into columns."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(METADATA_COLUMNS + [column for column, _ in fields])
+    async for records in chunks:
+        for record in records:
+            record = _with_iso_dates(record)
+            writer.writerow(
+                [record[column] for column in METADATA_COLUMNS]
+                + [_coerce(_lookup(record["data"], column), json_type) for column, json_type in fields]
+            )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands written bytes to the caller instead of keeping them."""
+
+    def __init__(self):
+        self.pending: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position  # Parquet records absolute offsets in its footer
+
+    def drain(self) -> bytes:
+        data, self.pending = b"".join(self.pending), []
+        return data
+
+
+async def parquet_chunks(chunks: AsyncIterator[List[Dict[str, Any]]], fields: List[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    """One Parquet row group per chunk, streamed as it is written; the footer comes last."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"string": pa.string(), "number": pa.float64(), "integer": pa.int64(), "boolean": pa.bool_(), "json": pa.string()}
+    arrow_schema = pa.schema(
+        [
+            ("id", pa.int64()), ("gmail_account_id", pa.int64()), ("gmail_message_id", pa.string()),
+            ("thread_id", pa.string()), ("subject", pa.string()), ("sender", pa.string()),
+            ("sender_name", pa.string()), ("received_at", pa.timestamp("us")), ("status", pa.string()),
+            ("source", pa.string()),
+        ]
+        + [(column, arrow_types[json_type]) for column, json_type in fields]
+    )
+
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, arrow_schema, compression="zstd")
+    async for records in chunks:
+        rows = [
+            {
+                **{column: record[column] for column in METADATA_COLUMNS},
+                **{column: _coerce(_lookup(record["data"], column), json_type) for column, json_type in fields},
+            }
+            for record in records
+        ]
+        writer.write_table(pa.Table.from_pylist(rows, schema=arrow_schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
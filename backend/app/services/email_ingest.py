@@ -0,0 +1,210 @@
+"""Bulk email ingest from NDJSON streams."""
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.email import Email
+from app.models.email_content import content_hash
+from app.models.gmail_account import GmailAccount
+from app.schemas.email import EmailCreate
+from app.services.email_contents import CONTENT_FIELDS, store_contents
+from app.services.near_duplicates import email_simhash
+
+logger = logging.getLogger(__name__)
+
+# Invalid lines reported back in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Columns of `emails` an upsert overwrites; bodies and headers go to email_contents,
+# and content_hash tells whether they changed
+CONTENT_COLUMNS = ["thread_id", "subject", "sender", "sender_name", "received_at", "content_hash"]
+# Derived from the content, so cleared when it changes and recomputed on the next parse
+DERIVED_COLUMNS = ["normalized_version"]
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without holding more than one line in memory."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def _truncate(value: Optional[str], length: int) -> Optional[str]:
+    return value[:length] if value else value
+
+
+class EmailIngest:
+    """
+    Inserts emails in batches of INGEST_BATCH_SIZE.
+
+    Emails come from an NDJSON stream (`run`), each line validated with
+    `EmailCreate`, or one at a time from code (`add`, then `finish`). Rows go in with one
+    multi-row `INSERT ... ON CONFLICT (gmail_account_id, gmail_message_id)`
+    per batch, so re-sending an export is idempotent: existing emails are
+    skipped, or with `update=True` have their content replaced (parse
+    results are kept; derived text is cleared for the next parse). Bodies
+    and headers of the emails written go to email_contents in the same
+    transaction.
+    """
+
+    def __init__(self, db: AsyncSession, update: bool = False, batch_size: Optional[int] = None):
+        self.db = db
+        self.update = update
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.insert = _INSERTS.get(db.bind.dialect.name)
+        if self.insert is None:
+            raise ValueError(f"Bulk ingest needs ON CONFLICT support, not available on {db.bind.dialect.name}")
+
+        self.account_ids: Optional[set] = None  # Loaded with the first email
+        self._batch: Dict[tuple, Dict[str, Any]] = {}
+        self.stats = {"received": 0, "inserted": 0, "updated": 0, "duplicates": 0, "invalid": 0}
+        self.errors: List[Dict[str, Any]] = []
+
+    async def run(self, lines: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Ingest an NDJSON stream of `EmailCreate` objects."""
+        line_number = 0
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            self.stats["received"] += 1
+            email = self._parse_line(line_number, line)
+            if email is not None:
+                await self._add(line_number, email)
+        return await self.finish()
+
+    async def add(self, email: EmailCreate) -> None:
+        """Queue an already validated email; written once a batch fills up."""
+        self.stats["received"] += 1
+        await self._add(self.stats["received"], email)
+
+    async def finish(self) -> Dict[str, Any]:
+        """Write what is left of the last batch and return the counts."""
+        if self._batch:
+            await self._flush(list(self._batch.values()))
+            self._batch = {}
+        logger.info(f"Bulk ingest finished: {self.stats}")
+        return {**self.stats, "errors": self.errors}
+
+    async def _add(self, line_number: int, email: EmailCreate) -> None:
+        if self.account_ids is None:
+            self.account_ids = set((await self.db.scalars(select(GmailAccount.id))).all())
+        row = self._to_row(line_number, email)
+        if row is None:
+            return
+        key = (row["gmail_account_id"], row["gmail_message_id"])
+        if key in self._batch:
+            self.stats["duplicates"] += 1  # Repeated within the batch; the last one wins
+        self._batch[key] = row
+        if len(self._batch) >= self.batch_size:
+            await self._flush(list(self._batch.values()))
+            self._batch = {}
+
+    def _invalid(self, line_number: int, error: str) -> None:
+        self.stats["invalid"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": error})
+
+    def _parse_line(self, line_number: int, line: bytes) -> Optional[EmailCreate]:
+        try:
+            return EmailCreate.model_validate(json.loads(line))
+        except json.JSONDecodeError as e:
+            self._invalid(line_number, f"Invalid JSON: {e}")
+        except ValidationError as e:
+            self._invalid(line_number, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+        return None
+
+    def _to_row(self, line_number: int, email: EmailCreate) -> Optional[Dict[str, Any]]:
+        if email.gmail_account_id not in self.account_ids:
+            self._invalid(line_number, f"Unknown gmail_account_id {email.gmail_account_id}")
+            return None
+        if len(email.gmail_message_id) > 100 or (email.thread_id and len(email.thread_id) > 100):
+            self._invalid(line_number, "gmail_message_id and thread_id are limited to 100 characters")
+            return None
+
+        received_at = email.received_at
+        if received_at.tzinfo is not None:
+            received_at = received_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return {
+            "gmail_account_id": email.gmail_account_id,
+            "gmail_message_id": email.gmail_message_id,
+            "thread_id": email.thread_id,
+            "subject": _truncate(email.subject, 500),
+            "sender": _truncate(email.sender, 255),
+            "sender_name": _truncate(email.sender_name, 255),
+            "received_at": received_at,
+            "content_hash": content_hash(email.body_text, email.body_html, email.headers),
+            "body_text": email.body_text,
+            "body_html": email.body_html,
+            "headers": email.headers,
+        }
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        # Near-duplicate signatures are computed on write so lookups find new
+        # emails straight away; CPU-bound, so off the event loop
+        signatures = await asyncio.to_thread(
+            lambda: [email_simhash(row["body_text"], row["body_html"]) for row in rows]
+        )
+        # Rows inserted now carry this exact created_at; updated rows keep their original one
+        now = datetime.utcnow()
+        email_rows = []
+        for row, signature in zip(rows, signatures):
+            row["simhash"] = signature
+            row["created_at"] = now
+            row["updated_at"] = now
+            email_rows.append({column: value for column, value in row.items() if column not in CONTENT_FIELDS})
+
+        statement = self.insert(Email)
+        if self.update:
+            excluded = statement.excluded
+            statement = statement.on_conflict_do_update(
+                index_elements=[Email.gmail_account_id, Email.gmail_message_id],
+                set_={
+                    **{column: excluded[column] for column in CONTENT_COLUMNS},
+                    **{column: None for column in DERIVED_COLUMNS},
+                    "simhash": excluded.simhash,
+                    "updated_at": excluded.updated_at,
+                },
+                # Re-sent emails that didn't change are left alone and count as duplicates
+                where=or_(*(
+                    getattr(Email, column).is_distinct_from(excluded[column])
+                    for column in CONTENT_COLUMNS
+                )),
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[Email.gmail_account_id, Email.gmail_message_id],
+            )
+
+        written = (await self.db.execute(
+            statement.returning(Email.id, Email.created_at, Email.gmail_account_id, Email.gmail_message_id),
+            email_rows,
+        )).all()
+        # Contents only for emails inserted or changed
+        by_key = {(row["gmail_account_id"], row["gmail_message_id"]): row for row in rows}
+        await store_contents(self.db, [
+            {**by_key[(w.gmail_account_id, w.gmail_message_id)], "email_id": w.id} for w in written
+        ])
+        await self.db.commit()
+
+        inserted = sum(1 for w in written if w.created_at == now)
+        self.stats["inserted"] += inserted
+        self.stats["updated"] += len(written) - inserted
+        self.stats["duplicates"] += len(rows) - len(written)
@@ -0,0 +1,197 @@
+"""Leases on emails being parsed, so any number of parsers can share the work."""
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import or_, select, update
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.email import Email, EmailStatus
+
+logger = logging.getLogger(__name__)
+
+# Leases taken for queued emails; whichever worker picks up the task takes them over
+JOB_LEASE_PREFIX = "job:"
+# Emails requeued per statement by the reaper
+REAP_BATCH_SIZE = 1000
+
+
+def default_lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def job_lease_owner(job_id: str) -> str:
+    return JOB_LEASE_PREFIX + job_id
+
+
+def lease_expiry(seconds: Optional[float] = None) -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.PARSE_LEASE_SECONDS if seconds is None else seconds)
+
+
+def lease_holder(email, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Owner of the live lease on an email, or None if it's free to claim.
+
+    Works on `Email` objects and on rows with its status, lease_owner and
+    lease_expires_at. Leases without an expiry (backfill runs) are held
+    until released.
+    """
+    if email.status != EmailStatus.PARSING or not email.lease_owner:
+        return None
+    if email.lease_expires_at is not None and email.lease_expires_at <= (now or datetime.utcnow()):
+        return None
+    return email.lease_owner
+
+
+def _unleased():
+    # lease_holder() in SQL
+    return or_(
+        Email.status != EmailStatus.PARSING,
+        Email.lease_owner.is_(None),
+        Email.lease_expires_at <= datetime.utcnow(),
+    )
+
+
+class EmailLeases:
+    """
+    Claims, renews and reaps parse leases.
+
+    A claimed email is PARSING with a `lease_owner` and `lease_expires_at`.
+    Claims lock rows with FOR UPDATE SKIP LOCKED, so concurrent claimants
+    never take the same email or wait on each other. Parsers renew their
+    leases while they work (heartbeats); when one dies, its leases expire
+    and `requeue_expired` puts the emails back to PENDING. Leases are
+    released by `apply_parse_result`.
+    """
+
+    def claim_pending(self, owner: str, limit: int, lease_seconds: Optional[float] = None) -> List[int]:
+        """
+        Atomically claim up to `limit` pending emails, oldest first.
+
+        Args:
+            owner: Lease owner (a parser, or `job_lease_owner()` for queued emails)
+            limit: Max emails to claim
+            lease_seconds: Lease duration (default: PARSE_LEASE_SECONDS)
+
+        Returns:
+            IDs of the claimed emails
+        """
+        db = SessionLocal()
+        try:
+            candidates = (
+                select(Email.id)
+                .where(Email.status == EmailStatus.PENDING)
+                .order_by(Email.received_at, Email.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            claimed = db.scalars(
+                update(Email)
+                .where(Email.id.in_(candidates.scalar_subquery()))
+                .values(status=EmailStatus.PARSING, lease_owner=owner, lease_expires_at=lease_expiry(lease_seconds))
+                .returning(Email.id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+            return sorted(claimed)
+        finally:
+            db.close()
+
+    def claim_email(self, email_id: int, owner: str, lease_seconds: Optional[float] = None) -> bool:
+        """
+        Claim one email whatever its status, unless someone holds a live lease on it.
+
+        Returns:
+            Whether the email was claimed
+        """
+        db = SessionLocal()
+        try:
+            claimed = db.scalar(
+                update(Email)
+                .where(Email.id == email_id, _unleased())
+                .values(status=EmailStatus.PARSING, lease_owner=owner, lease_expires_at=lease_expiry(lease_seconds))
+                .returning(Email.id)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return claimed is not None
+        finally:
+            db.close()
+
+    def renew(self, owner: str, email_ids: Iterable[int]) -> List[int]:
+        """Extend the leases `owner` still holds; returns the IDs renewed."""
+        db = SessionLocal()
+        try:
+            renewed = db.scalars(
+                update(Email)
+                .where(
+                    Email.id.in_(list(email_ids)),
+                    Email.status == EmailStatus.PARSING,
+                    Email.lease_owner == owner,
+                )
+                .values(lease_expires_at=lease_expiry())
+                .returning(Email.id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+            return renewed
+        finally:
+            db.close()
+
+    def release(self, owner: str, email_ids: Iterable[int]) -> List[int]:
+        """Put emails `owner` still holds back to PENDING, for parses it gave up on; returns the IDs released."""
+        db = SessionLocal()
+        try:
+            released = db.scalars(
+                update(Email)
+                .where(
+                    Email.id.in_(list(email_ids)),
+                    Email.status == EmailStatus.PARSING,
+                    Email.lease_owner == owner,
+                )
+                .values(status=EmailStatus.PENDING, lease_owner=None, lease_expires_at=None)
+                .returning(Email.id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        if released:
+            logger.info(f"Released {len(released)} emails {owner} gave up on")
+        return released
+
+    def requeue_expired(self) -> int:
+        """Put emails whose lease expired back to PENDING; returns how many."""
+        requeued = 0
+        db = SessionLocal()
+        try:
+            while True:
+                expired = (
+                    select(Email.id)
+                    .where(Email.status == EmailStatus.PARSING, Email.lease_expires_at < datetime.utcnow())
+                    .limit(REAP_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                )
+                ids = db.scalars(
+                    update(Email)
+                    .where(Email.id.in_(expired.scalar_subquery()))
+                    .values(status=EmailStatus.PENDING, lease_owner=None, lease_expires_at=None)
+                    .returning(Email.id)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                db.commit()
+                requeued += len(ids)
+                if len(ids) < REAP_BATCH_SIZE:
+                    break
+        finally:
+            db.close()
+        if requeued:
+            logger.warning(f"Requeued {requeued} emails whose parse lease expired")
+        return requeued
+
+
+# Singleton instance
+email_leases = EmailLeases()
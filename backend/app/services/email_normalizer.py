@@ -0,0 +1,177 @@
+"""Email body normalization ahead of parsing."""
+import html
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Bump when normalization rules change so cached text is recomputed
+NORMALIZER_VERSION = 1
+
+# Use the HTML part when the plain-text part is less than this share of it
+POOR_TEXT_RATIO = 0.5
+
+# Lines that start a quoted earlier message; everything from here down is history
+_REPLY_HEADERS = [
+    re.compile(r"^\s*On\b.{0,200}\bwrote:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*Le\b.{0,200}\ba écrit\s*:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*Am\b.{0,200}\bschrieb\b.{0,100}:\s*$", re.IGNORECASE),
+    re.compile(r"^\s*-{2,}\s*Original Message\s*-{2,}\s*$", re.IGNORECASE),
+    re.compile(r"^\s*_{10,}\s*$"),  # Outlook separator line
+]
+# "On Mon, 3 Jun 2024 at 10:00, John Smith <john@example.com>" wrapped before "wrote:"
+_SPLIT_REPLY_HEADER = re.compile(r"^\s*On\b.{0,200}$", re.IGNORECASE)
+_WROTE_LINE = re.compile(r"^.{0,100}\bwrote:\s*$", re.IGNORECASE)
+
+# Outlook-style quoted header block: "From: ..." followed by "Sent:"/"Date:"
+_OUTLOOK_FROM = re.compile(r"^\s*\*?From:\*?\s", re.IGNORECASE)
+_OUTLOOK_NEXT = re.compile(r"^\s*\*?(Sent|Date):\*?\s", re.IGNORECASE)
+
+_FORWARD_MARKER = re.compile(r"^\s*-{2,}\s*(Forwarded message|Begin forwarded message)\s*:?\s*-*\s*$", re.IGNORECASE)
+_FORWARD_HEADER = re.compile(r"^\s*\*?(From|Date|Sent|Subject|To|Cc|Reply-To):\*?\s", re.IGNORECASE)
+
+_MOBILE_SIGNATURE = re.compile(r"^\s*Sent from my \w+.*$|^\s*Get Outlook for \w+.*$", re.IGNORECASE)
+
+# Trailing paragraphs matching these are footers, not content
+_FOOTER_PATTERNS = re.compile(
+    r"unsubscribe|opt[ -]out|manage (your )?(email )?preferences|email preferences"
+    r"|this (e-?mail|message) (was sent|and any attachments)|intended (solely )?(for the )?(named )?recipient"
+    r"|confidential(ity)? (notice|information)|privileged|privacy policy|all rights reserved"
+    r"|you (are )?receiv(e|ed|ing) this (e-?mail|message)|view (this email )?in (your )?browser",
+    re.IGNORECASE,
+)
+
+_BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+    "blockquote", "section", "article", "header", "footer", "hr",
+}
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript"}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects readable text from HTML, keeping block structure as line breaks."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+        self._quote_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "blockquote":
+            # Quoted history in HTML replies
+            self._quote_depth += 1
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "blockquote" and self._quote_depth:
+            self._quote_depth -= 1
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth and not self._quote_depth:
+            self.parts.append(data)
+
+
+def html_to_text(body_html: str) -> str:
+    """Extract readable text from an HTML email body."""
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(body_html)
+        extractor.close()
+    except Exception:
+        # Malformed HTML: fall back to stripping tags
+        return html.unescape(re.sub(r"<[^>]+>", " ", body_html))
+    return "".join(extractor.parts)
+
+
+def _is_poor_text(body_text: str, html_text: str) -> bool:
+    stripped = (body_text or "").strip()
+    if not stripped:
+        return True
+    if re.search(r"<(html|body|div|p|table)\b", stripped[:2000], re.IGNORECASE):
+        return True  # HTML sent as text/plain
+    return len(stripped) < len(html_text.strip()) * POOR_TEXT_RATIO
+
+
+def _strip_forward_headers(lines: List[str]) -> List[str]:
+    """Drop forwarded-message header blocks but keep the forwarded content."""
+    result = []
+    i = 0
+    while i < len(lines):
+        if _FORWARD_MARKER.match(lines[i]):
+            i += 1
+            while i < len(lines) and (_FORWARD_HEADER.match(lines[i]) or not lines[i].strip()):
+                i += 1
+            continue
+        result.append(lines[i])
+        i += 1
+    return result
+
+
+def _strip_quoted_history(lines: List[str]) -> List[str]:
+    """Cut at the first reply header and drop '>' quoted lines."""
+    for i, line in enumerate(lines):
+        is_header = any(p.match(line) for p in _REPLY_HEADERS)
+        if not is_header and i + 1 < len(lines):
+            is_header = (
+                (_SPLIT_REPLY_HEADER.match(line) and _WROTE_LINE.match(lines[i + 1]))
+                or (_OUTLOOK_FROM.match(line) and _OUTLOOK_NEXT.match(lines[i + 1]))
+            )
+        if is_header:
+            lines = lines[:i]
+            break
+
+    unquoted = [line for line in lines if not line.lstrip().startswith(">")]
+    return unquoted
+
+
+def _strip_footers(text: str) -> str:
+    """Drop trailing footer paragraphs (unsubscribe blocks, legal notices)."""
+    paragraphs = re.split(r"\n\s*\n", text)
+    while len(paragraphs) > 1 and _FOOTER_PATTERNS.search(paragraphs[-1]):
+        paragraphs.pop()
+    return "\n\n".join(paragraphs)
+
+
+def _collapse_whitespace(text: str) -> str:
+    text = re.sub(r"[ \t\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def normalize_email(body_text: str, body_html: Optional[str] = None) -> str:
+    """
+    Reduce an email body to the text worth sending to the parser.
+
+    Picks the HTML part when the plain-text part is missing or much
+    shorter, then removes quoted reply history, forwarded-message headers,
+    mobile signatures and trailing unsubscribe/legal footers, and collapses
+    whitespace. The sender's signature block is kept because that is where
+    contact details usually are.
+
+    If stripping quoted history would leave nothing (e.g. a bare forward
+    of an earlier thread), the quoted text is kept instead.
+    """
+    text = body_text or ""
+    if body_html:
+        html_text = html_to_text(body_html)
+        if _is_poor_text(text, html_text):
+            text = html_text
+
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    lines = _strip_forward_headers(text.split("\n"))
+    lines = [line for line in lines if not _MOBILE_SIGNATURE.match(line)]
+
+    stripped = _strip_quoted_history(lines)
+    if not "".join(stripped).strip():
+        stripped = [re.sub(r"^\s*(>\s?)+", "", line) for line in lines]
+
+    normalized = _collapse_whitespace(_strip_footers(_collapse_whitespace("\n".join(stripped))))
+    return normalized or _collapse_whitespace(text)
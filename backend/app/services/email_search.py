@@ -0,0 +1,221 @@
+"""Ranked full-text search over email subjects, senders and bodies."""
+import html
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import (
+    REAL, Integer, Select, Text, bindparam, cast, column, func, literal_column, select, table, text, tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import TextClause
+
+from app.models.email import Email, EmailStatus
+from app.models.email_content import EmailContent
+from app.services.email_normalizer import html_to_text
+
+# Matches are marked with control characters inside the database, so the
+# text around them can be HTML-escaped before the marks become <mark> tags
+_START, _STOP = "\x02", "\x03"
+
+SEARCH_CONFIG = "english"
+# Bodies are cut to stay clear of the 1MB tsvector limit, and because
+# ts_headline re-parses the whole text
+MAX_BODY_CHARS = 100_000
+
+# Not mapped: written with the statements below, read only here
+_SEARCH = table("email_search", column("email_id"), column("search_vector"))
+_FTS = table("emails_fts")
+
+# The subject ranks above the sender, which ranks above the body
+_POSTGRESQL_INDEX = text(
+    "INSERT INTO email_search (email_id, search_vector) VALUES (:email_id, "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', :subject), 'A') || "
+    "setweight(to_tsvector('simple', :sender), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', :body), 'C')) "
+    "ON CONFLICT (email_id) DO UPDATE SET search_vector = excluded.search_vector"
+)
+_SQLITE_UNINDEX = text("DELETE FROM emails_fts WHERE rowid = :email_id")
+_SQLITE_INDEX = text(
+    "INSERT INTO emails_fts (rowid, subject, sender, body) VALUES (:email_id, :subject, :sender, :body)"
+)
+
+_POSTGRESQL_SNIPPETS = text(
+    f"SELECT page.email_id, ts_headline('{SEARCH_CONFIG}', page.body, "
+    f"websearch_to_tsquery('{SEARCH_CONFIG}', :q), :options) AS snippet "
+    "FROM unnest(:email_ids, :bodies) AS page (email_id, body)"
+).bindparams(bindparam("email_ids", type_=ARRAY(Integer)), bindparam("bodies", type_=ARRAY(Text)))
+
+_RESULT_COLUMNS = [
+    Email.id, Email.subject, Email.sender, Email.sender_name, Email.received_at,
+    Email.status, Email.gmail_account_id,
+]
+
+
+def search_body(body_text: Optional[str], body_html: Optional[str]) -> str:
+    """The text searched for an email's body: the plain text part, or the HTML part as text."""
+    if body_text and body_text.strip():
+        return body_text[:MAX_BODY_CHARS]
+    return html_to_text(body_html)[:MAX_BODY_CHARS] if body_html else ""
+
+
+def index_statements(dialect: str, rows: List[Dict[str, Any]]) -> List[Tuple[TextClause, List[Dict[str, Any]]]]:
+    """
+    Statements (with their parameter lists) that add emails to the search index, or refresh them.
+
+    Args:
+        dialect: Database dialect name
+        rows: email_id, subject, sender, sender_name, body_text and body_html of each email
+    """
+    params = [
+        {
+            "email_id": row["email_id"],
+            "subject": row["subject"] or "",
+            "sender": f"{row['sender_name'] or ''} {row['sender']}",
+            "body": search_body(row["body_text"], row["body_html"]),
+        }
+        for row in rows
+    ]
+    if dialect == "postgresql":
+        return [(_POSTGRESQL_INDEX, params)]
+    return [(_SQLITE_UNINDEX, [{"email_id": p["email_id"]} for p in params]), (_SQLITE_INDEX, params)]
+
+
+def _highlight(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return html.escape(text).replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def _filter(query: Select, status: Optional[EmailStatus], account_id: Optional[int]) -> Select:
+    if status:
+        query = query.where(Email.status == status)
+    if account_id:
+        query = query.where(Email.gmail_account_id == account_id)
+    return query
+
+
+def _postgresql_query(q: str, status, account_id, limit: int, after) -> Select:
+    tsquery = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), q)
+    rank = func.ts_rank_cd(_SEARCH.c.search_vector, tsquery)
+
+    # Rank and page on the index first; headlines are built for the page only
+    page = _filter(
+        select(Email.id, rank.label("rank"))
+        .join(_SEARCH, _SEARCH.c.email_id == Email.id)
+        .where(_SEARCH.c.search_vector.op("@@")(tsquery)),
+        status, account_id,
+    )
+    if after:
+        page = page.where(tuple_(rank, Email.id) < tuple_(cast(after[0], REAL), after[1]))
+    page = page.order_by(rank.desc(), Email.id.desc()).limit(limit).subquery()
+
+    return (
+        select(
+            *_RESULT_COLUMNS,
+            page.c.rank,
+            func.ts_headline(
+                cast(SEARCH_CONFIG, REGCONFIG), func.coalesce(Email.subject, ""), tsquery,
+                f"StartSel={_START}, StopSel={_STOP}, HighlightAll=true",
+            ).label("subject_highlight"),
+        )
+        .join(page, page.c.id == Email.id)
+        .order_by(page.c.rank.desc(), Email.id.desc())
+    )
+
+
+async def _postgresql_snippets(db: AsyncSession, q: str, email_ids: List[int]) -> Dict[int, str]:
+    # Bodies are compressed, so they are read here and sent back for ts_headline
+    if not email_ids:
+        return {}
+    contents = (await db.execute(
+        select(EmailContent.email_id, EmailContent.body_text, EmailContent.body_html)
+        .where(EmailContent.email_id.in_(email_ids))
+    )).all()
+    result = await db.execute(_POSTGRESQL_SNIPPETS, {
+        "q": q,
+        "options": f"StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=25, MinWords=10",
+        "email_ids": [c.email_id for c in contents],
+        "bodies": [search_body(c.body_text, c.body_html) for c in contents],
+    })
+    return dict(result.all())
+
+
+def _sqlite_query(q: str, status, account_id, limit: int, after) -> Optional[Select]:
+    # FTS5 has its own query syntax; search for all the words instead
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    fts = literal_column("emails_fts")
+    # bm25 is lower for better matches; negated so both databases rank high-to-low
+    rank = -func.bm25(fts, 10.0, 5.0, 1.0)
+
+    query = _filter(
+        select(
+            *_RESULT_COLUMNS,
+            rank.label("rank"),
+            func.highlight(fts, 0, _START, _STOP).label("subject_highlight"),
+            func.snippet(fts, 2, _START, _STOP, "…", 25).label("snippet"),
+        )
+        .select_from(_FTS)
+        .join(Email, Email.id == literal_column("emails_fts.rowid"))
+        .where(fts.op("MATCH")(" ".join(f'"{term}"' for term in terms))),
+        status, account_id,
+    )
+    if after:
+        query = query.where(tuple_(rank, Email.id) < tuple_(after[0], after[1]))
+    return query.order_by(rank.desc(), Email.id.desc()).limit(limit)
+
+
+async def search_emails(
+    db: AsyncSession,
+    q: str,
+    status: Optional[EmailStatus] = None,
+    account_id: Optional[int] = None,
+    limit: int = 20,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Find emails matching a search query, best match first.
+
+    PostgreSQL reads the GIN index of the `email_search` table with web-search syntax
+    ("quoted phrases", OR, -excluded); subject matches outrank sender
+    matches, which outrank body matches. SQLite (tests) matches all the
+    words through FTS5.
+
+    Args:
+        q: Search query
+        status: Only emails with this status
+        account_id: Only emails from this account
+        limit: Max results
+        after: (rank, id) of the last result of the previous page
+
+    Returns:
+        Results with their rank, the subject with matches in <mark> tags,
+        and a snippet of the matching body text (HTML-escaped)
+    """
+    snippets = None
+    if db.bind.dialect.name == "postgresql":
+        rows = (await db.execute(_postgresql_query(q, status, account_id, limit, after))).all()
+        snippets = await _postgresql_snippets(db, q, [r.id for r in rows])
+    else:
+        query = _sqlite_query(q, status, account_id, limit, after)
+        if query is None:
+            return []
+        rows = (await db.execute(query)).all()
+
+    return [
+        {
+            "id": r.id,
+            "subject": r.subject,
+            "sender": r.sender,
+            "sender_name": r.sender_name,
+            "received_at": r.received_at.isoformat() if r.received_at else None,
+            "status": r.status.value if r.status else "pending",
+            "gmail_account_id": r.gmail_account_id,
+            "rank": r.rank,
+            "subject_highlight": _highlight(r.subject_highlight),
+            "snippet": _highlight(snippets.get(r.id) if snippets is not None else r.snippet),
+        }
+        for r in rows
+    ]
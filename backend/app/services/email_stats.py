@@ -0,0 +1,68 @@
+"""Email counts per account and status."""
+from collections import defaultdict
+from typing import Dict, Any, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.email import Email, EmailStatus
+from app.models.email_counter import EmailCounter
+
+
+async def email_counts(db: AsyncSession) -> Dict[Tuple[int, EmailStatus], int]:
+    """
+    Number of emails per (account ID, status).
+
+    On PostgreSQL this reads the trigger-maintained `email_counters`
+    table, one row per account and status, however many emails there
+    are. Other databases have no triggers, so the emails are counted.
+    """
+    if db.bind.dialect.name == "postgresql":
+        query = (
+            select(EmailCounter.gmail_account_id, EmailCounter.status, EmailCounter.count)
+            .where(EmailCounter.count != 0)
+        )
+    else:
+        query = (
+            select(Email.gmail_account_id, Email.status, func.count(Email.id))
+            .group_by(Email.gmail_account_id, Email.status)
+        )
+
+    counts = defaultdict(int)
+    for account_id, status, count in await db.execute(query):
+        counts[(account_id, status or EmailStatus.PENDING)] += count
+    return dict(counts)
+
+
+async def account_totals(db: AsyncSession) -> Dict[int, int]:
+    """Number of emails per account ID."""
+    totals = defaultdict(int)
+    for (account_id, _), count in (await email_counts(db)).items():
+        totals[account_id] += count
+    return dict(totals)
+
+
+def _zero_counts() -> Dict[str, int]:
+    return {status.value: 0 for status in EmailStatus}
+
+
+async def get_stats(db: AsyncSession) -> Dict[str, Any]:
+    """Email counts by status, overall and for each account."""
+    by_status = _zero_counts()
+    accounts = defaultdict(_zero_counts)
+    for (account_id, status), count in (await email_counts(db)).items():
+        by_status[status.value] += count
+        accounts[account_id][status.value] += count
+
+    return {
+        "total": sum(by_status.values()),
+        "by_status": by_status,
+        "accounts": [
+            {
+                "gmail_account_id": account_id,
+                "total": sum(statuses.values()),
+                "by_status": statuses,
+            }
+            for account_id, statuses in sorted(accounts.items())
+        ],
+    }
@@ -0,0 +1,241 @@
+"""Filters on extracted offer fields, compiled to SQL."""
+import json
+import logging
+import math
+import re
+from typing import Dict, Any, Iterable, List, Tuple
+
+from sqlalchemy import Boolean, Numeric, Text, case, cast, func, literal, literal_column, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.core.database import engine
+from app.models.email import Email
+from app.services.email_export import schema_fields
+
+logger = logging.getLogger(__name__)
+
+# Query parameters like `field.price.amount__lt=200`
+FIELD_PARAM_PREFIX = "field."
+OPERATORS = ("eq", "ne", "lt", "lte", "gt", "gte", "in", "contains", "exists")
+# Which operators make sense for each schema type ("json": arrays and untyped fields)
+TYPE_OPERATORS = {
+    "string": {"eq", "ne", "lt", "lte", "gt", "gte", "in", "contains", "exists"},
+    "number": {"eq", "ne", "lt", "lte", "gt", "gte", "in", "exists"},
+    "integer": {"eq", "ne", "lt", "lte", "gt", "gte", "in", "exists"},
+    "boolean": {"eq", "ne", "exists"},
+    "json": {"exists"},
+}
+
+# Names of the expression indexes managed by `python -m app.field_indexes`
+FIELD_INDEX_PREFIX = "ix_emails_field_"
+
+_PATH_PART = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def offer_data() -> ColumnElement:
+    """The offer an email stands for: the human correction if there is one, else the parse."""
+    return func.coalesce(Email.corrected_data, Email.parsed_data)
+
+
+def _path_parts(path: str) -> List[str]:
+    parts = path.split(".")
+    if not all(_PATH_PART.match(part) for part in parts):
+        raise ValueError(f"Invalid field path: {path}")
+    return parts
+
+
+def _pg_path(path: str) -> ColumnElement:
+    # Inlined rather than bound: index expressions only match constants
+    return literal_column(f"'{{{','.join(_path_parts(path))}}}'")
+
+
+def _sqlite_path(path: str) -> str:
+    return "$." + ".".join(_path_parts(path))
+
+
+def field_expression(path: str, json_type: str, dialect: str) -> ColumnElement:
+    """
+    SQL value of one offer field, typed after the schema.
+
+    Values of the wrong JSON type read as NULL instead of failing the
+    cast, so one odd parse can't break a query (or, for indexed fields,
+    an insert). On PostgreSQL this must stay identical to the indexed
+    expressions for the planner to use them.
+    """
+    data = offer_data()
+    if dialect == "postgresql":
+        if json_type in ("number", "integer", "boolean"):
+            value = data.op("#>")(_pg_path(path))
+            expected = "boolean" if json_type == "boolean" else "number"
+            return case(
+                (func.jsonb_typeof(value) == literal_column(f"'{expected}'"),
+                 cast(value, Boolean if json_type == "boolean" else Numeric)),
+            )
+        if json_type == "json":
+            return data.op("#>")(_pg_path(path))
+        return data.op("#>>", return_type=Text)(_pg_path(path))
+
+    value = func.json_extract(data, _sqlite_path(path))
+    if json_type in ("number", "integer"):
+        return case((func.json_type(data, _sqlite_path(path)).in_(["integer", "real"]), value))
+    if json_type == "boolean":
+        return case((func.json_type(data, _sqlite_path(path)).in_(["true", "false"]), value))
+    return value
+
+
+def _field_present(path: str, dialect: str) -> ColumnElement:
+    if dialect == "postgresql":
+        json_type_of = func.jsonb_typeof(offer_data().op("#>")(_pg_path(path)))
+    else:
+        json_type_of = func.json_type(offer_data(), _sqlite_path(path))
+    return func.coalesce(json_type_of != "null", False)
+
+
+def _parse_value(raw: str, json_type: str) -> Any:
+    if json_type == "boolean":
+        if raw.lower() in ("true", "1"):
+            return True
+        if raw.lower() in ("false", "0"):
+            return False
+        raise ValueError(f"Expected true or false, got {raw!r}")
+    if json_type == "integer":
+        return int(raw)
+    if json_type == "number":
+        value = float(raw)
+        if not math.isfinite(value):
+            raise ValueError(f"Expected a finite number, got {raw!r}")
+        return value
+    return raw
+
+
+def _nested(path: str, value: Any) -> Dict[str, Any]:
+    document = value
+    for part in reversed(path.split(".")):
+        document = {part: document}
+    return document
+
+
+def build_field_filters(
+    params: Iterable[Tuple[str, str]], schema: Dict[str, Any], dialect: str,
+) -> List[ColumnElement]:
+    """
+    Turn `field.<path>[__<op>]=<value>` query parameters into SQL conditions.
+
+    Paths and value types come from the parsing schema; nested fields use
+    dots (`field.price.amount__lt=200`). Operators: eq (default), ne, lt,
+    lte, gt, gte, in (comma-separated), contains (case-insensitive
+    substring), exists (true/false). On PostgreSQL, equality is a JSONB
+    containment test served by the GIN index on the offer data.
+
+    Raises:
+        ValueError: for unknown fields, unsupported operators or bad values
+    """
+    fields = dict(schema_fields(schema))
+    conditions = []
+    for key, raw in params:
+        if not key.startswith(FIELD_PARAM_PREFIX):
+            continue
+        path, _, op = key[len(FIELD_PARAM_PREFIX):].partition("__")
+        op = op or "eq"
+        if path not in fields:
+            raise ValueError(f"Unknown field: {path}")
+        json_type = fields[path]
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r}; use one of {', '.join(OPERATORS)}")
+        if op not in TYPE_OPERATORS[json_type]:
+            raise ValueError(f"Operator {op!r} doesn't apply to {json_type} field {path}")
+
+        try:
+            if op == "exists":
+                present = _field_present(path, dialect)
+                conditions.append(present if _parse_value(raw, "boolean") else ~present)
+                continue
+            if op == "in":
+                values = [_parse_value(v.strip(), json_type) for v in raw.split(",")]
+            else:
+                value = _parse_value(raw, json_type)
+        except ValueError as e:
+            raise ValueError(f"Invalid value for {key}: {e}")
+
+        if op == "eq" and dialect == "postgresql":
+            # Bound as text so count=estimate can render the query with literal values
+            document = cast(literal(json.dumps(_nested(path, value)), Text), postgresql.JSONB)
+            conditions.append(offer_data().op("@>")(document))
+            continue
+
+        expression = field_expression(path, json_type, dialect)
+        if op == "eq":
+            conditions.append(expression == value)
+        elif op == "ne":
+            conditions.append(expression != value)
+        elif op == "lt":
+            conditions.append(expression < value)
+        elif op == "lte":
+            conditions.append(expression <= value)
+        elif op == "gt":
+            conditions.append(expression > value)
+        elif op == "gte":
+            conditions.append(expression >= value)
+        elif op == "in":
+            conditions.append(expression.in_(values))
+        elif op == "contains":
+            conditions.append(expression.icontains(value, autoescape=True))
+    return conditions
+
+
+def field_index_name(path: str) -> str:
+    return FIELD_INDEX_PREFIX + "_".join(_path_parts(path))
+
+
+def sync_field_indexes(paths: List[str], schema: Dict[str, Any], rebuild: bool = False) -> Dict[str, List[str]]:
+    """
+    Make the expression indexes on offer fields match `paths` (PostgreSQL only).
+
+    Strings get hash indexes (eq, ne and in), other types B-tree (ranges
+    too). Indexes are built with CREATE INDEX CONCURRENTLY, so writes carry on
+    meanwhile; ones left invalid by an interrupted build are rebuilt.
+    Indexes for fields no longer listed are dropped. Pass `rebuild` after
+    a field changes type in the schema.
+
+    Returns:
+        Index names created, dropped and kept
+    """
+    fields = dict(schema_fields(schema))
+    wanted = {}
+    for path in paths:
+        if fields.get(path) in (None, "json"):
+            logger.warning(f"Not indexing {path}: not a scalar field of the active schema")
+            continue
+        expression = field_expression(path, fields[path], "postgresql").compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True},
+        )
+        # Hash for strings: equality is all they need, and B-tree rows are size-limited
+        method = "hash" if fields[path] == "string" else "btree"
+        wanted[field_index_name(path)] = (
+            f"CREATE INDEX CONCURRENTLY {field_index_name(path)} ON emails USING {method} (({expression}))"
+        )
+
+    result = {"created": [], "dropped": [], "kept": []}
+    # CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        existing = dict(conn.execute(text(
+            "SELECT c.relname, i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = 'emails'::regclass AND starts_with(c.relname, :prefix)"
+        ), {"prefix": FIELD_INDEX_PREFIX}).all())
+
+        for name, valid in existing.items():
+            if name not in wanted or not valid or rebuild:
+                logger.info(f"Dropping index {name}")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+                if name not in wanted:
+                    result["dropped"].append(name)
+            else:
+                result["kept"].append(name)
+
+        for name, statement in wanted.items():
+            if name not in result["kept"]:
+                logger.info(f"Creating index {name}")
+                conn.execute(text(statement))
+                result["created"].append(name)
+    return result
@@ -0,0 +1,147 @@
+"""Client for the Gmail REST API (profile, message list, history, messages)."""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.models.gmail_account import GmailAccount
+from app.services.rate_limiter import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Refresh access tokens this long before Google says they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=2)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class HistoryExpired(Exception):
+    """The stored history ID is too old for an incremental sync."""
+
+
+class GmailClient:
+    """
+    Thin async wrapper over the Gmail v1 endpoints the sync needs.
+
+    Talks to the API over httpx so that GMAIL_API_BASE_URL can point at a
+    stand-in server. Access tokens are refreshed from the account's
+    refresh token when they are about to expire (or are rejected), and
+    written back to the account object; the caller commits them.
+    Throttled and failed requests, and requests that never got a response
+    (timeouts, dropped connections), are retried with jittered backoff.
+    """
+
+    def __init__(self, account: GmailAccount, http: httpx.AsyncClient):
+        self.account = account
+        self.http = http
+        self.base_url = settings.GMAIL_API_BASE_URL.rstrip("/")
+
+    async def refresh_token(self) -> None:
+        if not settings.GOOGLE_CLIENT_ID or not settings.GOOGLE_CLIENT_SECRET:
+            raise ValueError("GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET are not configured")
+        response = await self.http.post(settings.GOOGLE_TOKEN_URL, data={
+            "grant_type": "refresh_token",
+            "refresh_token": self.account.refresh_token,
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+        })
+        response.raise_for_status()
+        token = response.json()
+        self.account.access_token = token["access_token"]
+        self.account.token_expiry = datetime.utcnow() + timedelta(seconds=token.get("expires_in", 3600))
+        logger.info(f"Refreshed access token for {self.account.email}")
+
+    async def _get(self, path: str, **params) -> Dict[str, Any]:
+        if self.account.token_expiry - TOKEN_REFRESH_MARGIN < datetime.utcnow():
+            await self.refresh_token()
+
+        refreshed = False
+        attempt = 0
+        while True:
+            try:
+                response = await self.http.get(
+                    f"{self.base_url}/users/me/{path}",
+                    params={k: v for k, v in params.items() if v is not None},
+                    headers={"Authorization": f"Bearer {self.account.access_token}"},
+                )
+            except httpx.TransportError as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = self._backoff(attempt)
+                logger.info(f"Gmail request failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if response.status_code == 401 and not refreshed:
+                await self.refresh_token()
+                refreshed = True
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                error = httpx.HTTPStatusError("Retryable Gmail error", request=response.request, response=response)
+                delay = retry_after_seconds(error)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                logger.info(f"Gmail returned {response.status_code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, 2 ** attempt))
+
+    async def get_profile(self) -> Dict[str, Any]:
+        return await self._get("profile")
+
+    async def list_message_ids(self, query: Optional[str] = None) -> AsyncIterator[List[str]]:
+        """Yield message IDs one result page at a time, newest first."""
+        page_token = None
+        while True:
+            page = await self._get(
+                "messages", q=query, maxResults=settings.GMAIL_PAGE_SIZE, pageToken=page_token,
+            )
+            yield [m["id"] for m in page.get("messages", [])]
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return
+
+    async def list_history(self, start_history_id: str) -> AsyncIterator[Tuple[List[str], str]]:
+        """
+        Yield (added message IDs, latest history ID) one page at a time.
+
+        Raises:
+            HistoryExpired: if Gmail no longer has history that far back
+        """
+        page_token = None
+        while True:
+            try:
+                page = await self._get(
+                    "history",
+                    startHistoryId=start_history_id,
+                    historyTypes="messageAdded",
+                    maxResults=settings.GMAIL_PAGE_SIZE,
+                    pageToken=page_token,
+                )
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    raise HistoryExpired(start_history_id) from e
+                raise
+            message_ids = [
+                added["message"]["id"]
+                for record in page.get("history", [])
+                for added in record.get("messagesAdded", [])
+            ]
+            yield message_ids, page["historyId"]
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return
+
+    async def get_message(self, message_id: str) -> Dict[str, Any]:
+        return await self._get(f"messages/{message_id}", format="full")
@@ -0,0 +1,515 @@
+"""Durable parse job queue backed by Redis (or memory for local runs), with live job events."""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, AsyncIterator, Optional, List, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "parse:queue"
+DELAYED_KEY = "parse:delayed"
+DEAD_LETTER_KEY = "parse:dead"
+PROCESSING_KEY = "parse:processing:{worker_id}"
+WORKERS_KEY = "parse:workers"  # Set of workers that may hold processing lists
+HEARTBEAT_KEY = "parse:heartbeat:{worker_id}"  # Expires when the worker stops beating
+JOB_KEY = "parse:job:{job_id}"
+EVENTS_KEY = "parse:events:{job_id}"  # Pub/sub channel
+
+JOB_TTL_SECONDS = 7 * 24 * 60 * 60  # Keep job status around for a week
+
+
+@dataclass
+class ParseTask:
+    """A single email to parse as part of a job."""
+    job_id: str
+    email_id: int
+    attempt: int = 0
+
+    def encode(self) -> str:
+        return json.dumps(asdict(self), sort_keys=True)
+
+    @classmethod
+    def decode(cls, raw: str) -> "ParseTask":
+        return cls(**json.loads(raw))
+
+
+class RedisBackend:
+    """
+    Queue storage on Redis.
+
+    Accepts any `redis.asyncio`-compatible client, so a
+    `fakeredis.aioredis.FakeRedis` instance can be passed in for tests.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        from redis.asyncio import Redis
+        return cls(Redis.from_url(url, decode_responses=True))
+
+    async def push(self, key: str, value: str) -> None:
+        await self.client.lpush(key, value)
+
+    async def pop(self, src: str, dst: str, timeout: float) -> Optional[str]:
+        # Atomically move the item to a processing list so it survives a crash
+        return await self.client.blmove(src, dst, timeout, "RIGHT", "LEFT")
+
+    async def pop_nowait(self, src: str, dst: str) -> Optional[str]:
+        return await self.client.lmove(src, dst, "RIGHT", "LEFT")
+
+    async def remove(self, key: str, value: str) -> None:
+        await self.client.lrem(key, 1, value)
+
+    async def range(self, key: str, start: int, end: int) -> List[str]:
+        return await self.client.lrange(key, start, end)
+
+    async def length(self, key: str) -> int:
+        return await self.client.llen(key)
+
+    async def hset(self, key: str, mapping: Dict[str, Any]) -> None:
+        await self.client.hset(key, mapping=mapping)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return await self.client.hgetall(key)
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        return await self.client.hincrby(key, field, amount)
+
+    async def expire(self, key: str, seconds: int) -> None:
+        await self.client.expire(key, seconds)
+
+    async def set_expiring(self, key: str, value: str, seconds: float) -> None:
+        await self.client.set(key, value, px=int(seconds * 1000))
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self.client.exists(key))
+
+    async def sadd(self, key: str, value: str) -> None:
+        await self.client.sadd(key, value)
+
+    async def srem(self, key: str, value: str) -> None:
+        await self.client.srem(key, value)
+
+    async def smembers(self, key: str) -> Set[str]:
+        return await self.client.smembers(key)
+
+    async def schedule(self, key: str, value: str, ready_at: float) -> None:
+        await self.client.zadd(key, {value: ready_at})
+
+    async def pop_due(self, key: str, now: float) -> List[str]:
+        due = await self.client.zrangebyscore(key, 0, now)
+        claimed = []
+        for value in due:
+            # ZREM is atomic, so only one worker wins each delayed task
+            if await self.client.zrem(key, value):
+                claimed.append(value)
+        return claimed
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> "RedisSubscription":
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        return RedisSubscription(pubsub)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class RedisSubscription:
+    """Messages published on a Redis channel since subscribing."""
+
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Next message, or None if none arrives within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                return message["data"]
+        return None
+
+    async def close(self) -> None:
+        await self.pubsub.aclose()
+
+
+class MemoryBackend:
+    """In-process queue storage for development and offline tests."""
+
+    def __init__(self):
+        self.lists: Dict[str, deque] = defaultdict(deque)
+        self.hashes: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.sorted_sets: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.sets: Dict[str, Set[str]] = defaultdict(set)
+        self.expiring: Dict[str, Tuple[str, float]] = {}  # key -> (value, monotonic expiry)
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    async def push(self, key: str, value: str) -> None:
+        self.lists[key].appendleft(value)
+
+    async def pop(self, src: str, dst: str, timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + timeout
+        while not self.lists[src]:
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.05)
+        return await self.pop_nowait(src, dst)
+
+    async def pop_nowait(self, src: str, dst: str) -> Optional[str]:
+        if not self.lists[src]:
+            return None
+        value = self.lists[src].pop()
+        self.lists[dst].appendleft(value)
+        return value
+
+    async def remove(self, key: str, value: str) -> None:
+        try:
+            self.lists[key].remove(value)
+        except ValueError:
+            pass
+
+    async def range(self, key: str, start: int, end: int) -> List[str]:
+        items = list(self.lists[key])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def length(self, key: str) -> int:
+        return len(self.lists[key])
+
+    async def hset(self, key: str, mapping: Dict[str, Any]) -> None:
+        self.hashes[key].update({k: str(v) for k, v in mapping.items()})
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return dict(self.hashes.get(key, {}))
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        value = int(self.hashes[key].get(field, 0)) + amount
+        self.hashes[key][field] = str(value)
+        return value
+
+    async def expire(self, key: str, seconds: int) -> None:
+        pass  # Memory backend lives only as long as the process
+
+    async def set_expiring(self, key: str, value: str, seconds: float) -> None:
+        self.expiring[key] = (value, time.monotonic() + seconds)
+
+    async def exists(self, key: str) -> bool:
+        entry = self.expiring.get(key)
+        if entry and entry[1] <= time.monotonic():
+            del self.expiring[key]
+            entry = None
+        return entry is not None or bool(self.lists.get(key) or self.hashes.get(key) or self.sets.get(key))
+
+    async def sadd(self, key: str, value: str) -> None:
+        self.sets[key].add(value)
+
+    async def srem(self, key: str, value: str) -> None:
+        self.sets[key].discard(value)
+
+    async def smembers(self, key: str) -> Set[str]:
+        return set(self.sets.get(key, ()))
+
+    async def schedule(self, key: str, value: str, ready_at: float) -> None:
+        self.sorted_sets[key][value] = ready_at
+
+    async def pop_due(self, key: str, now: float) -> List[str]:
+        pending = self.sorted_sets[key]
+        due = [value for value, score in pending.items() if score <= now]
+        for value in due:
+            del pending[value]
+        return due
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in self.subscribers[channel]:
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> "MemorySubscription":
+        return MemorySubscription(self.subscribers, channel)
+
+    async def close(self) -> None:
+        pass
+
+
+class MemorySubscription:
+    """Messages published on an in-process channel since subscribing."""
+
+    def __init__(self, subscribers: Dict[str, Set[asyncio.Queue]], channel: str):
+        self.subscribers = subscribers
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue()
+        subscribers[channel].add(self.queue)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self) -> None:
+        self.subscribers[self.channel].discard(self.queue)
+        if not self.subscribers[self.channel]:
+            del self.subscribers[self.channel]
+
+
+class JobQueue:
+    """
+    Parse job queue.
+
+    A job groups the emails from one API request. Each email is queued as
+    its own task so work spreads across all running workers. Tasks are
+    moved onto a per-worker processing list while being worked on, retried
+    with exponential backoff on failure and moved to a dead-letter list
+    once `JOB_MAX_RETRIES` is exhausted.
+
+    Workers beat a heartbeat key that expires after
+    WORKER_HEARTBEAT_TTL_SECONDS; any worker requeues the processing list
+    of one whose heartbeat expired (`recover_stale`), so tasks held by a
+    worker that died and never came back are not stranded.
+
+    Each settled task is published as an event on the job's pub/sub
+    channel ("parsed", "failed" or "retrying", then "progress"), for
+    `events` to follow.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def enqueue_parse(self, email_ids: List[int], job_id: Optional[str] = None) -> str:
+        """Create a job for the given emails and queue one task per email."""
+        job_id = job_id or uuid.uuid4().hex
+        job_key = JOB_KEY.format(job_id=job_id)
+
+        await self.backend.hset(job_key, {
+            "id": job_id,
+            "status": "queued",
+            "email_ids": json.dumps(email_ids),
+            "total": len(email_ids),
+            "succeeded": 0,
+            "failed": 0,
+            "created_at": time.time(),
+        })
+        await self.backend.expire(job_key, JOB_TTL_SECONDS)
+
+        for email_id in email_ids:
+            await self.backend.push(QUEUE_KEY, ParseTask(job_id, email_id).encode())
+
+        logger.info(f"Queued job {job_id} with {len(email_ids)} emails")
+        return job_id
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the status and progress of a job."""
+        raw = await self.backend.hgetall(JOB_KEY.format(job_id=job_id))
+        if not raw:
+            return None
+
+        return {
+            "id": raw["id"],
+            "status": raw["status"],
+            "email_ids": json.loads(raw["email_ids"]),
+            "total": int(raw["total"]),
+            "succeeded": int(raw.get("succeeded", 0)),
+            "failed": int(raw.get("failed", 0)),
+            "created_at": float(raw["created_at"]),
+            "finished_at": float(raw["finished_at"]) if raw.get("finished_at") else None,
+        }
+
+    async def claim(self, worker_id: str, timeout: float = 5.0) -> Optional[ParseTask]:
+        """Wait for the next task and move it to this worker's processing list."""
+        await self._promote_due()
+        raw = await self.backend.pop(QUEUE_KEY, PROCESSING_KEY.format(worker_id=worker_id), timeout)
+        if raw is None:
+            return None
+        return ParseTask.decode(raw)
+
+    async def claim_many(self, worker_id: str, max_tasks: int, timeout: float = 5.0) -> List[ParseTask]:
+        """Wait for one task, then take up to `max_tasks - 1` more that are ready."""
+        first = await self.claim(worker_id, timeout)
+        if first is None:
+            return []
+
+        tasks = [first]
+        processing_key = PROCESSING_KEY.format(worker_id=worker_id)
+        while len(tasks) < max_tasks:
+            raw = await self.backend.pop_nowait(QUEUE_KEY, processing_key)
+            if raw is None:
+                break
+            tasks.append(ParseTask.decode(raw))
+        return tasks
+
+    async def complete(
+        self, worker_id: str, task: ParseTask, success: bool, details: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Acknowledge a finished task and update its job's progress; `details` go into its event."""
+        await self.backend.remove(PROCESSING_KEY.format(worker_id=worker_id), task.encode())
+        await self._publish(task.job_id, {
+            "type": "parsed" if success else "failed",
+            "email_id": task.email_id,
+            "attempt": task.attempt,
+            **(details or {}),
+        })
+        await self._record(task.job_id, success)
+
+    async def retry(self, worker_id: str, task: ParseTask, error: str) -> None:
+        """Schedule a failed task for another attempt, or dead-letter it."""
+        await self.backend.remove(PROCESSING_KEY.format(worker_id=worker_id), task.encode())
+
+        if task.attempt + 1 > settings.JOB_MAX_RETRIES:
+            logger.warning(f"Email {task.email_id} (job {task.job_id}) dead-lettered: {error}")
+            await self.backend.push(DEAD_LETTER_KEY, json.dumps({
+                **asdict(task),
+                "error": error,
+                "failed_at": time.time(),
+            }))
+            await self._publish(task.job_id, {
+                "type": "failed",
+                "email_id": task.email_id,
+                "attempt": task.attempt,
+                "error": error,
+                "dead_lettered": True,
+            })
+            await self._record(task.job_id, success=False)
+            return
+
+        delay = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** task.attempt)
+        retry_task = ParseTask(task.job_id, task.email_id, task.attempt + 1)
+        await self.backend.schedule(DELAYED_KEY, retry_task.encode(), time.time() + delay)
+        await self._publish(task.job_id, {
+            "type": "retrying",
+            "email_id": task.email_id,
+            "attempt": task.attempt,
+            "error": error,
+            "retry_in": delay,
+        })
+        logger.info(f"Retrying email {task.email_id} in {delay:.0f}s (attempt {retry_task.attempt})")
+
+    async def events(self, job_id: str, keepalive: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Follow a job until it completes.
+
+        Yields a "progress" event with where the job stands, then each event
+        as it's published; the last one is the "progress" event of a
+        completed job. Yields None after `keepalive` seconds without events.
+        Nothing is yielded for unknown jobs.
+        """
+        # Subscribed before reading the job, so no event falls in between
+        subscription = await self.backend.subscribe(EVENTS_KEY.format(job_id=job_id))
+        try:
+            job = await self.get_job(job_id)
+            if job is None:
+                return
+            yield _progress_event(job)
+            if job["status"] == "completed":
+                return
+
+            while True:
+                raw = await subscription.get(keepalive)
+                if raw is None:
+                    yield None
+                    continue
+                event = json.loads(raw)
+                yield event
+                if event["type"] == "progress" and event["status"] == "completed":
+                    return
+        finally:
+            await subscription.close()
+
+    async def heartbeat(self, worker_id: str) -> None:
+        """Mark a worker alive for another WORKER_HEARTBEAT_TTL_SECONDS."""
+        await self.backend.sadd(WORKERS_KEY, worker_id)
+        await self.backend.set_expiring(
+            HEARTBEAT_KEY.format(worker_id=worker_id), str(time.time()), settings.WORKER_HEARTBEAT_TTL_SECONDS,
+        )
+
+    async def recover(self, worker_id: str) -> int:
+        """Requeue the tasks on a worker's processing list (left by a crash, or by a dead worker)."""
+        processing_key = PROCESSING_KEY.format(worker_id=worker_id)
+        recovered = 0
+        # LMOVE hands each task to exactly one recovering worker
+        while await self.backend.pop_nowait(processing_key, QUEUE_KEY) is not None:
+            recovered += 1
+        if recovered:
+            logger.info(f"Recovered {recovered} unfinished tasks for worker {worker_id}")
+        return recovered
+
+    async def recover_stale(self) -> int:
+        """
+        Requeue the tasks of every worker whose heartbeat has expired.
+
+        Returns:
+            Number of tasks requeued
+        """
+        recovered = 0
+        for worker_id in await self.backend.smembers(WORKERS_KEY):
+            if await self.backend.exists(HEARTBEAT_KEY.format(worker_id=worker_id)):
+                continue
+            logger.warning(f"Worker {worker_id} stopped beating, requeuing its tasks")
+            recovered += await self.recover(worker_id)
+            # Forgotten until it beats again
+            await self.backend.srem(WORKERS_KEY, worker_id)
+        return recovered
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent dead-lettered tasks, newest first."""
+        return [json.loads(raw) for raw in await self.backend.range(DEAD_LETTER_KEY, 0, limit - 1)]
+
+    async def _promote_due(self) -> None:
+        for raw in await self.backend.pop_due(DELAYED_KEY, time.time()):
+            await self.backend.push(QUEUE_KEY, raw)
+
+    async def _publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        try:
+            await self.backend.publish(EVENTS_KEY.format(job_id=job_id), json.dumps(event))
+        except Exception as e:
+            # Events are best effort; the job record stays authoritative
+            logger.error(f"Failed to publish event for job {job_id}: {e}")
+
+    async def _record(self, job_id: str, success: bool) -> None:
+        job_key = JOB_KEY.format(job_id=job_id)
+        await self.backend.hincrby(job_key, "succeeded" if success else "failed", 1)
+        done = await self.backend.hincrby(job_key, "done", 1)
+
+        job = await self.backend.hgetall(job_key)
+        if job and done >= int(job["total"]):
+            await self.backend.hset(job_key, {"status": "completed", "finished_at": time.time()})
+        elif job and job["status"] == "queued":
+            await self.backend.hset(job_key, {"status": "running"})
+
+        job = await self.get_job(job_id)
+        if job:
+            await self._publish(job_id, _progress_event(job))
+
+
+def _progress_event(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "progress",
+        "job_id": job["id"],
+        "status": job["status"],
+        "total": job["total"],
+        "succeeded": job["succeeded"],
+        "failed": job["failed"],
+    }
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue for the configured backend."""
+    global _job_queue
+    if _job_queue is None:
+        if settings.JOB_QUEUE_BACKEND == "memory":
+            backend = MemoryBackend()
+        else:
+            backend = RedisBackend.from_url(settings.REDIS_URL)
+        _job_queue = JobQueue(backend)
+    return _job_queue
@@ -0,0 +1,264 @@
+"""Chat completion backends the email parser can run against."""
+import abc
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from app.core.config import settings
+from app.services.tokenizer import tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Where the parser's system prompts embed the schema, and how packed prompts mark each email
+_SCHEMA_SECTION = re.compile(r"## JSON Schema[^\n]*:\n(.*?)\n\n## Important:", re.DOTALL)
+_PACKED_EMAIL_ID = re.compile(r"^### Email ID: (\d+)$", re.MULTILINE)
+
+
+class LLMBackend(abc.ABC):
+    """
+    A chat completion provider.
+
+    `create` and `acreate` take the keyword arguments of
+    `chat.completions.create` as a dict and return a `ChatCompletion`.
+    Failures are raised as the openai SDK's exception types so the rate
+    limiter can tell throttling and outages apart from broken requests.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @abc.abstractmethod
+    def create(self, request: Dict[str, Any]) -> ChatCompletion:
+        ...
+
+    @abc.abstractmethod
+    async def acreate(self, request: Dict[str, Any]) -> ChatCompletion:
+        ...
+
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI API, or any server speaking its chat completions protocol."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        api_key: Optional[str],
+        require_api_key: bool = True,
+        name: str = "openai",
+    ):
+        super().__init__(model)
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.require_api_key = require_api_key
+        self.client = None
+        self.async_client = None
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        if self.require_api_key and not self.api_key:
+            raise ValueError("OPENAI_API_KEY is not configured")
+        return {
+            # The SDK refuses to start without a key; local servers ignore it
+            "api_key": self.api_key or "not-needed",
+            "base_url": self.base_url,
+            "timeout": settings.LLM_REQUEST_TIMEOUT_SECONDS,
+            "max_retries": 0,  # Retries are handled by the rate limiter
+        }
+
+    def _get_client(self) -> OpenAI:
+        """Lazy initialization of the OpenAI client."""
+        if self.client is None:
+            self.client = OpenAI(**self._client_kwargs())
+        return self.client
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """Lazy initialization of the async OpenAI client."""
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(**self._client_kwargs())
+        return self.async_client
+
+    def create(self, request: Dict[str, Any]) -> ChatCompletion:
+        return self._get_client().chat.completions.create(**request)
+
+    async def acreate(self, request: Dict[str, Any]) -> ChatCompletion:
+        return await self._get_async_client().chat.completions.create(**request)
+
+
+class MockBackend(LLMBackend):
+    """
+    Deterministic stand-in for an LLM, for load tests without network or cost.
+
+    Output is a schema-shaped JSON object derived from a hash of the
+    prompt, so the same email always gets the same data. Latency is drawn
+    from a configurable distribution, and a share of calls fail with 500s
+    or 429s (with Retry-After) to exercise retries and backoff. A sampled
+    latency above LLM_REQUEST_TIMEOUT_SECONDS ends in a timeout error.
+    Token usage is counted with the real tokenizer.
+    """
+
+    name = "mock"
+
+    def __init__(
+        self,
+        model: str = "mock",
+        latency: Optional[str] = None,
+        latency_ms: Optional[float] = None,
+        latency_spread: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        rate_limit_rate: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(model)
+        self.latency = latency or settings.MOCK_LLM_LATENCY
+        self.latency_ms = settings.MOCK_LLM_LATENCY_MS if latency_ms is None else latency_ms
+        self.latency_spread = settings.MOCK_LLM_LATENCY_SPREAD if latency_spread is None else latency_spread
+        self.error_rate = settings.MOCK_LLM_ERROR_RATE if error_rate is None else error_rate
+        self.rate_limit_rate = settings.MOCK_LLM_RATE_LIMIT_RATE if rate_limit_rate is None else rate_limit_rate
+        self.seed = settings.MOCK_LLM_SEED if seed is None else seed
+        if self.latency not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown mock latency distribution: {self.latency}")
+
+        # Latency and failures follow one seeded sequence, so a run is reproducible
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def _sample_latency(self) -> float:
+        """Seconds the next call takes; MOCK_LLM_LATENCY_MS is the median."""
+        median = self.latency_ms / 1000
+        with self._lock:
+            if self.latency == "uniform":
+                return max(0.0, median * self._random.uniform(1 - self.latency_spread, 1 + self.latency_spread))
+            if self.latency == "lognormal":
+                # Long right tail, like real completion latencies
+                return median * math.exp(self._random.gauss(0, self.latency_spread))
+            return median
+
+    def _sample_error(self) -> Optional[Exception]:
+        with self._lock:
+            roll = self._random.random()
+            retry_after_ms = int(self._random.uniform(200, 2000))
+        request = httpx.Request("POST", "http://mock-llm/v1/chat/completions")
+        if roll < self.rate_limit_rate:
+            response = httpx.Response(429, headers={"retry-after-ms": str(retry_after_ms)}, request=request)
+            return openai.RateLimitError("Mock rate limit reached", response=response, body=None)
+        if roll < self.rate_limit_rate + self.error_rate:
+            response = httpx.Response(500, request=request)
+            return openai.InternalServerError("Mock server error", response=response, body=None)
+        return None
+
+    def _plan(self) -> Tuple[float, Optional[Exception]]:
+        """Decide how long the call takes and whether it fails."""
+        latency = self._sample_latency()
+        if latency > settings.LLM_REQUEST_TIMEOUT_SECONDS:
+            request = httpx.Request("POST", "http://mock-llm/v1/chat/completions")
+            return settings.LLM_REQUEST_TIMEOUT_SECONDS, openai.APITimeoutError(request=request)
+        return latency, self._sample_error()
+
+    def create(self, request: Dict[str, Any]) -> ChatCompletion:
+        latency, error = self._plan()
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        return self.complete(request)
+
+    async def acreate(self, request: Dict[str, Any]) -> ChatCompletion:
+        latency, error = self._plan()
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        return self.complete(request)
+
+    def complete(self, request: Dict[str, Any]) -> ChatCompletion:
+        """Build the completion for a request, without latency or failures."""
+        system_prompt = request["messages"][0]["content"]
+        user_prompt = request["messages"][-1]["content"]
+
+        match = _SCHEMA_SECTION.search(system_prompt)
+        schema = json.loads(match.group(1)) if match else {"type": "object", "properties": {}}
+
+        email_ids = _PACKED_EMAIL_ID.findall(user_prompt)
+        if email_ids:
+            sections = _PACKED_EMAIL_ID.split(user_prompt)[1:]
+            prompts = dict(zip(sections[::2], sections[1::2]))
+            data = {email_id: self._fake(schema, prompts[email_id]) for email_id in email_ids}
+        else:
+            data = self._fake(schema, user_prompt)
+
+        content = json.dumps(data)
+        prompt_tokens = sum(tokenizer.count(m["content"]) + 4 for m in request["messages"])
+        completion_tokens = tokenizer.count(content)
+        return ChatCompletion.model_validate({
+            "id": f"chatcmpl-mock-{hashlib.blake2b(user_prompt.encode(), digest_size=8).hexdigest()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", self.model),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _fake(self, schema: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+        digest = hashlib.blake2b(f"{self.seed}:{prompt}".encode(), digest_size=8).digest()
+        return self._fake_value(schema, random.Random(digest), "")
+
+    def _fake_value(self, spec: Dict[str, Any], rng: random.Random, name: str) -> Any:
+        kind = spec.get("type")
+        if kind == "object":
+            required = set(spec.get("required") or [])
+            return {
+                key: self._fake_value(sub, rng, key)
+                # Optional fields are sometimes absent from an email
+                if key in required or rng.random() < 0.7 else None
+                for key, sub in (spec.get("properties") or {}).items()
+            }
+        if kind == "string":
+            return f"{name or 'value'}-{rng.randrange(10_000):04d}"
+        if kind == "number":
+            return round(rng.uniform(1, 1000), 2)
+        if kind == "integer":
+            return rng.randrange(1, 1000)
+        if kind == "boolean":
+            return rng.random() < 0.5
+        return None
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Build the backend selected by LLM_BACKEND."""
+    name = name or settings.LLM_BACKEND
+    if name == "openai":
+        return OpenAIBackend(settings.LLM_MODEL, settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY)
+    if name == "local":
+        return OpenAIBackend(
+            settings.LOCAL_LLM_MODEL,
+            settings.LOCAL_LLM_BASE_URL,
+            settings.LOCAL_LLM_API_KEY,
+            require_api_key=False,
+            name="local",
+        )
+    if name == "mock":
+        return MockBackend()
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
@@ -0,0 +1,293 @@
+"""Near-duplicate email detection with SimHash, for reusing template parses."""
+import hashlib
+import logging
+import re
+from collections import Counter
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.email import Email, EmailStatus
+from app.services.email_normalizer import normalize_email
+from app.services.pre_extractor import schema_paths
+from app.services.schema_registry import CompiledSchema
+
+logger = logging.getLogger(__name__)
+
+# 64-bit signatures split into four 16-bit bands: any two signatures within
+# Hamming distance 3 agree exactly on at least one band, and most within 6 do.
+# The bands are stored in indexed columns (see Email.simhash_band0..3).
+SIMHASH_BITS = 64
+BAND_BITS = 16
+BANDS = SIMHASH_BITS // BAND_BITS
+_BAND_MASK = (1 << BAND_BITS) - 1
+BAND_COLUMNS = [Email.simhash_band0, Email.simhash_band1, Email.simhash_band2, Email.simhash_band3]
+
+# Most recent emails compared per lookup: a band shared by thousands of
+# emails (near-empty bodies) says little about any one of them
+MAX_CANDIDATES = 1000
+# Rows whose signature is computed per commit when filling in missing ones
+SIGNATURE_BACKFILL_CHUNK = 1000
+
+# Recorded as the parsing model when every field came from the sibling
+NEAR_DUPLICATE_MODEL = "near-duplicate"
+
+# Statuses whose data can be reused by a template sibling
+REFERENCE_STATUSES = [EmailStatus.PARSED, EmailStatus.REVIEWED]
+
+_WORD = re.compile(r"\w+")
+
+# The parts of a templated email that change per recipient are masked out
+# of the signature so siblings hash (nearly) the same
+_GREETING = re.compile(r"^\s*(hi|hello|hey|dear|greetings|good (morning|afternoon|evening))\b[^\n]{0,60}$", re.IGNORECASE | re.MULTILINE)
+_VARIABLE_PARTS = [
+    (re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b"), " emailaddr "),
+    (re.compile(r"\bhttps?://\S+|\b(?:www\.)?(?:[a-z0-9-]+\.)+[a-z]{2,}\b", re.IGNORECASE), " domainname "),
+    (re.compile(r"[$€£]?\d[\d,.]*[kKmM%+]?"), " number "),
+]
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text over word counts.
+
+    Similar texts get signatures that differ in few bits; a template
+    with a different greeting, site name or price typically lands within
+    a few bits, while unrelated emails differ in around 30.
+    """
+    features = Counter(_tokens(text))
+    if not features:
+        return 0
+
+    weights = [0] * SIMHASH_BITS
+    for feature, count in features.items():
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _template_text(text: str) -> str:
+    """Mask greetings, addresses, domains and numbers, which vary between template sends."""
+    text = _GREETING.sub(" ", text, count=1)
+    for pattern, placeholder in _VARIABLE_PARTS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def email_simhash(body_text: str, body_html: Optional[str] = None) -> int:
+    """
+    Signature for an email, as stored in `Email.simhash`.
+
+    Computed over the normalized body, so quoted history and footers
+    don't count, with per-recipient details masked. Stored as a signed
+    64-bit integer to fit a BIGINT column.
+    """
+    value = simhash(_template_text(normalize_email(body_text, body_html)))
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def _unsigned(value: int) -> int:
+    return value & ((1 << SIMHASH_BITS) - 1)
+
+
+def signature_bands(signature: int) -> List[int]:
+    """The four 16-bit bands of a signature, as in the `simhash_band*` columns."""
+    signature = _unsigned(signature)
+    return [signature >> (band * BAND_BITS) & _BAND_MASK for band in range(BANDS)]
+
+
+def leaf_paths(data: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """Flatten nested parsed data to dotted path -> value."""
+    leaves = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            leaves.update(leaf_paths(value, f"{prefix}{key}."))
+        else:
+            leaves[f"{prefix}{key}"] = value
+    return leaves
+
+
+def restrict_schema(schema: Dict[str, Any], paths: Set[str], prefix: str = "") -> Dict[str, Any]:
+    """A copy of a JSON schema with only the given dotted leaf paths."""
+    properties = {}
+    for name, spec in (schema.get("properties") or {}).items():
+        path = f"{prefix}{name}"
+        if isinstance(spec, dict) and spec.get("type") == "object" and "properties" in spec:
+            sub = restrict_schema(spec, paths, f"{path}.")
+            if sub["properties"]:
+                properties[name] = sub
+        elif path in paths:
+            properties[name] = spec
+
+    restricted = {k: v for k, v in schema.items() if k not in ("properties", "required")}
+    restricted["properties"] = properties
+    required = [r for r in schema.get("required") or [] if r in properties]
+    if required:
+        restricted["required"] = required
+    return restricted
+
+
+class NearDuplicateFinder:
+    """
+    Finds the closest already-parsed template sibling of an email.
+
+    Candidates are parsed and reviewed emails sharing at least one band
+    with the email's signature, looked up through the indexed
+    `simhash_band*` columns the database derives from `Email.simhash`.
+    Nothing is held in memory, and every process sees the others'
+    results as soon as they commit. Signatures are computed when emails
+    are written; `python -m app.signatures` fills them in for older ones.
+    Methods do blocking database work; call them from a thread when
+    running on the event loop.
+    """
+
+    def nearest(
+        self,
+        db,
+        signature: int,
+        schema_version: Optional[int],
+        max_distance: int,
+        limit: int = 5,
+        exclude: Optional[int] = None,
+    ) -> List[Tuple[int, int]]:
+        """Returns up to `limit` (email ID, distance) pairs, closest first."""
+        bands = signature_bands(signature)
+        query = db.query(Email.id, Email.simhash).filter(
+            Email.status.in_(REFERENCE_STATUSES),
+            Email.schema_version == schema_version,
+            or_(*(column == band for column, band in zip(BAND_COLUMNS, bands))),
+        )
+        if exclude is not None:
+            query = query.filter(Email.id != exclude)
+        rows = query.order_by(Email.id.desc()).limit(MAX_CANDIDATES).all()
+
+        signature = _unsigned(signature)
+        matches = [(row.id, (_unsigned(row.simhash) ^ signature).bit_count()) for row in rows]
+        matches = [m for m in matches if m[1] <= max_distance]
+        matches.sort(key=lambda m: (m[1], -m[0]))  # Closest, then most recent
+        return matches[:limit]
+
+    def fill_missing_signatures(self, batch_size: int = SIGNATURE_BACKFILL_CHUNK) -> int:
+        """Compute signatures for emails stored before they were computed on write; returns how many."""
+        filled = 0
+        last_id = 0
+        db = SessionLocal()
+        try:
+            while True:
+                emails = (
+                    db.query(Email)
+                    .options(selectinload(Email.content))
+                    .filter(Email.simhash.is_(None), Email.id > last_id)
+                    .order_by(Email.id)
+                    .limit(batch_size)
+                    .all()
+                )
+                if not emails:
+                    break
+                last_id = emails[-1].id
+                for email in emails:
+                    if email.content is not None:
+                        email.simhash = email_simhash(email.content.body_text, email.content.body_html)
+                        filled += 1
+                db.commit()
+                logger.info(f"Filled in {filled} near-duplicate signatures")
+        finally:
+            db.close()
+        return filled
+
+    def find_reference(
+        self,
+        email_id: int,
+        inputs: Dict[str, Any],
+        schema: CompiledSchema,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Find a template sibling of an email and work out what it can reuse.
+
+        A field is reusable (stable) when the sibling has a value for it
+        and none of its words are ones that appear in the sibling but not
+        in this email: a site name, price or contact that changed between
+        the two makes the field unstable. Fields the sibling left empty are
+        always asked again.
+
+        Returns:
+            None if no sibling parsed with the same schema version is close
+            enough, otherwise a dict with:
+                - reference_id: the sibling's email ID
+                - distance: Hamming distance between the signatures
+                - stable_data: the sibling's data, limited to stable fields
+                - unstable_paths: dotted paths the LLM still has to fill
+        """
+        db = SessionLocal()
+        try:
+            signature = db.query(Email.simhash).filter(Email.id == email_id).scalar()
+            if not signature:
+                return None  # Unknown, or an empty body
+
+            for reference_id, distance in self.nearest(
+                db, signature, schema.version, settings.NEAR_DUPLICATE_MAX_DISTANCE, exclude=email_id
+            ):
+                reference = (
+                    db.query(Email)
+                    .options(selectinload(Email.content))
+                    .filter(Email.id == reference_id)
+                    .first()
+                )
+                if not reference or reference.status not in REFERENCE_STATUSES or reference.content is None:
+                    continue
+                data = reference.corrected_data or reference.parsed_data
+                if not isinstance(data, dict):
+                    continue
+                return self._split_fields(reference, data, distance, inputs, schema)
+            return None
+        finally:
+            db.close()
+
+    def _split_fields(
+        self,
+        reference: Email,
+        data: Dict[str, Any],
+        distance: int,
+        inputs: Dict[str, Any],
+        schema: CompiledSchema,
+    ) -> Dict[str, Any]:
+        reference_text = " ".join([
+            reference.subject or "", reference.sender or "", reference.sender_name or "",
+            reference.content.normalized_text or reference.content.body_text or "",
+        ])
+        email_text = " ".join([
+            inputs["subject"], inputs["sender_email"], inputs["sender_name"], inputs["email_body"],
+        ])
+        removed = set(_tokens(reference_text)) - set(_tokens(email_text))
+
+        # A null may only mean the sibling didn't mention the field; never reuse one
+        stable = {
+            path: value
+            for path, value in leaf_paths(data).items()
+            if value is not None and not set(_tokens(str(value))) & removed
+        }
+        unstable = [path for path in schema_paths(schema.schema) if path not in stable]
+
+        logger.info(
+            f"Email {reference.id} is a template sibling (distance {distance}); "
+            f"reusing {len(stable)} fields, re-parsing {len(unstable)}"
+        )
+        return {
+            "reference_id": reference.id,
+            "distance": distance,
+            "stable_data": stable,
+            "unstable_paths": unstable,
+        }
+
+
+# Singleton instance
+near_duplicates = NearDuplicateFinder()
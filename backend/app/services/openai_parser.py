@@ -1,30 +1,27 @@
-"""OpenAI-based email parser service."""
+"""LLM-based email parser service."""
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
-from openai import OpenAI
 
 from app.core.config import settings
+from app.services.llm_backends import LLMBackend, create_backend
+from app.services.rate_limiter import rate_limiter
+from app.services.tokenizer import tokenizer
 
 logger = logging.getLogger(__name__)
 
 
 class EmailParser:
-    """Service for parsing emails using OpenAI."""
+    """Service for parsing emails with the configured LLM backend."""
     
-    def __init__(self):
-        self.client = None
-        self.model = "gpt-4-turbo-preview"  # Supports JSON mode
-        
-    def _get_client(self) -> OpenAI:
-        """Lazy initialization of OpenAI client."""
-        if self.client is None:
-            if not settings.OPENAI_API_KEY:
-                raise ValueError("OPENAI_API_KEY is not configured")
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        return self.client
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        self.backend = backend or create_backend()
     
+    @property
+    def model(self) -> str:
+        return self.backend.model
+        
     def _build_system_prompt(self, schema: Dict[str, Any]) -> str:
         """Build the system prompt for email parsing."""
         return f"""You are an expert email parser specialized in extracting structured data from commercial offer emails.
@@ -43,6 +40,7 @@ Use ALL available information to extract the required fields.
 5. For nested objects, include all sub-fields even if null
 6. The contact_email should come from the sender's email address if not explicitly mentioned in body
 7. The contact_name should come from the sender's name if not explicitly mentioned in body
+8. Omit any field listed under "Pre-extracted Fields"; those values are filled in automatically
 
 ## JSON Schema to follow:
 {json.dumps(schema, indent=2)}
@@ -50,9 +48,40 @@ Use ALL available information to extract the required fields.
 ## Important:
 - Do NOT include any text before or after the JSON
 - Do NOT wrap the JSON in markdown code blocks
-- Ensure all required fields from the schema are present
+- Ensure all required fields from the schema are present, except pre-extracted ones
 - Use the email metadata (From, Subject, Date) to supplement missing information"""
 
+    def _build_packed_system_prompt(self, schema: Dict[str, Any]) -> str:
+        """Build the system prompt for parsing several emails in one request."""
+        return f"""You are an expert email parser specialized in extracting structured data from commercial offer emails.
+
+Your task is to analyze SEVERAL emails, each with its own content AND metadata, and extract information from each one according to the provided JSON schema.
+
+## Input Format:
+You will receive multiple emails. Each starts with a line "### Email ID: <id>", followed by its metadata (subject, sender info, date) and its body.
+Treat every email independently - never mix information between emails.
+
+## Output Requirements:
+1. Return ONLY a valid JSON object whose keys are the email IDs (as strings) and whose values are the extracted data for that email
+2. Each value must match the schema structure
+3. Include every email ID from the input exactly once
+4. Use null for any fields not found in an email
+5. Be precise with numbers, currencies, and dates
+6. Extract exact values when possible, don't paraphrase
+7. For nested objects, include all sub-fields even if null
+8. The contact_email should come from the sender's email address if not explicitly mentioned in body
+9. The contact_name should come from the sender's name if not explicitly mentioned in body
+10. Omit any field listed under an email's "Pre-extracted Fields"; those values are filled in automatically
+
+## JSON Schema for each email:
+{json.dumps(schema, indent=2)}
+
+## Important:
+- Do NOT include any text before or after the JSON
+- Do NOT wrap the JSON in markdown code blocks
+- Ensure all required fields from the schema are present for every email, except pre-extracted ones
+- Use each email's metadata (From, Subject, Date) to supplement its missing information"""
+
     def _build_user_prompt(
         self, 
         email_body: str, 
@@ -61,8 +90,16 @@ Use ALL available information to extract the required fields.
         sender_name: str = "",
         received_at: Optional[datetime] = None,
         headers: Optional[Dict[str, str]] = None,
-    ) -> str:
-        """Build the user prompt with email content and all metadata."""
+        known_fields: Optional[Dict[str, Any]] = None,
+        candidate_fields: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the user prompt with email content and all metadata.
+        
+        The prompt is fitted to PROMPT_TOKEN_BUDGET tokens; if the body
+        doesn't fit, its middle is dropped. Returns the prompt and the
+        truncation stats from the tokenizer.
+        """
         prompt_parts = ["## Email Metadata:\n"]
         
         # Add all available metadata
@@ -88,15 +125,104 @@ Use ALL available information to extract the required fields.
             if headers.get("organization"):
                 prompt_parts.append(f"**Organization:** {headers['organization']}")
         
-        prompt_parts.append(f"\n## Email Body:\n{email_body}")
+        # Values the pre-extractor already read from the email
+        if known_fields:
+            prompt_parts.append("\n## Pre-extracted Fields (leave out of your output):\n")
+            prompt_parts.extend(f"- {path}: {json.dumps(value)}" for path, value in known_fields.items())
+        if candidate_fields:
+            prompt_parts.append("\n## Suggested Values (use only if the email supports them):\n")
+            prompt_parts.extend(f"- {path}: {json.dumps(value)}" for path, value in candidate_fields.items())
+        
+        prompt_parts.append("\n## Email Body:\n")
+        metadata = "\n".join(prompt_parts)
         
-        # Truncate if too long (keep under ~6000 tokens worth)
-        full_prompt = "\n".join(prompt_parts)
-        max_chars = 20000  # Roughly 5000 tokens
-        if len(full_prompt) > max_chars:
-            full_prompt = full_prompt[:max_chars] + "\n\n[Email truncated due to length]"
+        # Whatever the metadata doesn't use is left for the body
+        body_budget = settings.PROMPT_TOKEN_BUDGET - tokenizer.count(metadata)
+        body, prompt_stats = tokenizer.truncate_middle(email_body, body_budget)
         
-        return full_prompt
+        return metadata + body, prompt_stats
+
+    def _build_request(
+        self,
+        email_body: str,
+        schema: Dict[str, Any],
+        subject: str = "",
+        sender_email: str = "",
+        sender_name: str = "",
+        received_at: Optional[datetime] = None,
+        headers: Optional[Dict[str, str]] = None,
+        known_fields: Optional[Dict[str, Any]] = None,
+        candidate_fields: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Build the chat completion request arguments and prompt stats for an email."""
+        if system_prompt is None:
+            system_prompt = self._build_system_prompt(schema)
+        user_prompt, prompt_stats = self._build_user_prompt(
+            email_body=email_body,
+            subject=subject,
+            sender_email=sender_email,
+            sender_name=sender_name,
+            received_at=received_at,
+            headers=headers,
+            known_fields=known_fields,
+            candidate_fields=candidate_fields,
+        )
+        
+        logger.info(f"Parsing email - Subject: {subject[:50] if subject else 'N/A'}...")
+        if prompt_stats["truncated"]:
+            logger.debug(f"Email body truncated, {prompt_stats['tokens_saved']} tokens saved")
+        
+        request = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1,  # Low temperature for consistent extraction
+            "max_tokens": 2000,
+        }
+        return request, prompt_stats
+    
+    def _estimate_tokens(self, request: Dict[str, Any]) -> int:
+        """Tokens a request counts against the rate limit: its prompt plus max_tokens."""
+        prompt_tokens = sum(tokenizer.count(m["content"]) + 4 for m in request["messages"])
+        return prompt_tokens + request.get("max_tokens", 0)
+    
+    def _handle_response(self, response, prompt_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a chat completion response into a parse result."""
+        # Extract the response
+        content = response.choices[0].message.content
+        
+        # Parse the JSON response
+        try:
+            parsed_data = json.loads(content)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse OpenAI response as JSON: {e}")
+            return {
+                "success": False,
+                "error": f"Invalid JSON response from OpenAI: {str(e)}",
+                "raw_response": content,
+                "model": self.model,
+            }
+        
+        # Get usage stats
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens,
+            "completion_tokens": response.usage.completion_tokens,
+            "total_tokens": response.usage.total_tokens,
+            "tokens_saved": prompt_stats["tokens_saved"],
+        }
+        
+        logger.info(f"Successfully parsed email. Tokens used: {usage['total_tokens']}")
+        
+        return {
+            "success": True,
+            "data": parsed_data,
+            "model": self.model,
+            "usage": usage,
+        }
 
     def parse_email(
         self,
@@ -107,6 +233,9 @@ Use ALL available information to extract the required fields.
         sender_name: str = "",
         received_at: Optional[datetime] = None,
         headers: Optional[Dict[str, str]] = None,
+        known_fields: Optional[Dict[str, Any]] = None,
+        candidate_fields: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Parse an email and extract structured data.
@@ -119,6 +248,9 @@ Use ALL available information to extract the required fields.
             sender_name: Sender's display name
             received_at: When the email was received
             headers: Additional email headers (Reply-To, CC, etc.)
+            known_fields: Pre-extracted values the model should not repeat
+            candidate_fields: Pre-extracted values for the model to verify
+            system_prompt: Pre-rendered system prompt for `schema`, if cached
             
         Returns:
             Dictionary containing:
@@ -129,62 +261,69 @@ Use ALL available information to extract the required fields.
                 - usage: token usage stats
         """
         try:
-            client = self._get_client()
-            
-            system_prompt = self._build_system_prompt(schema)
-            user_prompt = self._build_user_prompt(
+            request, prompt_stats = self._build_request(
                 email_body=email_body,
+                schema=schema,
                 subject=subject,
                 sender_email=sender_email,
                 sender_name=sender_name,
                 received_at=received_at,
                 headers=headers,
+                known_fields=known_fields,
+                candidate_fields=candidate_fields,
+                system_prompt=system_prompt,
             )
-            
-            logger.info(f"Parsing email - Subject: {subject[:50] if subject else 'N/A'}...")
-            logger.debug(f"User prompt length: {len(user_prompt)} chars")
-            
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.1,  # Low temperature for consistent extraction
-                max_tokens=2000,
+            response = rate_limiter.call(
+                lambda: self.backend.create(request),
+                self._estimate_tokens(request),
             )
+            return self._handle_response(response, prompt_stats)
             
-            # Extract the response
-            content = response.choices[0].message.content
-            
-            # Parse the JSON response
-            try:
-                parsed_data = json.loads(content)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse OpenAI response as JSON: {e}")
-                return {
-                    "success": False,
-                    "error": f"Invalid JSON response from OpenAI: {str(e)}",
-                    "raw_response": content,
-                    "model": self.model,
-                }
-            
-            # Get usage stats
-            usage = {
-                "prompt_tokens": response.usage.prompt_tokens,
-                "completion_tokens": response.usage.completion_tokens,
-                "total_tokens": response.usage.total_tokens,
-            }
-            
-            logger.info(f"Successfully parsed email. Tokens used: {usage['total_tokens']}")
-            
+        except Exception as e:
+            logger.error(f"Error parsing email: {str(e)}")
             return {
-                "success": True,
-                "data": parsed_data,
+                "success": False,
+                "error": str(e),
                 "model": self.model,
-                "usage": usage,
             }
+    
+    async def aparse_email(
+        self,
+        email_body: str,
+        schema: Dict[str, Any],
+        subject: str = "",
+        sender_email: str = "",
+        sender_name: str = "",
+        received_at: Optional[datetime] = None,
+        headers: Optional[Dict[str, str]] = None,
+        known_fields: Optional[Dict[str, Any]] = None,
+        candidate_fields: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of parse_email using the backend's async client.
+        
+        Takes the same arguments and returns the same result dictionary,
+        but never blocks the event loop while waiting on the API.
+        """
+        try:
+            request, prompt_stats = self._build_request(
+                email_body=email_body,
+                schema=schema,
+                subject=subject,
+                sender_email=sender_email,
+                sender_name=sender_name,
+                received_at=received_at,
+                headers=headers,
+                known_fields=known_fields,
+                candidate_fields=candidate_fields,
+                system_prompt=system_prompt,
+            )
+            response = await rate_limiter.acall(
+                lambda: self.backend.acreate(request),
+                self._estimate_tokens(request),
+            )
+            return self._handle_response(response, prompt_stats)
             
         except Exception as e:
             logger.error(f"Error parsing email: {str(e)}")
@@ -194,6 +333,83 @@ Use ALL available information to extract the required fields.
                 "model": self.model,
             }
 
+    async def aparse_packed(
+        self,
+        user_prompts: Dict[int, str],
+        packed_system_prompt: str,
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Parse several emails with a single completion.
+        
+        Args:
+            user_prompts: Email ID -> user prompt built by _build_user_prompt
+            packed_system_prompt: Output of _build_packed_system_prompt
+            
+        Returns:
+            Email ID -> parse result for every email that came back as a
+            JSON object. Emails that are missing or malformed in the
+            response (or all of them, if the request fails) are left out
+            so the caller can parse them individually. Token usage is
+            split evenly across the returned emails.
+        """
+        try:
+            content = "\n\n".join(
+                f"### Email ID: {email_id}\n{prompt}" for email_id, prompt in user_prompts.items()
+            )
+            
+            logger.info(f"Parsing {len(user_prompts)} emails in one packed request")
+            
+            request = {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": packed_system_prompt},
+                    {"role": "user", "content": content}
+                ],
+                "response_format": {"type": "json_object"},
+                "temperature": 0.1,  # Low temperature for consistent extraction
+                "max_tokens": min(4096, settings.PACK_OUTPUT_TOKENS_PER_EMAIL * len(user_prompts)),
+            }
+            response = await rate_limiter.acall(
+                lambda: self.backend.acreate(request),
+                self._estimate_tokens(request),
+            )
+            parsed = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Packed parse failed, falling back to single parses: {str(e)}")
+            return {}
+        
+        if not isinstance(parsed, dict):
+            logger.error("Packed parse returned a non-object, falling back to single parses")
+            return {}
+        
+        results = {}
+        for email_id in user_prompts:
+            data = parsed.get(str(email_id))
+            if isinstance(data, dict):
+                results[email_id] = data
+        
+        missing = len(user_prompts) - len(results)
+        if missing:
+            logger.warning(f"Packed parse missing {missing} of {len(user_prompts)} emails")
+        
+        share = max(len(results), 1)
+        usage = {
+            "prompt_tokens": response.usage.prompt_tokens // share,
+            "completion_tokens": response.usage.completion_tokens // share,
+            "total_tokens": response.usage.total_tokens // share,
+        }
+        
+        return {
+            email_id: {
+                "success": True,
+                "data": data,
+                "model": self.model,
+                "usage": dict(usage),
+                "packed": True,
+            }
+            for email_id, data in results.items()
+        }
+
 
 # Singleton instance
 email_parser = EmailParser()
@@ -218,3 +434,24 @@ def parse_email(
         received_at=received_at,
         headers=headers,
     )
+
+
+async def aparse_email(
+    email_body: str,
+    schema: Dict[str, Any],
+    subject: str = "",
+    sender_email: str = "",
+    sender_name: str = "",
+    received_at: Optional[datetime] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """Convenience function to parse an email without blocking the event loop."""
+    return await email_parser.aparse_email(
+        email_body=email_body,
+        schema=schema,
+        subject=subject,
+        sender_email=sender_email,
+        sender_name=sender_name,
+        received_at=received_at,
+        headers=headers,
+    )
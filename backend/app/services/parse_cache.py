@@ -0,0 +1,240 @@
+"""Content-addressed cache of parse results."""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.parse_cache import ParseCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Prune expired and excess rows once every this many writes
+PRUNE_EVERY_WRITES = 100
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Headers the user prompt includes
+PROMPT_HEADERS = ("reply-to", "cc", "organization")
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace so formatting-only differences share a key."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def make_cache_key(
+    email_body: str,
+    subject: str,
+    sender_email: str,
+    schema_fingerprint: str,
+    model: str,
+    sender_name: str = "",
+    headers: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Build the cache key for a parse.
+
+    The key covers the inputs of the user prompt that fields are read
+    from (see EmailParser._build_user_prompt): the normalized body and
+    subject, the sender and display name and the headers it includes,
+    plus the schema and the model. Display names and Reply-To/Organization
+    headers drive contact and company fields, so two senders of one
+    template must not share an entry. The date the prompt shows is left
+    out: no schema field is read from it, and every copy of a template
+    arrives at a different time, so keying on it would keep copies sent to
+    different inboxes from sharing a parse.
+    """
+    payload = json.dumps({
+        "body": _normalize(email_body),
+        "subject": _normalize(subject),
+        "sender": (sender_email or "").strip().lower(),
+        "sender_name": _normalize(sender_name),
+        "headers": {name: (headers or {}).get(name) or None for name in PROMPT_HEADERS},
+        "schema": schema_fingerprint,
+        "model": model,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ParseCache:
+    """
+    Two-tier parse result cache.
+
+    Lookups go to an in-process LRU first and fall back to the
+    `parse_cache_entries` table, which is shared by the API and all
+    workers. Entries expire after `PARSE_CACHE_TTL_SECONDS`; the table is
+    pruned back to `PARSE_CACHE_MAX_ENTRIES` rows, dropping the least
+    recently used first.
+
+    Methods do blocking database work; call them from a thread when
+    running on the event loop.
+    """
+
+    def __init__(
+        self,
+        memory_size: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.memory_size = memory_size or settings.PARSE_CACHE_MEMORY_SIZE
+        self.ttl_seconds = ttl_seconds or settings.PARSE_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or settings.PARSE_CACHE_MAX_ENTRIES
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, entry)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result. Returns {"data", "model"} or None."""
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[0] > time.time():
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return cached[1]
+            if cached:
+                del self._memory[key]
+
+        db = SessionLocal()
+        try:
+            row = db.query(ParseCacheEntry).filter(
+                ParseCacheEntry.key == key,
+                ParseCacheEntry.expires_at > datetime.utcnow(),
+            ).first()
+            if not row:
+                with self._lock:
+                    self.stats["misses"] += 1
+                return None
+
+            row.hit_count += 1
+            row.last_hit_at = datetime.utcnow()
+            entry = {"data": row.data, "model": row.parsing_model}
+            expires_at = row.expires_at
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self.stats["persistent_hits"] += 1
+            self._remember(key, entry, (expires_at - datetime.utcnow()).total_seconds())
+        return entry
+
+    def put(self, key: str, data: Dict[str, Any], model: Optional[str]) -> None:
+        """Store a successful parse result in both tiers."""
+        entry = {"data": data, "model": model}
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+
+        db = SessionLocal()
+        try:
+            # Upsert: another process may be storing the same template right now
+            statement = _INSERTS[db.bind.dialect.name](ParseCacheEntry).values(
+                key=key,
+                data=data,
+                parsing_model=model,
+                hit_count=0,
+                created_at=datetime.utcnow(),
+                expires_at=expires_at,
+            )
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[ParseCacheEntry.key],
+                set_={
+                    "data": statement.excluded.data,
+                    "parsing_model": statement.excluded.parsing_model,
+                    "created_at": statement.excluded.created_at,
+                    "expires_at": statement.excluded.expires_at,
+                },
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            self.stats["writes"] += 1
+            self._writes += 1
+            self._remember(key, entry, self.ttl_seconds)
+            should_prune = self._writes % PRUNE_EVERY_WRITES == 0
+
+        if should_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete expired rows and trim the table to `max_entries`."""
+        db = SessionLocal()
+        try:
+            removed = db.query(ParseCacheEntry).filter(
+                ParseCacheEntry.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+
+            excess = db.query(ParseCacheEntry).count() - self.max_entries
+            if excess > 0:
+                oldest = select(ParseCacheEntry.key).order_by(
+                    ParseCacheEntry.last_hit_at.asc().nullsfirst(),
+                    ParseCacheEntry.created_at.asc(),
+                ).limit(excess)
+                removed += db.query(ParseCacheEntry).filter(
+                    ParseCacheEntry.key.in_(oldest)
+                ).delete(synchronize_session=False)
+
+            db.commit()
+        finally:
+            db.close()
+
+        if removed:
+            logger.info(f"Pruned {removed} parse cache entries")
+            with self._lock:
+                self.stats["evictions"] += removed
+        return removed
+
+    def clear(self) -> None:
+        """Drop every cached result from both tiers."""
+        with self._lock:
+            self._memory.clear()
+
+        db = SessionLocal()
+        try:
+            db.query(ParseCacheEntry).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    def _remember(self, key: str, entry: Dict[str, Any], ttl_seconds: float) -> None:
+        # Caller holds self._lock
+        self._memory[key] = (time.time() + ttl_seconds, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+
+# Singleton instance
+parse_cache = ParseCache()
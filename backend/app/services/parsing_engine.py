@@ -0,0 +1,556 @@
+"""Async parsing engine for processing many emails concurrently."""
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, AsyncIterator, Set, Collection
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.email import Email, EmailStatus
+from app.services.email_leases import (
+    JOB_LEASE_PREFIX, default_lease_owner, email_leases, job_lease_owner, lease_expiry, lease_holder,
+)
+from app.services.email_normalizer import NORMALIZER_VERSION, normalize_email
+from app.services.near_duplicates import (
+    NEAR_DUPLICATE_MODEL, near_duplicates, email_simhash, leaf_paths, restrict_schema,
+)
+from app.services.openai_parser import email_parser
+from app.services.parse_cache import parse_cache, make_cache_key
+from app.services.response_cache import response_cache
+from app.services.pre_extractor import pre_extract, merge_known_fields
+from app.services.schema_registry import CompiledSchema
+from app.services.tokenizer import tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_inputs(email: Email) -> Dict[str, Any]:
+    """
+    Snapshot the fields the parse prompt needs from an email.
+
+    Normalizes the body first if it hasn't been normalized with the
+    current rules, storing the result with the content (the caller commits).
+    Loads `email.content` if it isn't loaded yet.
+    """
+    content = email.content
+    # Normalize once and keep the result with the content
+    if settings.NORMALIZE_EMAIL_BODIES and email.normalized_version != NORMALIZER_VERSION:
+        content.normalized_text = normalize_email(content.body_text, content.body_html)
+        email.normalized_version = NORMALIZER_VERSION
+
+    body = content.body_text
+    if settings.NORMALIZE_EMAIL_BODIES and content.normalized_text:
+        body = content.normalized_text
+
+    return {
+        "email_body": body,
+        "subject": email.subject or "",
+        "sender_email": email.sender or "",
+        "sender_name": email.sender_name or "",
+        "received_at": email.received_at,
+        "headers": content.headers,  # Additional headers like Reply-To, CC
+    }
+
+
+def apply_parse_result(
+    email: Email,
+    result: Dict[str, Any],
+    schema_version: Optional[int] = None,
+    model: Optional[str] = None,
+) -> None:
+    """
+    Copy a parse result onto an email record (the caller commits).
+
+    Args:
+        email: Email to update
+        result: Parse result
+        schema_version: Schema version the result follows
+        model: Model of the configured backend, recorded when the result
+            doesn't name the one that produced it
+    """
+    if result["success"]:
+        # Save parsed data and clear any previous corrections
+        email.parsed_data = result["data"]
+        email.parsing_model = result.get("model") or model
+        email.schema_version = schema_version
+        email.confidence_score = result.get("confidence")  # Only known for pre-extracted results
+        email.parsed_at = datetime.utcnow()
+        email.status = EmailStatus.PARSED
+        email.error_message = None
+        # Clear corrections when re-parsing - user wants fresh AI output
+        email.corrected_data = None
+        email.correction_diff = None
+        email.corrected_at = None
+    else:
+        email.status = EmailStatus.FAILED
+        email.error_message = result.get("error", "Unknown parsing error")
+    email.lease_owner = None
+    email.lease_expires_at = None
+
+
+class ParsingEngine:
+    """
+    Runs email parses against the async OpenAI client.
+
+    Each email gets its own database session, so one slow or failing
+    email never holds a transaction open for the rest of the batch.
+    Database work is pushed to a thread so the event loop stays free
+    while LLM calls are in flight.
+
+    Emails are leased to `lease_owner` while they're parsed (see
+    services/email_leases.py); an email another parser or another job
+    holds is skipped with error code "leased", and one reviewed since it
+    was queued with "reviewed". Leases are renewed every
+    PARSE_LEASE_HEARTBEAT_SECONDS until the result is saved.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, lease_owner: Optional[str] = None):
+        self.concurrency = concurrency or settings.PARSING_CONCURRENCY
+        self.lease_owner = lease_owner or default_lease_owner()
+        self._parsing: Set[int] = set()  # Emails this engine holds leases on
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def _begin(self, email_id: int, job_ids: Collection[str] = ()) -> Dict[str, Any]:
+        """Start parsing an email (see `_start`) and keep its lease renewed."""
+        if email_id in self._parsing:
+            return {"error_code": "leased", "error": "Email is already being parsed by this worker"}
+        self._parsing.add(email_id)
+        try:
+            inputs = await asyncio.to_thread(self._start, email_id, job_ids)
+        except BaseException:
+            self._parsing.discard(email_id)
+            raise
+        if "error_code" in inputs:
+            self._parsing.discard(email_id)
+            return inputs
+
+        loop = asyncio.get_running_loop()
+        if self._heartbeat is None or self._heartbeat.done() or self._heartbeat.get_loop() is not loop:
+            self._heartbeat = loop.create_task(self._renew_leases())
+        return inputs
+
+    async def _renew_leases(self) -> None:
+        while self._parsing:
+            await asyncio.sleep(settings.PARSE_LEASE_HEARTBEAT_SECONDS)
+            held = list(self._parsing)
+            try:
+                renewed = await asyncio.to_thread(email_leases.renew, self.lease_owner, held)
+            except Exception as e:
+                logger.error(f"Failed to renew parse leases: {e}")
+                continue
+            lost = (set(held) & self._parsing) - set(renewed)  # Ignoring parses finished meanwhile
+            if lost:
+                logger.warning(f"Lost the parse lease on emails {sorted(lost)}")
+
+    def _start(self, email_id: int, job_ids: Collection[str] = ()) -> Dict[str, Any]:
+        """
+        Lease the email, mark it as parsing and snapshot the fields the prompt needs.
+
+        Args:
+            email_id: Email to parse
+            job_ids: Jobs the email was queued by; their leases are taken over
+        """
+        db = SessionLocal()
+        try:
+            email = (
+                db.query(Email)
+                .options(joinedload(Email.content))
+                .filter(Email.id == email_id)
+                .with_for_update(of=Email)
+                .first()
+            )
+            if not email:
+                return {"error_code": "not_found", "error": "Email not found"}
+
+            # Queued emails are leased to their job until a worker takes them over
+            holder = lease_holder(email)
+            if holder and holder != self.lease_owner and holder not in {job_lease_owner(j) for j in job_ids}:
+                if holder.startswith(JOB_LEASE_PREFIX):
+                    return {"error_code": "leased", "error": "Email was queued again by another job"}
+                return {"error_code": "leased", "error": f"Email is being parsed by {holder}"}
+            if email.status == EmailStatus.REVIEWED:
+                # Corrected after it was queued; a parse would overwrite the correction
+                return {"error_code": "reviewed", "error": "Email was reviewed since it was queued"}
+
+            # Check if email has content
+            content = email.content
+            if content is None or (not content.body_text and not content.body_html):
+                apply_parse_result(email, {"success": False, "error": "Email has no content to parse"})
+                db.commit()
+                return {"error_code": "no_content", "error": "Email has no content to parse"}
+
+            inputs = prompt_inputs(email)
+            if email.simhash is None:
+                email.simhash = email_simhash(content.body_text, content.body_html)
+            email.status = EmailStatus.PARSING
+            email.lease_owner = self.lease_owner
+            email.lease_expires_at = lease_expiry()
+            db.commit()
+            return inputs
+        finally:
+            db.close()
+
+    def _finish(self, email_id: int, result: Dict[str, Any], schema_version: Optional[int] = None) -> None:
+        """Persist a parse result onto the email record and release its lease."""
+        db = SessionLocal()
+        try:
+            email = db.query(Email).filter(Email.id == email_id).with_for_update().first()
+            if not email:
+                return
+
+            holder = lease_holder(email)
+            if holder and holder != self.lease_owner:
+                # Our lease expired and another parser or job claimed the email; its result wins
+                logger.warning(f"Dropping result for email {email_id}: now leased to {holder}")
+                return
+            if email.status == EmailStatus.REVIEWED:
+                logger.warning(f"Dropping result for email {email_id}: reviewed while it was parsed")
+                return
+
+            apply_parse_result(email, result, schema_version, model=email_parser.model)
+            db.commit()
+            response_cache.invalidate(email_id)
+        finally:
+            db.close()
+
+    async def parse_one(self, email_id: int, schema: CompiledSchema, job_ids: Collection[str] = ()) -> Dict[str, Any]:
+        """
+        Parse a single email and save the result.
+
+        Args:
+            email_id: Email to parse
+            schema: Schema to parse against
+            job_ids: Jobs the email was queued by, whose lease may be taken over
+
+        Returns:
+            Dictionary containing:
+                - email_id: the parsed email
+                - success: bool
+                - parsed_data, model, usage, cached, packed, pre_extracted,
+                  near_duplicate_of, schema_version and validation_errors
+                  (if successful)
+                - error, error_code (if failed)
+        """
+        try:
+            inputs = await self._begin(email_id, job_ids)
+            if "error_code" in inputs:
+                return {"email_id": email_id, "success": False, **inputs}
+
+            result = await self._parse_cached(email_id, inputs, schema)
+            return await self._complete(email_id, result, schema)
+        except Exception as e:
+            return await self._fail(email_id, e)
+
+    async def _complete(self, email_id: int, result: Dict[str, Any], schema: CompiledSchema) -> Dict[str, Any]:
+        """Save a parse result and format it for the caller."""
+        await asyncio.to_thread(self._finish, email_id, result, schema.version)
+        self._parsing.discard(email_id)
+
+        if not result["success"]:
+            return {
+                "email_id": email_id,
+                "success": False,
+                "error_code": "parse_failed",
+                "error": result.get("error", "Unknown error"),
+            }
+
+        return {
+            "email_id": email_id,
+            "success": True,
+            "parsed_data": result["data"],
+            "model": result.get("model"),
+            "usage": result.get("usage"),
+            "cached": result.get("cached", False),
+            "packed": result.get("packed", False),
+            "pre_extracted": result.get("pre_extracted", False),
+            "near_duplicate_of": result.get("reference_id"),
+            "schema_version": schema.version,
+            "validation_errors": schema.validate(result["data"]),
+        }
+
+    async def _fail(self, email_id: int, error: Exception) -> Dict[str, Any]:
+        logger.error(f"Unexpected error parsing email {email_id}: {error}")
+        await asyncio.to_thread(self._finish, email_id, {"success": False, "error": str(error)})
+        self._parsing.discard(email_id)
+        return {"email_id": email_id, "success": False, "error_code": "error", "error": str(error)}
+
+    def _cache_key(self, inputs: Dict[str, Any], schema: CompiledSchema) -> str:
+        return make_cache_key(
+            email_body=inputs["email_body"],
+            subject=inputs["subject"],
+            sender_email=inputs["sender_email"],
+            sender_name=inputs["sender_name"],
+            headers=inputs["headers"],
+            schema_fingerprint=schema.fingerprint,
+            model=email_parser.model,
+        )
+
+    async def _cache_get(self, inputs: Dict[str, Any], schema: CompiledSchema) -> Optional[Dict[str, Any]]:
+        """Look up a parse in the result cache, formatted as a parse result."""
+        if not settings.PARSE_CACHE_ENABLED:
+            return None
+
+        key = self._cache_key(inputs, schema)
+        cached = await asyncio.to_thread(parse_cache.get, key)
+        if not cached:
+            return None
+
+        logger.info(f"Parse cache hit for key {key[:12]}")
+        return {
+            "success": True,
+            "data": cached["data"],
+            "model": cached["model"],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            "cached": True,
+        }
+
+    async def _cache_put(self, inputs: Dict[str, Any], schema: CompiledSchema, result: Dict[str, Any]) -> None:
+        """Store a successful result in the cache; best effort, never fails the parse."""
+        if settings.PARSE_CACHE_ENABLED and result["success"]:
+            try:
+                key = self._cache_key(inputs, schema)
+                await asyncio.to_thread(parse_cache.put, key, result["data"], result.get("model"))
+            except Exception as e:
+                logger.warning(f"Could not cache parse result: {e}")
+
+    async def _parse_cached(self, email_id: int, inputs: Dict[str, Any], schema: CompiledSchema) -> Dict[str, Any]:
+        """
+        Serve the parse from the result cache or the pre-extractor, or
+        call the LLM (reusing a template sibling's fields if there is one)
+        and cache it.
+        """
+        cached = await self._cache_get(inputs, schema)
+        if cached:
+            return cached
+
+        inputs, pre_extracted = pre_extract(inputs, schema)
+        if pre_extracted:
+            return pre_extracted
+
+        reference = await self._find_reference(email_id, inputs, schema)
+        result = await self._call_llm(inputs, schema, reference)
+        await self._cache_put(inputs, schema, result)
+        return result
+
+    async def _find_reference(
+        self,
+        email_id: int,
+        inputs: Dict[str, Any],
+        schema: CompiledSchema,
+    ) -> Optional[Dict[str, Any]]:
+        if not settings.NEAR_DUPLICATE_ENABLED:
+            return None
+        try:
+            return await asyncio.to_thread(near_duplicates.find_reference, email_id, inputs, schema)
+        except Exception as e:
+            logger.warning(f"Near-duplicate lookup failed for email {email_id}: {e}")
+            return None
+
+    async def _call_llm(
+        self,
+        inputs: Dict[str, Any],
+        schema: CompiledSchema,
+        reference: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        if reference:
+            return await self._call_llm_partial(inputs, schema, reference)
+
+        result = await email_parser.aparse_email(
+            schema=schema.schema,
+            system_prompt=schema.system_prompt,
+            **inputs,
+        )
+        return self._merge_known(inputs, result)
+
+    async def _call_llm_partial(
+        self,
+        inputs: Dict[str, Any],
+        schema: CompiledSchema,
+        reference: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Reuse a template sibling's stable fields and ask the LLM for the rest."""
+        known = inputs.get("known_fields") or {}
+        paths = set(reference["unstable_paths"]) - set(known)
+        sub_schema = restrict_schema(schema.schema, paths)
+        data = merge_known_fields({}, reference["stable_data"])
+
+        if not sub_schema["properties"]:
+            result = {
+                "success": True,
+                "model": NEAR_DUPLICATE_MODEL,
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        else:
+            candidates = {p: v for p, v in (inputs.get("candidate_fields") or {}).items() if p in paths}
+            result = await email_parser.aparse_email(
+                schema=sub_schema,
+                **{**inputs, "known_fields": None, "candidate_fields": candidates},
+            )
+            if not result["success"]:
+                return result
+            fresh = {p: v for p, v in leaf_paths(result["data"]).items() if p in paths}
+            merge_known_fields(data, fresh)
+
+        result["data"] = data
+        result["reference_id"] = reference["reference_id"]
+        return self._merge_known(inputs, result)
+
+    def _merge_known(self, inputs: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill the pre-extracted values the model was told to leave out."""
+        if result["success"] and inputs.get("known_fields"):
+            merge_known_fields(result["data"], inputs["known_fields"])
+        return result
+
+    async def parse_many(
+        self,
+        email_ids: List[int],
+        schema: CompiledSchema,
+        pack: Optional[bool] = None,
+        jobs: Optional[Dict[int, Collection[str]]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Parse emails concurrently, yielding each result as soon as it finishes.
+
+        At most `concurrency` LLM requests are in flight at once. With
+        `pack` (default: PACKING_ENABLED), short emails share completions;
+        see `_plan_packed`. `jobs` maps emails to the jobs that queued
+        them, for taking over their leases. If the consumer stops
+        iterating early (e.g. a streaming client disconnects), the
+        remaining parses are cancelled.
+        """
+        pack = settings.PACKING_ENABLED if pack is None else pack
+        semaphore = asyncio.Semaphore(self.concurrency)
+        jobs = jobs or {}
+
+        if pack and len(email_ids) > 1:
+            runs = await self._plan_packed(email_ids, schema, semaphore, jobs)
+        else:
+            async def run(email_id: int) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    return [await self.parse_one(email_id, schema, jobs.get(email_id, ()))]
+
+            runs = [run(email_id) for email_id in email_ids]
+
+        tasks = [asyncio.create_task(r) for r in runs]
+        unfinished = set(email_ids)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for result in await next_done:
+                    unfinished.discard(result["email_id"])
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Parses cut short keep their lease until it expires and the email is requeued
+            self._parsing.difference_update(unfinished)
+
+    async def _plan_packed(
+        self,
+        email_ids: List[int],
+        schema: CompiledSchema,
+        semaphore: asyncio.Semaphore,
+        jobs: Dict[int, Collection[str]],
+    ) -> List:
+        """
+        Prepare emails for packed parsing and group them into requests.
+
+        Cache hits, fully pre-extracted emails and emails that can't be
+        parsed are resolved up front, and template siblings of parsed
+        emails get a partial parse of their own. The rest are binned
+        first-fit, in order, into packs of at most PACK_MAX_EMAILS emails
+        and PACK_TOKEN_BUDGET prompt tokens; emails over
+        PACK_MAX_EMAIL_TOKENS get a request of their own. An email whose
+        preparation fails is resolved as failed, like an unpacked parse.
+
+        Returns the coroutines to run, each producing a list of results.
+        """
+        references: Dict[int, Dict[str, Any]] = {}  # Email ID -> template sibling
+
+        async def prepare(email_id: int):
+            try:
+                inputs = await self._begin(email_id, jobs.get(email_id, ()))
+                if "error_code" in inputs:
+                    return email_id, None, {"email_id": email_id, "success": False, **inputs}
+                cached = await self._cache_get(inputs, schema)
+                if cached:
+                    return email_id, None, await self._complete(email_id, cached, schema)
+                inputs, pre_extracted = pre_extract(inputs, schema)
+                if pre_extracted:
+                    return email_id, None, await self._complete(email_id, pre_extracted, schema)
+                reference = await self._find_reference(email_id, inputs, schema)
+                if reference:
+                    references[email_id] = reference
+                return email_id, inputs, None
+            except Exception as e:
+                return email_id, None, await self._fail(email_id, e)
+
+        resolved = []
+        packable = []  # (email_id, inputs, user_prompt, prompt_stats, tokens)
+        singles = []
+        for email_id, inputs, result in await asyncio.gather(*(prepare(e) for e in email_ids)):
+            if result is not None:
+                resolved.append(result)
+                continue
+            if email_id in references:
+                singles.append((email_id, inputs))  # Partial parse against a template sibling
+                continue
+            user_prompt, prompt_stats = email_parser._build_user_prompt(**inputs)
+            tokens = tokenizer.count(user_prompt)
+            if tokens > settings.PACK_MAX_EMAIL_TOKENS:
+                singles.append((email_id, inputs))
+            else:
+                packable.append((email_id, inputs, user_prompt, prompt_stats, tokens))
+
+        packs: List[List] = []
+        for item in packable:
+            for pack in packs:
+                if (len(pack) < settings.PACK_MAX_EMAILS
+                        and sum(i[4] for i in pack) + item[4] <= settings.PACK_TOKEN_BUDGET):
+                    pack.append(item)
+                    break
+            else:
+                packs.append([item])
+
+        async def already_resolved() -> List[Dict[str, Any]]:
+            return resolved
+
+        async def run_single(email_id: int, inputs: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    result = await self._call_llm(inputs, schema, references.get(email_id))
+                    await self._cache_put(inputs, schema, result)
+                    return [await self._complete(email_id, result, schema)]
+                except Exception as e:
+                    return [await self._fail(email_id, e)]
+
+        async def run_pack(pack: List) -> List[Dict[str, Any]]:
+            async with semaphore:
+                packed = await email_parser.aparse_packed(
+                    {email_id: prompt for email_id, _, prompt, _, _ in pack},
+                    schema.packed_system_prompt,
+                )
+            results = []
+            for email_id, inputs, _, prompt_stats, _ in pack:
+                if email_id not in packed:
+                    # Missing or malformed in the packed response
+                    results.extend(await run_single(email_id, inputs))
+                    continue
+                result = self._merge_known(inputs, packed[email_id])
+                result["usage"]["tokens_saved"] = prompt_stats["tokens_saved"]
+                try:
+                    await self._cache_put(inputs, schema, result)
+                    results.append(await self._complete(email_id, result, schema))
+                except Exception as e:
+                    results.append(await self._fail(email_id, e))
+            return results
+
+        runs = [already_resolved()] if resolved else []
+        runs += [run_pack(pack) if len(pack) > 1 else run_single(pack[0][0], pack[0][1]) for pack in packs]
+        runs += [run_single(email_id, inputs) for email_id, inputs in singles]
+        return runs
+
+
+# Singleton instance
+parsing_engine = ParsingEngine()
@@ -0,0 +1,422 @@
+"""Deterministic extraction of structured fields ahead of the LLM."""
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple
+
+from app.core.config import settings
+from app.services.schema_registry import CompiledSchema
+
+logger = logging.getLogger(__name__)
+
+# Recorded as the parsing model when the LLM is skipped
+PRE_EXTRACTOR_MODEL = "pre-extractor"
+
+# Values below PRE_EXTRACT_MIN_CONFIDENCE but at least this sure are
+# passed to the model as suggestions rather than dropped
+HINT_MIN_CONFIDENCE = 0.5
+
+FREE_MAIL_DOMAINS = {
+    "gmail.com", "googlemail.com", "yahoo.com", "outlook.com", "hotmail.com", "live.com",
+    "icloud.com", "me.com", "aol.com", "proton.me", "protonmail.com", "gmx.com",
+    "mail.com", "yandex.com", "mail.ru", "zoho.com",
+}
+# Links that are never the website on offer
+IGNORED_DOMAINS = {
+    "linkedin.com", "twitter.com", "x.com", "facebook.com", "instagram.com", "youtube.com",
+    "google.com", "calendly.com", "bit.ly", "wa.me", "t.me", "w3.org",
+}
+
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+_NO_REPLY = re.compile(r"no-?reply|donotreply|mailer-daemon|unsubscribe|bounce", re.IGNORECASE)
+_URL = re.compile(r"\bhttps?://([\w.-]+)", re.IGNORECASE)
+_BARE_DOMAIN = re.compile(
+    r"(?<![@\w.-])(?:www\.)?((?:[a-z0-9-]+\.)+(?:com|net|org|io|co|info|biz|blog|news|media|us|uk|de|fr|es|it|nl|ca|au|in))\b",
+    re.IGNORECASE,
+)
+
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP"}
+_CURRENCY_WORDS = {
+    "usd": "USD", "dollars": "USD", "dollar": "USD",
+    "eur": "EUR", "euros": "EUR", "euro": "EUR",
+    "gbp": "GBP", "pounds": "GBP",
+}
+_NUMBER = r"\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?"
+# "$2M", "$3 billion": revenue or valuations, never a placement price
+_NOT_PRICE = r"(?!\d|[.,]\d|\s?(?:[mMbB]n?\b|million|billion))"
+_PRICE_PATTERNS = [
+    re.compile(rf"([$€£])\s?({_NUMBER})(\s?[kK]\b)?{_NOT_PRICE}"),
+    re.compile(rf"\b({_NUMBER})(\s?[kK])?\s?(USD|EUR|GBP|dollars?|euros?|pounds)\b", re.IGNORECASE),
+    re.compile(rf"\b(USD|EUR|GBP)\s?({_NUMBER})(\s?[kK]\b)?{_NOT_PRICE}"),
+]
+# Characters either side of an amount searched for what it's the price of
+_PRICE_CONTEXT_CHARS = 40
+
+# Words that make an amount next to them a price rather than, say, a traffic value
+_PRICE_CONTEXT = re.compile(
+    r"\b(?:price[sd]?|pricing|costs?|fees?|rates?|charges?|budget|pay|paid|per (?:post|article|link|placement))\b"
+    r"|/\s?(?:post|article|link)\b",
+    re.IGNORECASE,
+)
+
+_DOMAIN_AUTHORITY = re.compile(r"(?:\bDA\b|\bdomain authority\b)(?:\s+score)?\s*(?:of|is|[:=-])?\s*(\d{1,3})(\+)?", re.IGNORECASE)
+_PAGE_AUTHORITY = re.compile(r"(?:\bPA\b|\bpage authority\b)(?:\s+score)?\s*(?:of|is|[:=-])?\s*(\d{1,3})(\+)?", re.IGNORECASE)
+_TRAFFIC_BEFORE = re.compile(
+    r"\b(\d[\d,.]*\s?[kKmM]?\+?)\s+(?:monthly\s+|unique\s+|organic\s+)*(?:visitors|visits|pageviews|page views|users|readers)\b"
+    r"(\s*(?:per|a|/)\s*month|\s+monthly)?",
+    re.IGNORECASE,
+)
+_TRAFFIC_AFTER = re.compile(
+    r"\b(monthly\s+)?(?:organic\s+)?(?:traffic|visitors|visits|pageviews|readership)\s*[:=-]\s*(\d[\d,.]*\s?[kKmM]?\+?)",
+    re.IGNORECASE,
+)
+
+# Phrases that identify each offer type, strongest first
+_OFFER_TYPES = {
+    "guest_post": re.compile(r"guest[\s-]?posts?|guest articles?|write for (?:you|us)", re.IGNORECASE),
+    "link_exchange": re.compile(r"link (?:exchange|swap)s?|exchange links|reciprocal links?|link[\s-]for[\s-]link", re.IGNORECASE),
+    "sponsored": re.compile(r"sponsored (?:posts?|content|articles?)|sponsorships?", re.IGNORECASE),
+    "advertising": re.compile(r"advertis\w*|banner ads?|ad (?:placements?|space|slots?)", re.IGNORECASE),
+    "acquisition": re.compile(r"acquir\w+|acquisition|(?:buy|purchase)\w* (?:your|the) (?:web)?site|sell (?:your|the) (?:web)?site", re.IGNORECASE),
+    "partnership": re.compile(r"partnerships?|partner with|collaborat\w+", re.IGNORECASE),
+}
+
+_SIGN_OFF = re.compile(
+    r"^\s*(best( regards| wishes)?|kind regards|warm regards|regards|thanks( again)?|thank you|cheers|sincerely|all the best)[,.!]?\s*$|^\s*--\s*$",
+    re.IGNORECASE,
+)
+_PHONE = re.compile(r"^[\s()+\d.-]{7,}$")
+_SIGNATURE_SEPARATORS = re.compile(r"\s*[|•·]\s*|\s+-\s+")
+
+
+@dataclass(frozen=True)
+class Extraction:
+    """A field value read from the email, with how sure the rule is (0-1)."""
+    value: Any
+    confidence: float
+
+
+def _registrable_domain(domain: str) -> str:
+    """'mail.blog.example.co.uk' -> 'example.co.uk'; good enough for matching."""
+    labels = domain.lower().strip(".").split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in {"co", "com", "org", "net", "ac"}:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", (text or "").lower())
+
+
+def _to_number(text: str, thousands: bool = False) -> float:
+    value = float(text.replace(",", ""))
+    if thousands:
+        value *= 1000
+    return int(value) if value == int(value) else value
+
+
+class PreExtractor:
+    """
+    Rule-based extractor for fields that usually appear verbatim.
+
+    Each rule reports a confidence; PRE_EXTRACT_MIN_CONFIDENCE decides
+    which values are trusted. Rules favour being unsure over being wrong:
+    a single unambiguous match scores high, competing matches score low
+    and are left for the model to settle.
+    """
+
+    def extract(
+        self,
+        email_body: str,
+        subject: str = "",
+        sender_email: str = "",
+        sender_name: str = "",
+        **_,
+    ) -> Dict[str, Extraction]:
+        """Run every rule; returns dotted field path -> Extraction for what was found."""
+        body = email_body or ""
+        sender_email = (sender_email or "").strip().lower()
+        sender_domain = sender_email.rsplit("@", 1)[-1] if "@" in sender_email else ""
+        company_domain = "" if sender_domain in FREE_MAIL_DOMAINS else _registrable_domain(sender_domain) if sender_domain else ""
+
+        fields: Dict[str, Optional[Extraction]] = {
+            "contact_email": self._contact_email(body, sender_email),
+            "contact_name": self._contact_name(body, sender_name),
+            "website_url": self._website_url(body, company_domain),
+            "company_name": self._company_name(body, sender_name, company_domain),
+        }
+        offer_type = self._offer_type(body, subject)
+        fields["offer_type"] = offer_type
+        price = self._price(body, subject, offer_type.value if offer_type else None)
+        if price:
+            amount, currency, confidence, currency_confidence = price
+            fields["price.amount"] = Extraction(amount, confidence)
+            fields["price.currency"] = Extraction(currency, currency_confidence)
+        fields["metrics.domain_authority"] = self._authority(_DOMAIN_AUTHORITY, body, subject)
+        fields["metrics.page_authority"] = self._authority(_PAGE_AUTHORITY, body, subject)
+        fields["metrics.monthly_traffic"] = self._monthly_traffic(body)
+
+        return {path: extraction for path, extraction in fields.items() if extraction is not None}
+
+    def _contact_email(self, body: str, sender_email: str) -> Optional[Extraction]:
+        found = [e.lower() for e in _EMAIL.findall(body) if not _NO_REPLY.search(e)]
+        distinct = list(dict.fromkeys(found))
+        if len(distinct) == 1:
+            return Extraction(distinct[0], 0.95 if distinct[0] == sender_email else 0.85)
+        if distinct:
+            if sender_email in distinct:
+                return Extraction(sender_email, 0.8)
+            return Extraction(distinct[0], 0.5)
+        if sender_email and not _NO_REPLY.search(sender_email):
+            return Extraction(sender_email, 0.9)
+        return None
+
+    def _contact_name(self, body: str, sender_name: str) -> Optional[Extraction]:
+        name = (sender_name or "").strip().strip('"')
+        if not name or "@" in name:
+            return None
+        # Signed with the display name: almost certainly the contact
+        if re.search(rf"^\s*{re.escape(name)}\s*$", body, re.IGNORECASE | re.MULTILINE):
+            return Extraction(name, 0.95)
+        # Introduced by name, or named in the signature block
+        if re.search(rf"(?<!\w){re.escape(name)}(?!\w)", body, re.IGNORECASE):
+            return Extraction(name, 0.9)
+        # A display name alone may be a team, a brand or an alias
+        return Extraction(name, 0.6)
+
+    def _website_url(self, body: str, company_domain: str) -> Optional[Extraction]:
+        domains = [m.lower() for m in _URL.findall(body)] + [m.lower() for m in _BARE_DOMAIN.findall(body)]
+        candidates = Counter()
+        for domain in domains:
+            domain = domain.removeprefix("www.").rstrip(".")
+            registrable = _registrable_domain(domain)
+            if registrable in IGNORED_DOMAINS or registrable in FREE_MAIL_DOMAINS:
+                continue
+            candidates[domain] += 1
+
+        if candidates:
+            own = [d for d in candidates if company_domain and _registrable_domain(d) == company_domain]
+            if own:
+                return Extraction(own[0], 0.95)
+            if len(candidates) == 1:
+                return Extraction(next(iter(candidates)), 0.85)
+            return Extraction(candidates.most_common(1)[0][0], 0.5)
+        if company_domain:
+            return Extraction(company_domain, 0.6)
+        return None
+
+    def _signature_lines(self, body: str, sender_name: str) -> List[str]:
+        """Lines of the sign-off block at the end of the body, if there is one."""
+        lines = [line.strip() for line in body.strip().split("\n")]
+        for i in range(len(lines) - 1, max(len(lines) - 10, -1), -1):
+            if _SIGN_OFF.match(lines[i]):
+                return [line for line in lines[i + 1:] if line]
+
+        # No sign-off: accept a short closing paragraph that starts with the sender's name
+        paragraphs = re.split(r"\n\s*\n", body.strip())
+        last = [line.strip() for line in paragraphs[-1].split("\n") if line.strip()]
+        name = _squash(sender_name)
+        if 1 < len(last) <= 6 and all(len(line) <= 60 for line in last) and name and _squash(last[0]) == name:
+            return last
+        return []
+
+    def _company_name(self, body: str, sender_name: str, company_domain: str) -> Optional[Extraction]:
+        domain_label = _squash(company_domain.split(".")[0]) if company_domain else ""
+
+        for line in reversed(self._signature_lines(body, sender_name)):
+            parts = [
+                p for p in _SIGNATURE_SEPARATORS.split(line)
+                if p and not _EMAIL.search(p) and not _URL.search(p) and not _PHONE.match(p)
+            ]
+            if not parts:
+                continue
+            candidate = parts[0].strip(" ,")
+            if _squash(candidate) == _squash(sender_name):
+                break  # Reached the name line without finding a company
+            squashed = _squash(candidate)
+            if domain_label and squashed and (domain_label in squashed or squashed in domain_label):
+                return Extraction(candidate, 0.9)
+            return Extraction(candidate, 0.6)
+
+        if domain_label:
+            return Extraction(company_domain.split(".")[0].title(), 0.5)
+        return None
+
+    def _offer_type(self, body: str, subject: str) -> Optional[Extraction]:
+        scores = Counter()
+        for offer_type, pattern in _OFFER_TYPES.items():
+            # The subject usually names the offer, so it counts double
+            scores[offer_type] = len(pattern.findall(body)) + 2 * len(pattern.findall(subject or ""))
+        scores = +scores  # Drop zero counts
+        if not scores:
+            return None
+
+        (top, top_score), *rest = scores.most_common()
+        if not rest:
+            return Extraction(top, 0.9 if top_score >= 2 else 0.8)
+        share = top_score / sum(scores.values())
+        return Extraction(top, round(0.8 * share, 2))
+
+    def _price(self, body: str, subject: str, offer_type: Optional[str]) -> Optional[Tuple[Any, str, float, float]]:
+        """Returns (amount, currency, confidence, currency confidence)."""
+        found = []  # (amount, currency, text around the amount)
+        named_currencies = set()  # Spelled out, not just a symbol
+        for text in (subject or "", body):
+            for line in text.split("\n"):
+                for pattern in _PRICE_PATTERNS:
+                    for match in pattern.finditer(line):
+                        groups = match.groups()
+                        if pattern is _PRICE_PATTERNS[0]:
+                            amount, currency = _to_number(groups[1], bool(groups[2])), _CURRENCY_SYMBOLS[groups[0]]
+                        elif pattern is _PRICE_PATTERNS[1]:
+                            amount, currency = _to_number(groups[0], bool(groups[1])), _CURRENCY_WORDS[groups[2].lower()]
+                        else:
+                            amount, currency = _to_number(groups[1], bool(groups[2])), groups[0].upper()
+                        if pattern is not _PRICE_PATTERNS[0]:
+                            named_currencies.add(currency)
+                        context = line[max(match.start() - _PRICE_CONTEXT_CHARS, 0):match.end() + _PRICE_CONTEXT_CHARS]
+                        found.append((amount, currency, context))
+        if not found:
+            return None
+
+        offer_pattern = _OFFER_TYPES[offer_type] if offer_type else None
+
+        def with_currency(amount: Any, currency: str, confidence: float) -> Tuple[Any, str, float, float]:
+            # "$" alone is also the Canadian, Australian, ... dollar
+            if currency == "USD" and currency not in named_currencies:
+                return amount, currency, confidence, min(confidence, 0.7)
+            return amount, currency, confidence, confidence
+
+        distinct = list(dict.fromkeys((amount, currency) for amount, currency, _ in found))
+        if len(distinct) == 1:
+            # A lone amount is only surely the price when quoted as one
+            priced = any(
+                _PRICE_CONTEXT.search(context) or (offer_pattern and offer_pattern.search(context))
+                for _, _, context in found
+            )
+            return with_currency(*distinct[0], 0.95 if priced else 0.6)
+
+        # Price lists: prefer the one price quoted next to the offer itself
+        if offer_pattern:
+            near = list(dict.fromkeys((a, c) for a, c, context in found if offer_pattern.search(context)))
+            if len(near) == 1:
+                return with_currency(*near[0], 0.85)
+        return with_currency(*distinct[0], 0.4)
+
+    def _authority(self, pattern: re.Pattern, body: str, subject: str) -> Optional[Extraction]:
+        matches = pattern.findall(f"{subject}\n{body}")
+        values = list(dict.fromkeys(int(v) for v, _ in matches if 0 < int(v) <= 100))
+        if not values:
+            return None
+        # "DA 30+" is usually a requirement, not a metric
+        is_threshold = any(plus for _, plus in matches)
+        if len(values) == 1 and not is_threshold:
+            return Extraction(values[0], 0.95)
+        return Extraction(values[0], 0.4)
+
+    def _monthly_traffic(self, body: str) -> Optional[Extraction]:
+        monthly, other = [], []
+        for value, per_month in _TRAFFIC_BEFORE.findall(body):
+            (monthly if per_month else other).append(value.strip())
+        for is_monthly, value in _TRAFFIC_AFTER.findall(body):
+            (monthly if is_monthly else other).append(value.strip())
+        # "Monthly organic traffic: 850,000 visitors" matches both patterns
+        monthly = list(dict.fromkeys(monthly))
+        if len(monthly) == 1:
+            return Extraction(monthly[0], 0.9)
+        if monthly or other:
+            return Extraction((monthly or other)[0], 0.5)
+        return None
+
+
+def schema_paths(schema: Dict[str, Any], prefix: str = "") -> List[str]:
+    """Dotted paths of the leaf properties in a JSON schema."""
+    paths = []
+    for name, spec in (schema.get("properties") or {}).items():
+        path = f"{prefix}{name}"
+        if isinstance(spec, dict) and spec.get("type") == "object" and "properties" in spec:
+            paths.extend(schema_paths(spec, f"{path}."))
+        else:
+            paths.append(path)
+    return paths
+
+
+def _skeleton(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """The schema's shape with every field null, as the model is told to output."""
+    data = {}
+    for name, spec in (schema.get("properties") or {}).items():
+        if isinstance(spec, dict) and spec.get("type") == "object" and "properties" in spec:
+            data[name] = _skeleton(spec)
+        else:
+            data[name] = None
+    return data
+
+
+def _set_path(data: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, leaf = path.split(".")
+    for key in parents:
+        if not isinstance(data.get(key), dict):
+            data[key] = {}
+        data = data[key]
+    data[leaf] = value
+
+
+def merge_known_fields(data: Dict[str, Any], known_fields: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fill pre-extracted values into parsed data; they win over the model's."""
+    for path, value in (known_fields or {}).items():
+        _set_path(data, path, value)
+    return data
+
+
+def pre_extract(
+    inputs: Dict[str, Any],
+    schema: CompiledSchema,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Run the pre-extractor on prompt inputs.
+
+    Only fields the schema defines are used. If every required field was
+    found with at least PRE_EXTRACT_MIN_CONFIDENCE, the email is fully
+    parsed here and a parse result is returned. Otherwise the confident
+    values are added to the inputs as `known_fields` (left out of the
+    model's output and merged back afterwards) and less certain ones as
+    `candidate_fields` (suggestions for the model to check).
+
+    Returns:
+        (inputs for the LLM call, parse result or None)
+    """
+    if not settings.PRE_EXTRACT_ENABLED:
+        return inputs, None
+
+    paths = set(schema_paths(schema.schema))
+    extracted = {
+        path: extraction
+        for path, extraction in pre_extractor.extract(**inputs).items()
+        if path in paths
+    }
+    min_confidence = settings.PRE_EXTRACT_MIN_CONFIDENCE
+    known = {p: e.value for p, e in extracted.items() if e.confidence >= min_confidence}
+    candidates = {
+        p: e.value for p, e in extracted.items()
+        if HINT_MIN_CONFIDENCE <= e.confidence < min_confidence
+    }
+
+    required = schema.schema.get("required") or []
+    if required and all(field in known for field in required):
+        confidence = min(extracted[p].confidence for p in known)
+        logger.info(f"Pre-extracted all required fields, skipping the LLM ({len(known)} fields)")
+        return inputs, {
+            "success": True,
+            "data": merge_known_fields(_skeleton(schema.schema), known),
+            "model": PRE_EXTRACTOR_MODEL,
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            "pre_extracted": True,
+            "confidence": int(confidence * 100),
+        }
+
+    return {**inputs, "known_fields": known, "candidate_fields": candidates}, None
+
+
+# Singleton instance
+pre_extractor = PreExtractor()
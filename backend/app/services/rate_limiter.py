@@ -0,0 +1,302 @@
+"""Client-side rate limiting and retries for LLM API calls."""
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import openai
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How often callers re-check for a free concurrency slot
+SLOT_POLL_SECONDS = 0.05
+
+# Errors that mean "slow down" rather than "this request is broken"
+THROTTLE_ERRORS = (openai.RateLimitError,)
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # 5xx without a dedicated exception class, plus request timeout / conflict
+    return isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code in (408, 409))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the server's requested delay from Retry-After (seconds or HTTP date) or retry-after-ms."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(retry_after)
+        return max(when.timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Per-minute budget that refills continuously.
+
+    `reserve` always succeeds and returns how long the caller must wait
+    before using what it reserved; the bucket may go negative, which
+    queues later callers behind earlier ones without any polling.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0  # Unlimited
+        # A single request bigger than the whole budget can still go through eventually
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, if negative, charge) the difference once real usage is known."""
+        if self.per_minute <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Keeps LLM calls inside requests-per-minute and tokens-per-minute
+    budgets and retries the ones the API turns away.
+
+    Every attempt reserves one request and its estimated tokens (prompt
+    plus max_tokens, which is how the API counts against the limit)
+    before it takes a concurrency slot, so no slot sits idle waiting for
+    budget. The estimate is corrected once the response reports real
+    usage; a failed attempt gives its tokens back before a retry
+    reserves them again.
+
+    Concurrency adapts AIMD-style: each success raises the in-flight
+    limit by 1/limit (about +1 per round of calls) up to
+    LLM_MAX_CONCURRENCY, and a throttling response halves it, once per
+    round: throttled calls that started before the last decrease were
+    sent under the old limit and don't halve it again. While the server
+    has asked for a pause (Retry-After), no new calls start.
+
+    Retryable failures (rate limits, timeouts, connection errors and 5xx)
+    are retried up to LLM_MAX_RETRIES times with jittered exponential
+    backoff, or after the server's Retry-After if it sent one.
+
+    Budgets are per process; with several workers, set the limits to
+    each worker's share of the account quota.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        min_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+    ):
+        self.requests = TokenBucket(settings.LLM_RPM_LIMIT if rpm is None else rpm)
+        self.tokens = TokenBucket(settings.LLM_TPM_LIMIT if tpm is None else tpm)
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.min_concurrency = min_concurrency or settings.LLM_MIN_CONCURRENCY
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base or settings.LLM_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max or settings.LLM_BACKOFF_MAX_SECONDS
+
+        self.concurrency_limit = float(self.max_concurrency)
+        # Bumped on every decrease; calls note it when they start
+        self.limit_generation = 0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    # Concurrency slots
+
+    def _try_acquire_slot(self) -> Tuple[float, int]:
+        """
+        Take a slot if one is free; otherwise say how long to wait before trying again.
+
+        Returns:
+            (wait, limit generation the call starts under)
+        """
+        with self._lock:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                return pause, self.limit_generation
+            if self.in_flight < int(self.concurrency_limit):
+                self.in_flight += 1
+                return 0.0, self.limit_generation
+            return SLOT_POLL_SECONDS, self.limit_generation
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.concurrency_limit = min(
+                self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit
+            )
+
+    def _on_throttle(self, pause: Optional[float], generation: int) -> None:
+        with self._lock:
+            if generation == self.limit_generation:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                self.limit_generation += 1
+            if pause:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self._stats["throttled"] += 1
+        logger.warning(
+            f"LLM rate limited; concurrency limit now {int(self.concurrency_limit)}"
+            + (f", pausing {pause:.1f}s" if pause else "")
+        )
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max) + random.uniform(0, self.backoff_base)
+        # Full jitter keeps retrying callers from moving in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        """Reserve an attempt's request and tokens; returns how long to wait before sending it."""
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def _settle(self, estimated_tokens: int, response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None) is not None:
+            self.tokens.refund(estimated_tokens - usage.total_tokens)
+
+    def _handle_error(self, attempt: int, error: Exception, estimated_tokens: int, generation: int) -> float:
+        """Returns the delay before retrying, or raises if the error is final."""
+        # The request was sent, so it stays charged; its tokens weren't used
+        self.tokens.refund(estimated_tokens)
+        if not is_retryable(error) or attempt >= self.max_retries:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise error
+
+        delay = self._backoff(attempt, error)
+        if isinstance(error, THROTTLE_ERRORS):
+            self._on_throttle(retry_after_seconds(error), generation)
+        with self._lock:
+            self._stats["retries"] += 1
+        logger.info(f"Retrying LLM call in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}): {error}")
+        return delay
+
+    # Public API
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        """Run an async API call under the limits, retrying retryable failures."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(estimated_tokens))
+            wait, generation = self._try_acquire_slot()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait, generation = self._try_acquire_slot()
+            try:
+                with self._lock:
+                    self._stats["calls"] += 1
+                response = await fn()
+            except Exception as e:
+                delay = self._handle_error(attempt, e, estimated_tokens, generation)
+            else:
+                self._on_success()
+                self._settle(estimated_tokens, response)
+                return response
+            finally:
+                self._release_slot()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int) -> T:
+        """Blocking variant of `acall`."""
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(estimated_tokens))
+            wait, generation = self._try_acquire_slot()
+            while wait > 0:
+                time.sleep(wait)
+                wait, generation = self._try_acquire_slot()
+            try:
+                with self._lock:
+                    self._stats["calls"] += 1
+                response = fn()
+            except Exception as e:
+                delay = self._handle_error(attempt, e, estimated_tokens, generation)
+            else:
+                self._on_success()
+                self._settle(estimated_tokens, response)
+                return response
+            finally:
+                self._release_slot()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "concurrency_limit": int(self.concurrency_limit),
+                "in_flight": self.in_flight,
+                "paused_for_seconds": round(max(self.paused_until - time.monotonic(), 0.0), 1),
+                "rpm_limit": self.requests.per_minute,
+                "tpm_limit": self.tokens.per_minute,
+            }
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
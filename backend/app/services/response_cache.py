@@ -0,0 +1,154 @@
+"""Conditional GET for email responses, and an in-process cache of rendered ones."""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+
+# Email responses are private and change underneath clients: caches may
+# store them but must revalidate before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def email_etag(email_id: int, updated_at: Optional[datetime]) -> str:
+    """
+    Validator of an email's detail response.
+
+    Weak, since it's derived from `updated_at` rather than the bytes sent.
+    """
+    version = (updated_at - EPOCH) // timedelta(microseconds=1) if updated_at else 0
+    return f'W/"e{email_id}-{version:x}"'
+
+
+def list_etag(variant: str, version: Optional[int]) -> str:
+    """
+    Validator of an email list response.
+
+    Derived from the database's count of changes to emails rather than
+    from the page itself, so it's checked before counting matches or
+    reading the page. Any email changing, arriving or being deleted
+    changes the tag of every list.
+
+    Args:
+        variant: Everything else the response depends on (the query string)
+        version: `email_changes.version`
+    """
+    state = f"{variant}|{version or 0}"
+    return f'W/"l{hashlib.blake2b(state.encode(), digest_size=12).hexdigest()}"'
+
+
+def http_date(value: datetime) -> str:
+    """Format a naive UTC datetime for Last-Modified."""
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified_since(if_modified_since: Optional[str], updated_at: Optional[datetime]) -> bool:
+    """Whether If-Modified-Since covers `updated_at` (at the header's one-second resolution)."""
+    if not if_modified_since or updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return updated_at.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+def render_json(content: Any) -> bytes:
+    """Render a response body once, so the same bytes can be cached and sent again."""
+    return JSONResponse(content).body
+
+
+def json_response(body: bytes, etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(body, media_type="application/json", headers=validator_headers(etag, last_modified))
+
+
+class ResponseCache:
+    """
+    LRU of rendered email responses, per API process.
+
+    Entries are stored with their ETag and only served when the tag just
+    computed from the database still matches, so a change made by another
+    process (a parse worker, another API replica) is never served stale;
+    it just costs a miss. Changes made in this process drop their entries
+    straight away (`invalidate`), which also frees the memory early.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = settings.EMAIL_RESPONSE_CACHE_SIZE if size is None else size
+        # key -> (etag, body, email IDs the response shows)
+        self._entries: "OrderedDict[str, Tuple[str, bytes, frozenset]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        """Rendered body cached under `key` for exactly this ETag, or None."""
+        if not self.size:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == etag:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, etag: str, body: bytes, email_ids: Iterable[int]) -> None:
+        if not self.size:
+            return
+        with self._lock:
+            self._entries[key] = (etag, body, frozenset(email_ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email_id: int) -> None:
+        """Drop every cached response that shows this email."""
+        if not self.size:
+            return
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if email_id in entry[2]]
+            for key in stale:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Singleton instance
+response_cache = ResponseCache()
@@ -0,0 +1,319 @@
+"""Versioned registry of parsing schemas with compiled-prompt caching."""
+import hashlib
+import json
+import os
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Optional, List
+
+from jsonschema import Draft7Validator
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.parsing_schema import ParsingSchema
+from app.services.openai_parser import email_parser
+
+logger = logging.getLogger(__name__)
+
+# Legacy file-based schema storage, imported as version 1 on first use
+SCHEMA_FILE = "/app/data/parsing_schema.json"
+
+# How long a process trusts its cached idea of which version is active.
+# The process that publishes a schema invalidates immediately; other
+# processes (workers) pick the change up within this window.
+ACTIVE_VERSION_TTL_SECONDS = 5.0
+
+# Tries of a publish or activation that lost a race for the next version
+# number or the active flag to a concurrent one (see SchemaRegistry._write)
+WRITE_ATTEMPTS = 5
+
+# Default JSON schema for parsing commercial offers
+DEFAULT_PARSING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "company_name": {
+            "type": "string",
+            "description": "Name of the company making the offer"
+        },
+        "contact_email": {
+            "type": "string",
+            "description": "Contact email address"
+        },
+        "contact_name": {
+            "type": "string",
+            "description": "Name of the contact person"
+        },
+        "website_url": {
+            "type": "string",
+            "description": "Website URL being offered"
+        },
+        "offer_type": {
+            "type": "string",
+            "description": "Type of offer (e.g., partnership, advertising, guest_post, link_exchange, acquisition, sponsored)"
+        },
+        "price": {
+            "type": "object",
+            "properties": {
+                "amount": {"type": "number", "description": "Price amount if mentioned"},
+                "currency": {"type": "string", "description": "Currency code (USD, EUR, etc.)"}
+            }
+        },
+        "description": {
+            "type": "string",
+            "description": "Brief summary of what is being offered"
+        },
+        "metrics": {
+            "type": "object",
+            "properties": {
+                "monthly_traffic": {"type": "string", "description": "Monthly visitors/traffic if mentioned"},
+                "domain_authority": {"type": "number", "description": "DA score if mentioned"},
+                "page_authority": {"type": "number", "description": "PA score if mentioned"}
+            },
+            "description": "Website metrics if mentioned in the email"
+        }
+    },
+    "required": ["company_name", "offer_type"]
+}
+
+
+def schema_fingerprint(schema: Dict[str, Any]) -> str:
+    """Stable hash of a parsing schema."""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    """A schema version with everything derived from it rendered once."""
+    version: int
+    schema: Dict[str, Any]
+    fingerprint: str
+    system_prompt: str
+    packed_system_prompt: str
+    validator: Draft7Validator
+
+    def validate(self, data: Dict[str, Any]) -> List[str]:
+        """Return human-readable validation errors for parsed data."""
+        return [
+            f"{'.'.join(str(p) for p in error.path) or '<root>'}: {error.message}"
+            for error in self.validator.iter_errors(data)
+        ]
+
+
+class SchemaRegistry:
+    """
+    Versioned parsing schemas stored in the `parsing_schemas` table.
+
+    Publishing a schema creates a new version and moves the active pointer
+    to it; old versions are kept so emails can be traced back to the schema
+    they were parsed with. Compiled versions (system prompt and validator)
+    are cached per process and never change, so only the active pointer
+    needs invalidating.
+
+    Methods do blocking database work; call them from a thread when
+    running on the event loop.
+    """
+
+    def __init__(self):
+        self._compiled: Dict[int, CompiledSchema] = {}
+        self._active_version: Optional[int] = None
+        self._active_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_active(self) -> CompiledSchema:
+        """Get the compiled active schema, seeding version 1 if none exist."""
+        with self._lock:
+            version = self._active_version
+            fresh = time.monotonic() - self._active_checked_at < ACTIVE_VERSION_TTL_SECONDS
+            if version is not None and fresh and version in self._compiled:
+                return self._compiled[version]
+
+        db = SessionLocal()
+        try:
+            row = db.query(ParsingSchema).filter(ParsingSchema.is_active.is_(True)).first()
+            if row is None:
+                row = self._seed(db)
+            compiled = self._compile_row(row)
+        finally:
+            db.close()
+
+        with self._lock:
+            self._active_version = compiled.version
+            self._active_checked_at = time.monotonic()
+        return compiled
+
+    def get_version(self, version: int) -> Optional[CompiledSchema]:
+        """Get a specific compiled schema version."""
+        with self._lock:
+            if version in self._compiled:
+                return self._compiled[version]
+
+        db = SessionLocal()
+        try:
+            row = db.query(ParsingSchema).filter(ParsingSchema.version == version).first()
+            return self._compile_row(row) if row else None
+        finally:
+            db.close()
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        """Summaries of all schema versions, newest first."""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                ParsingSchema.version,
+                ParsingSchema.fingerprint,
+                ParsingSchema.is_active,
+                ParsingSchema.created_at,
+            ).order_by(ParsingSchema.version.desc()).all()
+            return [
+                {
+                    "version": r.version,
+                    "fingerprint": r.fingerprint,
+                    "is_active": r.is_active,
+                    "created_at": r.created_at.isoformat() if r.created_at else None,
+                }
+                for r in rows
+            ]
+        finally:
+            db.close()
+
+    def publish(self, schema: Dict[str, Any]) -> CompiledSchema:
+        """
+        Publish a schema as the new active version.
+
+        Publishing a schema identical to the active one is a no-op and
+        returns the active version.
+        """
+        Draft7Validator.check_schema(schema)
+        fingerprint = schema_fingerprint(schema)
+
+        def change(db: Session) -> ParsingSchema:
+            active = db.query(ParsingSchema).filter(ParsingSchema.is_active.is_(True)).first()
+            if active and active.fingerprint == fingerprint:
+                return active
+            latest = db.query(ParsingSchema.version).order_by(ParsingSchema.version.desc()).first()
+            db.query(ParsingSchema).filter(ParsingSchema.is_active.is_(True)).update(
+                {"is_active": False}, synchronize_session=False
+            )
+            row = ParsingSchema(
+                version=(latest.version if latest else 0) + 1,
+                schema=schema,
+                fingerprint=fingerprint,
+                is_active=True,
+            )
+            db.add(row)
+            db.commit()
+            logger.info(f"Published parsing schema v{row.version}")
+            return row
+
+        compiled = self._write(change)
+        self._set_active(compiled.version)
+        return compiled
+
+    def activate(self, version: int) -> Optional[CompiledSchema]:
+        """Point the active schema at an existing version (e.g. to roll back)."""
+        def change(db: Session) -> Optional[ParsingSchema]:
+            row = db.query(ParsingSchema).filter(ParsingSchema.version == version).first()
+            if not row:
+                return None
+            db.query(ParsingSchema).filter(
+                ParsingSchema.is_active.is_(True), ParsingSchema.version != version
+            ).update({"is_active": False}, synchronize_session=False)
+            row.is_active = True
+            db.commit()
+            return row
+
+        compiled = self._write(change)
+        if compiled is None:
+            return None
+        logger.info(f"Activated parsing schema v{version}")
+        self._set_active(compiled.version)
+        return compiled
+
+    def _write(self, change: Callable[[Session], Optional[ParsingSchema]]) -> Optional[CompiledSchema]:
+        """
+        Run a publish or activation, one at a time.
+
+        The next version number and the active flag are read before
+        they're written. On PostgreSQL the table is locked against other
+        writers (readers aren't blocked) before that read. Elsewhere the
+        unique version and the partial unique index on `is_active` turn
+        a lost race into an IntegrityError, and the change is re-run
+        against the winner's committed state.
+        """
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            db = SessionLocal()
+            try:
+                if db.bind.dialect.name == "postgresql":
+                    db.execute(text("LOCK TABLE parsing_schemas IN SHARE ROW EXCLUSIVE MODE"))
+                row = change(db)
+                return self._compile_row(row) if row else None
+            except IntegrityError:
+                db.rollback()
+                if attempt == WRITE_ATTEMPTS:
+                    raise
+                logger.info(f"Parsing schema change raced another one, retrying ({attempt}/{WRITE_ATTEMPTS})")
+            finally:
+                db.close()
+
+    def invalidate(self) -> None:
+        """Forget the cached active version so the next lookup re-reads it."""
+        with self._lock:
+            self._active_version = None
+            self._active_checked_at = 0.0
+
+    def _set_active(self, version: int) -> None:
+        with self._lock:
+            self._active_version = version
+            self._active_checked_at = time.monotonic()
+
+    def _compile_row(self, row: ParsingSchema) -> CompiledSchema:
+        with self._lock:
+            if row.version in self._compiled:
+                return self._compiled[row.version]
+
+        compiled = CompiledSchema(
+            version=row.version,
+            schema=row.schema,
+            fingerprint=row.fingerprint,
+            system_prompt=email_parser._build_system_prompt(row.schema),
+            packed_system_prompt=email_parser._build_packed_system_prompt(row.schema),
+            validator=Draft7Validator(row.schema),
+        )
+        with self._lock:
+            self._compiled[row.version] = compiled
+        return compiled
+
+    def _seed(self, db) -> ParsingSchema:
+        """Create version 1 from the legacy schema file, or the default schema."""
+        schema = DEFAULT_PARSING_SCHEMA
+        try:
+            if os.path.exists(SCHEMA_FILE):
+                with open(SCHEMA_FILE, 'r') as f:
+                    schema = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading schema file, using default: {e}")
+
+        row = ParsingSchema(
+            version=1,
+            schema=schema,
+            fingerprint=schema_fingerprint(schema),
+            is_active=True,
+        )
+        db.add(row)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another process seeded first
+            db.rollback()
+            return db.query(ParsingSchema).filter(ParsingSchema.is_active.is_(True)).one()
+        db.refresh(row)
+        logger.info("Seeded parsing schema v1")
+        return row
+
+
+# Singleton instance
+schema_registry = SchemaRegistry()
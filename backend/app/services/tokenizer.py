@@ -0,0 +1,119 @@
+"""Token counting and token-budgeted truncation for prompts."""
+import logging
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Approximates BPE pieces (whitespace-prefixed word chunks of up to four
+# characters, or single punctuation marks) when the real encoding is missing
+_APPROX_PIECES = re.compile(r"\s*\w{1,4}|\s*[^\w\s]|\s+")
+
+# Only snap a cut to a line break if it costs less than this share of the window
+_LINE_SNAP_RATIO = 0.2
+
+
+class Tokenizer:
+    """
+    Wrapper around a tiktoken encoding.
+
+    The encoding files are baked into the Docker image (see
+    TIKTOKEN_CACHE_DIR in the Dockerfile) so no network is needed at
+    runtime. If the encoding still can't be loaded, a regex approximation
+    is used so parsing keeps working, and a warning is logged once.
+    """
+
+    def __init__(self, encoding_name: Optional[str] = None):
+        self.encoding_name = encoding_name or settings.TOKENIZER_ENCODING
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(f"Tokenizer '{self.encoding_name}' unavailable, approximating counts: {e}")
+                    self._loaded = True
+        return self._encoding
+
+    def encode(self, text: str) -> List:
+        if self.encoding is None:
+            return _APPROX_PIECES.findall(text)
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens: List) -> str:
+        if self.encoding is None:
+            return "".join(tokens)
+        return self.encoding.decode(tokens)
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text)) if text else 0
+
+    def truncate_middle(
+        self,
+        text: str,
+        max_tokens: int,
+        tail_ratio: Optional[float] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Fit text into `max_tokens` by keeping its head and tail.
+
+        Long emails put the offer up front and contact details in the
+        signature at the bottom, so the middle is what gets dropped. Cuts
+        are moved to the nearest line break when that's cheap, and a marker
+        replaces the omitted part.
+
+        Returns:
+            The fitted text and stats: original_tokens, kept_tokens,
+            tokens_saved and truncated.
+        """
+        tail_ratio = settings.PROMPT_TAIL_RATIO if tail_ratio is None else tail_ratio
+        tokens = self.encode(text)
+        original = len(tokens)
+
+        if original <= max_tokens:
+            return text, {
+                "original_tokens": original,
+                "kept_tokens": original,
+                "tokens_saved": 0,
+                "truncated": False,
+            }
+
+        marker_template = "\n\n[... {} tokens omitted ...]\n\n"
+        budget = max(max_tokens - self.count(marker_template.format(original)), 0)
+        tail_count = int(budget * tail_ratio)
+        head_count = budget - tail_count
+
+        head = self.decode(tokens[:head_count])
+        tail = self.decode(tokens[original - tail_count:]) if tail_count else ""
+
+        # Prefer ending the head and starting the tail on whole lines
+        head_break = head.rfind("\n")
+        if head_break >= len(head) * (1 - _LINE_SNAP_RATIO):
+            head = head[:head_break]
+        tail_break = tail.find("\n")
+        if 0 <= tail_break <= len(tail) * _LINE_SNAP_RATIO:
+            tail = tail[tail_break + 1:]
+
+        kept = self.count(head) + self.count(tail)
+        fitted = head.rstrip() + marker_template.format(original - kept) + tail.lstrip()
+
+        return fitted, {
+            "original_tokens": original,
+            "kept_tokens": kept,
+            "tokens_saved": original - kept,
+            "truncated": True,
+        }
+
+
+# Singleton instance
+tokenizer = Tokenizer()
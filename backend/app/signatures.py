@@ -0,0 +1,24 @@
+"""
+Near-duplicate signature command.
+
+Computes the SimHash signature of emails stored before signatures were
+computed on write, so they can serve as template siblings:
+
+    python -m app.signatures
+
+Run it once after upgrading; it only touches emails without one, in
+batches, and can be interrupted and run again.
+"""
+import argparse
+import json
+import logging
+
+from app.services.near_duplicates import SIGNATURE_BACKFILL_CHUNK, near_duplicates
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill in missing near-duplicate signatures")
+    parser.add_argument("--batch-size", type=int, default=SIGNATURE_BACKFILL_CHUNK, help="Emails per commit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    print(json.dumps({"filled": near_duplicates.fill_missing_signatures(args.batch_size)}))
@@ -0,0 +1,183 @@
+"""
+Parse worker process.
+
+Consumes parse tasks from the job queue and runs them through the parsing
+engine, and requeues emails whose parse lease expired and tasks held by
+workers that stopped beating (a parser died).
+Start as many of these as needed to scale parsing horizontally:
+
+    python -m app.worker --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+from app.services.email_leases import email_leases
+from app.services.job_queue import JobQueue, ParseTask, get_job_queue
+from app.services.parsing_engine import ParsingEngine
+from app.services.schema_registry import schema_registry
+
+logger = logging.getLogger(__name__)
+
+# Failures that retrying will never fix ("leased": another parser or job has the
+# email, "reviewed": corrected since it was queued)
+PERMANENT_ERRORS = {"not_found", "no_content", "leased", "reviewed"}
+
+# Parse result fields passed on in job events (the parsed data is left out)
+EVENT_FIELDS = (
+    "model", "usage", "cached", "packed", "pre_extracted", "near_duplicate_of",
+    "schema_version", "error_code", "error",
+)
+
+
+async def settle(queue: JobQueue, worker_id: str, task: ParseTask, result: Dict[str, Any]) -> None:
+    """Acknowledge, retry or dead-letter a task based on its parse result."""
+    details = {field: result[field] for field in EVENT_FIELDS if field in result}
+    if result["success"]:
+        details["validation_errors"] = len(result.get("validation_errors") or [])
+        await queue.complete(worker_id, task, success=True, details=details)
+    elif result.get("error_code") in PERMANENT_ERRORS:
+        await queue.complete(worker_id, task, success=False, details=details)
+    else:
+        await queue.retry(worker_id, task, result.get("error", "Unknown error"))
+
+
+async def process_task(queue: JobQueue, engine: ParsingEngine, worker_id: str, task: ParseTask) -> None:
+    """Parse one queued email."""
+    schema = await asyncio.to_thread(schema_registry.get_active)
+    result = await engine.parse_one(task.email_id, schema, [task.job_id])
+    await settle(queue, worker_id, task, result)
+
+
+async def process_tasks(queue: JobQueue, engine: ParsingEngine, worker_id: str, tasks: List[ParseTask]) -> None:
+    """Parse several queued emails together so short ones can share completions."""
+    schema = await asyncio.to_thread(schema_registry.get_active)
+
+    # The same email may be queued by more than one job; parse it once
+    by_email: Dict[int, List[ParseTask]] = {}
+    for task in tasks:
+        by_email.setdefault(task.email_id, []).append(task)
+
+    jobs = {email_id: [task.job_id for task in queued] for email_id, queued in by_email.items()}
+    async for result in engine.parse_many(list(by_email), schema, pack=True, jobs=jobs):
+        for task in by_email[result["email_id"]]:
+            await settle(queue, worker_id, task, result)
+
+
+async def consume(queue: JobQueue, engine: ParsingEngine, worker_id: str, stop: asyncio.Event) -> None:
+    """Claim and process tasks until asked to stop."""
+    while not stop.is_set():
+        try:
+            if settings.PACKING_ENABLED:
+                tasks = await queue.claim_many(worker_id, settings.PACK_MAX_EMAILS, timeout=1.0)
+                if tasks:
+                    await process_tasks(queue, engine, worker_id, tasks)
+                continue
+
+            task = await queue.claim(worker_id, timeout=1.0)
+            if task is None:
+                continue
+            await process_task(queue, engine, worker_id, task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Worker {worker_id} error: {e}")
+            await asyncio.sleep(1.0)
+
+
+async def beat(queue: JobQueue, worker_id: str, stop: asyncio.Event) -> None:
+    """Keep this worker's heartbeat alive until asked to stop."""
+    while not stop.is_set():
+        try:
+            await queue.heartbeat(worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Worker {worker_id} heartbeat error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), settings.WORKER_HEARTBEAT_TTL_SECONDS / 3)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def reap(queue: JobQueue, stop: asyncio.Event) -> None:
+    """
+    Every PARSE_LEASE_REAP_SECONDS until asked to stop, requeue emails with
+    expired parse leases and the tasks of workers that stopped beating.
+    """
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(email_leases.requeue_expired)
+            await queue.recover_stale()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Lease reaper error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), settings.PARSE_LEASE_REAP_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_worker(
+    concurrency: Optional[int] = None,
+    worker_id: Optional[str] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    """
+    Run `concurrency` consumers against the job queue until `stop` is set.
+
+    The worker ID names this worker's processing list and owns its parse
+    leases, so it must be unique among running workers (the default is
+    hostname and PID). Tasks a worker was holding when it died are
+    requeued by whichever worker's reaper notices its heartbeat expired,
+    or straight away by a restarted worker with the same WORKER_ID.
+    """
+    concurrency = concurrency or settings.WORKER_CONCURRENCY
+    worker_id = worker_id or os.environ.get("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or asyncio.Event()
+
+    queue = get_job_queue()
+    engine = ParsingEngine(concurrency=concurrency, lease_owner=worker_id)
+    await queue.heartbeat(worker_id)
+    await queue.recover(worker_id)
+
+    logger.info(f"Worker {worker_id} started with concurrency {concurrency}")
+    consumers = [
+        asyncio.create_task(consume(queue, engine, worker_id, stop))
+        for _ in range(concurrency)
+    ]
+    consumers.append(asyncio.create_task(beat(queue, worker_id, stop)))
+    consumers.append(asyncio.create_task(reap(queue, stop)))
+    try:
+        await asyncio.gather(*consumers)
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+        logger.info(f"Worker {worker_id} stopped")
+
+
+async def main(concurrency: Optional[int] = None) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await run_worker(concurrency=concurrency, stop=stop)
+    finally:
+        await get_job_queue().backend.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a parse worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="Parallel tasks (default: WORKER_CONCURRENCY)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    asyncio.run(main(args.concurrency))
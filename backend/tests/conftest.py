@@ -0,0 +1,99 @@
+"""
+Test setup: a throwaway SQLite database and the in-process stand-ins for
+the LLM, the job queue and the Batch API, so the suite needs no services.
+"""
+import os
+import tempfile
+
+# Settings are read when app is first imported, so point them at the
+# stand-ins before anything imports it
+_DB_DIR = tempfile.mkdtemp(prefix="emailparser-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ["OPENAI_API_KEY"] = "test"
+os.environ["LLM_BACKEND"] = "mock"
+os.environ["MOCK_LLM_LATENCY"] = "fixed"
+os.environ["MOCK_LLM_LATENCY_MS"] = "0"
+os.environ["JOB_QUEUE_BACKEND"] = "memory"
+os.environ["PARSE_CACHE_ENABLED"] = "false"
+
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import app.models  # noqa: F401 (registers every table)
+from app.core.database import Base, SessionLocal, async_engine, engine
+from app.models.email import Email, EmailStatus
+from app.models.email_content import EmailContent
+from app.models.gmail_account import GmailAccount
+
+# Kept between tests: the schema registry caches compiled versions per
+# process, and email_changes is a single row that only grows
+KEPT_TABLES = {"parsing_schemas", "email_changes"}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    Base.metadata.create_all(engine)
+    yield
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name not in KEPT_TABLES:
+                conn.execute(table.delete())
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+async def api():
+    """Client for the API app (without its lifespan, so no in-process worker)."""
+    from app.main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver/api") as client:
+        yield client
+    # aiosqlite connections belong to this test's event loop
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def account(db) -> GmailAccount:
+    account = GmailAccount(
+        email="inbox@example.com",
+        access_token="access",
+        refresh_token="refresh",
+        token_expiry=datetime.utcnow() + timedelta(hours=1),
+    )
+    db.add(account)
+    db.commit()
+    return account
+
+
+@pytest.fixture
+def make_email(db, account):
+    """Factory for stored emails; keyword arguments override Email columns."""
+    counter = iter(range(1, 1_000_000))
+
+    def make(body_text: str = "Hello, we have an offer for you.", **columns) -> Email:
+        n = next(counter)
+        columns.setdefault("status", EmailStatus.PENDING)
+        columns.setdefault("subject", f"Offer {n}")
+        columns.setdefault("sender", f"sender{n}@example.com")
+        columns.setdefault("received_at", datetime(2026, 1, 1) + timedelta(minutes=n))
+        email = Email(gmail_account_id=account.id, gmail_message_id=f"msg-{n}", **columns)
+        email.content = EmailContent(body_text=body_text)
+        db.add(email)
+        db.commit()
+        return email
+
+    return make
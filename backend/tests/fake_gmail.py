@@ -0,0 +1,155 @@
+"""
+Local stand-in for the Gmail API and Google's token endpoint.
+
+Serves the endpoints GmailClient uses (profile, message list, history,
+messages) from an in-memory mailbox, with hooks to make individual
+messages fail: HTTP errors, deletion, or dropped connections.
+`transport()` routes an httpx client to it in-process, whatever host
+GMAIL_API_BASE_URL and GOOGLE_TOKEN_URL name.
+"""
+import base64
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+API_PREFIX = "/gmail/v1/users/me"
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+
+class FakeGmail:
+    def __init__(self, access_token: str = "access"):
+        self.access_token = access_token
+        self.history_id = 100
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        # (history ID, message ID) of every added message, oldest first
+        self.history: List[tuple] = []
+        # History IDs below this answer 404, as when Gmail has dropped them
+        self.expired_before = 0
+        # Message ID -> status codes to answer with, one per request, before the message
+        self.errors: Dict[str, deque] = defaultdict(deque)
+        # Message ID -> requests to drop before a response is sent
+        self.drops: Dict[str, int] = defaultdict(int)
+        self.fetches: Dict[str, int] = defaultdict(int)
+        self.app = self._build_app()
+
+    def add(self, count: int = 1) -> List[str]:
+        """Deliver `count` new messages; returns their IDs."""
+        added = []
+        for _ in range(count):
+            n = len(self.history)
+            self.history_id += 1
+            message_id = f"m{n:05d}"
+            self.messages[message_id] = {
+                "id": message_id,
+                "threadId": f"t{n}",
+                "historyId": str(self.history_id),
+                "internalDate": str(1_767_225_600_000 + n * 60_000),
+                "payload": {
+                    "mimeType": "multipart/alternative",
+                    "headers": [
+                        {"name": "From", "value": f"Outreach {n} <outreach{n}@example.com>"},
+                        {"name": "Subject", "value": f"Guest post offer #{n}"},
+                    ],
+                    "parts": [
+                        {"mimeType": "text/plain", "body": {"data": _b64(f"Guest post on site{n}.com for ${n}0")}},
+                        {"mimeType": "text/html", "body": {"data": _b64(f"<p>Guest post on site{n}.com</p>")}},
+                    ],
+                },
+            }
+            self.history.append((self.history_id, message_id))
+            added.append(message_id)
+        return added
+
+    def fail(self, message_id: str, *status_codes: int) -> None:
+        """Answer the next requests for a message with these statuses."""
+        self.errors[message_id].extend(status_codes)
+
+    def drop(self, message_id: str, times: int = 1) -> None:
+        """Drop the connection on the next `times` requests for a message."""
+        self.drops[message_id] += times
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return _Transport(self)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        def unauthorized(request: Request) -> Optional[JSONResponse]:
+            if request.headers.get("authorization") != f"Bearer {self.access_token}":
+                return JSONResponse(status_code=401, content={"error": "invalid_token"})
+            return None
+
+        def page(items: List[Any], max_results: int, page_token: Optional[str]) -> tuple:
+            start = int(page_token or 0)
+            end = start + max_results
+            return items[start:end], (str(end) if end < len(items) else None)
+
+        @app.post("/token")
+        async def token():
+            self.access_token = f"access-{self.history_id}"
+            return {"access_token": self.access_token, "expires_in": 3600}
+
+        @app.get(f"{API_PREFIX}/profile")
+        async def profile(request: Request):
+            return unauthorized(request) or {"historyId": str(self.history_id)}
+
+        @app.get(f"{API_PREFIX}/messages")
+        async def list_messages(request: Request, maxResults: int = 100, pageToken: Optional[str] = None):
+            if denied := unauthorized(request):
+                return denied
+            newest_first = [message_id for _, message_id in reversed(self.history) if message_id in self.messages]
+            ids, next_token = page(newest_first, maxResults, pageToken)
+            body = {"messages": [{"id": message_id} for message_id in ids]}
+            if next_token:
+                body["nextPageToken"] = next_token
+            return body
+
+        @app.get(f"{API_PREFIX}/messages/{{message_id}}")
+        async def get_message(request: Request, message_id: str):
+            if denied := unauthorized(request):
+                return denied
+            self.fetches[message_id] += 1
+            if self.errors[message_id]:
+                return JSONResponse(status_code=self.errors[message_id].popleft(), content={}, headers={"retry-after": "0"})
+            if message_id not in self.messages:
+                return JSONResponse(status_code=404, content={"error": "not found"})
+            return self.messages[message_id]
+
+        @app.get(f"{API_PREFIX}/history")
+        async def list_history(
+            request: Request, startHistoryId: int, maxResults: int = 100, pageToken: Optional[str] = None,
+        ):
+            if denied := unauthorized(request):
+                return denied
+            if startHistoryId < self.expired_before:
+                return JSONResponse(status_code=404, content={"error": "history expired"})
+            records = [
+                {"id": str(history_id), "messagesAdded": [{"message": {"id": message_id}}]}
+                for history_id, message_id in self.history if history_id > startHistoryId
+            ]
+            records, next_token = page(records, maxResults, pageToken)
+            body = {"history": records, "historyId": str(self.history_id)}
+            if next_token:
+                body["nextPageToken"] = next_token
+            return body
+
+        return app
+
+
+class _Transport(httpx.ASGITransport):
+    def __init__(self, fake: FakeGmail):
+        super().__init__(app=fake.app)
+        self.fake = fake
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        message_id = request.url.path.rsplit("/", 1)[-1]
+        if self.fake.drops.get(message_id):
+            self.fake.drops[message_id] -= 1
+            raise httpx.ConnectError("Connection dropped", request=request)
+        return await super().handle_async_request(request)
@@ -0,0 +1,113 @@
+"""Backfills end to end against the Batch API stand-in in app.mock_llm."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import mock_llm
+from app.models.backfill_run import BackfillRun, BackfillStatus
+from app.models.email import Email, EmailStatus
+from app.services.backfill import Backfill
+from app.services.batch_client import BatchClient
+
+
+@pytest.fixture
+def batch_client():
+    with TestClient(mock_llm.app, base_url="http://testserver/v1") as http:
+        client = BatchClient(base_url="http://testserver/v1", api_key="test")
+        client._client = http
+        yield client
+    mock_llm.files.clear()
+    mock_llm.batches.clear()
+
+
+def run_to_completion(backfill: Backfill, run_id: int) -> BackfillStatus:
+    for _ in range(500):
+        status = backfill.advance(run_id)
+        if status not in (BackfillStatus.SUBMITTED, BackfillStatus.APPLYING):
+            return status
+    raise AssertionError("Backfill run didn't finish")
+
+
+def statuses(db, emails):
+    db.expire_all()
+    return [db.get(Email, email.id).status for email in emails]
+
+
+def test_backfill_parses_pending_emails(db, make_email, batch_client):
+    emails = [make_email() for _ in range(3)]
+
+    summaries = Backfill(client=batch_client).run(poll_seconds=0.01)
+
+    assert [s["status"] for s in summaries] == ["applied"]
+    assert summaries[0]["parsed"] == 3
+    assert statuses(db, emails) == [EmailStatus.PARSED] * 3
+    parsed = db.get(Email, emails[0].id)
+    assert parsed.parsed_data and parsed.lease_owner is None
+
+
+def test_interrupted_submit_adopts_the_created_batch(db, make_email, batch_client, monkeypatch):
+    make_email()
+    backfill = Backfill(client=batch_client)
+    run_id, _ = backfill.prepare()
+
+    create_batch = batch_client.create_batch
+
+    def create_then_crash(*args, **kwargs):
+        create_batch(*args, **kwargs)
+        raise ConnectionError("lost the response")
+
+    monkeypatch.setattr(batch_client, "create_batch", create_then_crash)
+    with pytest.raises(ConnectionError):
+        backfill.advance(run_id)
+    monkeypatch.setattr(batch_client, "create_batch", create_batch)
+
+    assert run_to_completion(backfill, run_id) == BackfillStatus.APPLIED
+    assert len(mock_llm.batches) == 1
+    assert db.get(BackfillRun, run_id).batch_id in mock_llm.batches
+
+
+def test_unreadable_result_line_fails_only_its_email(db, make_email, batch_client, monkeypatch):
+    good, bad = make_email(), make_email()
+    backfill = Backfill(client=batch_client)
+
+    iter_file_lines = batch_client.iter_file_lines
+
+    def corrupt(file_id):
+        for record in iter_file_lines(file_id):
+            if record["custom_id"] == f"email-{bad.id}":
+                record["response"]["body"] = {"not": "a completion"}
+            yield record
+
+    monkeypatch.setattr(batch_client, "iter_file_lines", corrupt)
+    run_id, _ = backfill.prepare()
+
+    assert run_to_completion(backfill, run_id) == BackfillStatus.APPLIED
+    assert statuses(db, [good, bad]) == [EmailStatus.PARSED, EmailStatus.FAILED]
+    assert "Unreadable batch result" in db.get(Email, bad.id).error_message
+
+
+def test_emails_taken_over_during_the_batch_are_left_alone(db, make_email, batch_client):
+    kept, taken = make_email(), make_email()
+    backfill = Backfill(client=batch_client)
+    run_id, _ = backfill.prepare()
+
+    # A worker claims one email after the run's lease lapsed from under it
+    db.query(Email).filter(Email.id == taken.id).update({Email.lease_owner: "worker-1"})
+    db.commit()
+
+    assert run_to_completion(backfill, run_id) == BackfillStatus.APPLIED
+    db.expire_all()
+    assert db.get(Email, kept.id).status == EmailStatus.PARSED
+    taken = db.get(Email, taken.id)
+    assert (taken.status, taken.lease_owner, taken.parsed_data) == (EmailStatus.PARSING, "worker-1", None)
+
+
+def test_stand_in_lists_batches_newest_first(batch_client, tmp_path):
+    path = tmp_path / "input.jsonl"
+    path.write_text(json.dumps({"custom_id": "email-1", "body": {"messages": [{"role": "user", "content": "hi"}]}}) + "\n")
+    file_ids = [batch_client.upload_file(str(path)) for _ in range(3)]
+    batch_ids = [batch_client.create_batch(file_id)["id"] for file_id in file_ids]
+
+    assert batch_client.find_batch(file_ids[0])["id"] == batch_ids[0]
+    assert batch_client.find_batch("file-unknown") is None
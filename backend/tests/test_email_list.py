@@ -0,0 +1,70 @@
+"""Conditional GET of the email list."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, update
+
+from app.core.database import async_engine
+from app.models.email import Email
+
+
+@pytest.fixture
+def statements():
+    """SQL statements run while the test is in progress."""
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+async def test_revalidation_skips_the_count_and_the_page(api, make_email, statements):
+    for _ in range(3):
+        make_email()
+    first = await api.get("/emails/", params={"page_size": 2})
+    assert first.status_code == 200 and first.json()["total"] == 3
+
+    statements.clear()
+    again = await api.get("/emails/", params={"page_size": 2}, headers={"If-None-Match": first.headers["etag"]})
+
+    assert again.status_code == 304
+    assert again.headers["etag"] == first.headers["etag"]
+    assert not any("LIMIT" in statement for statement in statements)
+
+
+async def test_any_change_makes_lists_stale(api, make_email):
+    email = make_email()
+    etag = (await api.get("/emails/")).headers["etag"]
+
+    await api.patch(f"/emails/{email.id}", json={"status": "failed"})
+    changed = await api.get("/emails/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["emails"][0]["status"] == "failed"
+
+    make_email()
+    arrived = await api.get("/emails/", headers={"If-None-Match": changed.headers["etag"]})
+    assert arrived.status_code == 200 and arrived.json()["total"] == 2
+
+
+async def test_change_stamped_earlier_still_makes_lists_stale(api, db, make_email):
+    email, _ = make_email(), make_email()
+    etag = (await api.get("/emails/")).headers["etag"]
+
+    # Flushed long before it committed, or written by a host whose clock is behind
+    db.execute(update(Email).where(Email.id == email.id).values(subject="Renamed", updated_at=datetime(2000, 1, 1)))
+    db.commit()
+
+    changed = await api.get("/emails/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert "Renamed" in [e["subject"] for e in changed.json()["emails"]]
+
+
+async def test_tag_depends_on_the_query(api, make_email):
+    make_email()
+    etag = (await api.get("/emails/")).headers["etag"]
+
+    other = await api.get("/emails/", params={"status": "parsed"}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.json()["emails"] == []
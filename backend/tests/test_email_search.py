@@ -0,0 +1,82 @@
+"""Full-text search on the SQLite FTS5 index (PostgreSQL uses email_search instead)."""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def ingest(api, account):
+    """Store emails through the bulk endpoint, which indexes them for search; returns their IDs."""
+    counter = iter(range(1, 1_000_000))
+
+    async def ingest(*emails):
+        lines = []
+        for email in emails:
+            n = next(counter)
+            lines.append(json.dumps({
+                "gmail_account_id": account.id,
+                "gmail_message_id": f"search-{n}",
+                "subject": "Hello",
+                "sender": f"sender{n}@example.com",
+                "body_text": "Nothing to see here.",
+                "received_at": (datetime(2026, 1, 1) + timedelta(minutes=n)).isoformat(),
+                **email,
+            }))
+        response = await api.post("/emails/bulk", content="\n".join(lines) + "\n")
+        assert response.json()["inserted"] == len(emails)
+        found = await api.get("/emails/", params={"page_size": 100})
+        by_message = {e["subject"]: e["id"] for e in found.json()["emails"]}
+        return [by_message[email.get("subject", "Hello")] for email in emails]
+
+    return ingest
+
+
+async def search(api, q, **params):
+    response = await api.get("/emails/search", params={"q": q, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_subject_outranks_sender_outranks_body(api, ingest):
+    body, sender, subject = await ingest(
+        {"subject": "Monday", "body_text": "We'd like to discuss a sponsorship of your blog."},
+        {"subject": "Tuesday", "sender_name": "Sponsorship Team"},
+        {"subject": "Sponsorship offer"},
+    )
+
+    results = (await search(api, "sponsorship"))["results"]
+
+    assert [r["id"] for r in results] == [subject, sender, body]
+    assert results[0]["rank"] > results[1]["rank"] > results[2]["rank"]
+
+
+async def test_highlights_escape_html_around_marks(api, ingest):
+    await ingest({
+        "subject": "<b>Guest</b> posts & more",
+        "body_text": "Reply with <script>alert(1)</script> for a guest post.",
+    })
+
+    result = (await search(api, "guest"))["results"][0]
+
+    assert result["subject_highlight"] == "&lt;b&gt;<mark>Guest</mark>&lt;/b&gt; posts &amp; more"
+    assert "&lt;script&gt;alert(1)&lt;/script&gt;" in result["snippet"]
+    assert "<mark>guest</mark>" in result["snippet"]
+    assert "<script>" not in result["snippet"]
+
+
+async def test_pages_of_equal_ranks_neither_repeat_nor_skip(api, ingest):
+    ids = await ingest(*({"subject": f"Offer {i}", "body_text": "Link insertion on our blog."} for i in range(5)))
+    await ingest({"subject": "Unrelated", "body_text": "Quarterly invoice attached."})
+
+    seen, ranks, cursor = [], set(), None
+    while True:
+        page = await search(api, "link insertion", page_size=2, **({"cursor": cursor} if cursor else {}))
+        seen += [r["id"] for r in page["results"]]
+        ranks |= {r["rank"] for r in page["results"]}
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(ranks) == 1  # Every match ranks the same, so only the ID orders them
+    assert seen == sorted(ids, reverse=True)
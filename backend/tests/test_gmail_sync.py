@@ -0,0 +1,131 @@
+"""Gmail sync against the local stand-in server in tests/fake_gmail.py."""
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.models.email import Email
+from app.models.gmail_account import GmailAccount
+from app.services import gmail_client
+from app.services.gmail_sync import GmailSync
+from tests.fake_gmail import FakeGmail
+
+
+@pytest.fixture(autouse=True)
+async def fast_sync(monkeypatch):
+    monkeypatch.setattr(settings, "GMAIL_PAGE_SIZE", 4)
+    monkeypatch.setattr(gmail_client, "MAX_BACKOFF_SECONDS", 0.0)
+    yield
+    # aiosqlite connections belong to this test's event loop
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def gmail():
+    return FakeGmail()
+
+
+@pytest.fixture
+def sync(gmail):
+    return GmailSync(transport=gmail.transport())
+
+
+def stored_ids(db):
+    db.expire_all()
+    return sorted(message_id for (message_id,) in db.query(Email.gmail_message_id))
+
+
+def checkpoint(db, account):
+    db.expire_all()
+    return db.get(GmailAccount, account.id).last_history_id
+
+
+async def test_full_import_then_incremental(db, account, gmail, sync):
+    gmail.add(10)
+
+    stats = await sync.sync_account(account.id)
+    assert (stats["mode"], stats["fetched"]) == ("full", 10)
+    assert checkpoint(db, account) == str(gmail.history_id)
+
+    new_ids = gmail.add(3)
+    stats = await sync.sync_account(account.id)
+    assert (stats["mode"], stats["fetched"]) == ("incremental", 3)
+    assert set(new_ids) <= set(stored_ids(db))
+    assert len(stored_ids(db)) == 13
+    assert checkpoint(db, account) == str(gmail.history_id)
+
+
+async def test_expired_history_falls_back_to_full(db, account, gmail, sync):
+    gmail.add(5)
+    await sync.sync_account(account.id)
+    gmail.add(2)
+    gmail.expired_before = gmail.history_id
+
+    stats = await sync.sync_account(account.id)
+
+    assert (stats["mode"], stats["fetched"]) == ("full", 2)
+    assert len(stored_ids(db)) == 7
+
+
+async def test_deleted_message_is_skipped(db, account, gmail, sync):
+    ids = gmail.add(5)
+    gmail.fail(ids[2], 404)
+
+    stats = await sync.sync_account(account.id)
+
+    assert stats["fetch_errors"] == 1
+    assert ids[2] not in stored_ids(db)
+    assert checkpoint(db, account) == str(gmail.history_id)
+
+
+async def test_failed_fetch_keeps_the_checkpoint(db, account, gmail, sync):
+    gmail.add(4)
+    await sync.sync_account(account.id)
+    before = checkpoint(db, account)
+
+    ids = gmail.add(4)
+    gmail.fail(ids[1], *[500] * (gmail_client.MAX_RETRIES + 1))
+    with pytest.raises(httpx.HTTPStatusError):
+        await sync.sync_account(account.id)
+    assert checkpoint(db, account) == before
+    assert ids[1] not in stored_ids(db)
+
+    # The next sync reads the same history again and picks the message up
+    stats = await sync.sync_account(account.id)
+    assert stats["mode"] == "incremental"
+    assert ids[1] in stored_ids(db)
+    assert checkpoint(db, account) == str(gmail.history_id)
+
+
+async def test_dropped_connections_are_retried(db, account, gmail, sync):
+    ids = gmail.add(3)
+    gmail.drop(ids[0], times=2)
+    gmail.fail(ids[1], 429, 503)
+
+    stats = await sync.sync_account(account.id)
+
+    assert (stats["fetched"], stats["fetch_errors"]) == (3, 0)
+    assert stored_ids(db) == sorted(ids)
+
+
+async def test_connection_that_stays_down_fails_the_sync(db, account, gmail, sync):
+    ids = gmail.add(2)
+    gmail.drop(ids[0], times=gmail_client.MAX_RETRIES + 1)
+
+    with pytest.raises(httpx.ConnectError):
+        await sync.sync_account(account.id)
+
+    assert checkpoint(db, account) is None
+
+
+async def test_rejected_token_is_refreshed(db, account, gmail, sync, monkeypatch):
+    monkeypatch.setattr(settings, "GOOGLE_CLIENT_ID", "client")
+    monkeypatch.setattr(settings, "GOOGLE_CLIENT_SECRET", "secret")
+    gmail.add(2)
+    gmail.access_token = "rotated"
+
+    stats = await sync.sync_account(account.id)
+
+    assert stats["fetched"] == 2
+    db.expire_all()
+    assert db.get(GmailAccount, account.id).access_token == gmail.access_token
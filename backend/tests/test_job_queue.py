@@ -0,0 +1,62 @@
+"""Parse job queue on the in-memory backend."""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.job_queue import JobQueue, MemoryBackend, ParseTask
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_HEARTBEAT_TTL_SECONDS", 0.05)
+    return JobQueue(MemoryBackend())
+
+
+async def claimed(queue: JobQueue, worker_id: str, count: int):
+    tasks = await queue.claim_many(worker_id, count, timeout=0.1)
+    return sorted(task.email_id for task in tasks)
+
+
+async def test_dead_workers_tasks_are_recovered_by_another(queue):
+    await queue.enqueue_parse([1, 2, 3])
+    await queue.heartbeat("dead")
+    assert await claimed(queue, "dead", 3) == [1, 2, 3]
+
+    await asyncio.sleep(0.1)
+    await queue.heartbeat("alive")
+
+    assert await queue.recover_stale() == 3
+    assert await claimed(queue, "alive", 3) == [1, 2, 3]
+    assert await queue.recover_stale() == 0
+
+
+async def test_live_workers_tasks_are_left_alone(queue, monkeypatch):
+    monkeypatch.setattr(settings, "WORKER_HEARTBEAT_TTL_SECONDS", 30.0)
+    await queue.enqueue_parse([1, 2])
+    await queue.heartbeat("busy")
+    await claimed(queue, "busy", 2)
+
+    assert await queue.recover_stale() == 0
+    assert await queue.claim("other", timeout=0.1) is None
+
+
+async def test_worker_beating_again_is_watched_again(queue):
+    await queue.heartbeat("flaky")
+    await asyncio.sleep(0.1)
+    assert await queue.recover_stale() == 0  # Nothing held, just forgotten
+
+    await queue.enqueue_parse([7])
+    await queue.heartbeat("flaky")
+    await claimed(queue, "flaky", 1)
+    await asyncio.sleep(0.1)
+
+    assert await queue.recover_stale() == 1
+
+
+async def test_restarted_worker_recovers_its_own_tasks(queue):
+    await queue.enqueue_parse([5])
+    task = await queue.claim("worker-1", timeout=0.1)
+
+    assert await queue.recover("worker-1") == 1
+    assert await queue.claim("worker-1", timeout=0.1) == ParseTask(task.job_id, 5)
@@ -0,0 +1,62 @@
+"""Template sibling lookup through the indexed signature bands."""
+from app.models.email import EmailStatus
+from app.services.near_duplicates import email_simhash, near_duplicates, signature_bands
+from app.services.parsing_engine import prompt_inputs
+from app.services.schema_registry import schema_registry
+
+TEMPLATE = (
+    "Hi {name},\n\nWe run {site}, a technology blog with steady organic traffic. "
+    "We offer sponsored guest posts with a permanent dofollow link, published "
+    "within three business days, for {price} per article. Bulk orders get a discount.\n\n"
+    "Best regards,\nOutreach team"
+)
+
+
+def sibling_pair(make_email, reference_data):
+    schema = schema_registry.get_active()
+    reference_body = TEMPLATE.format(name="Anna", site="techdaily.com", price="$150")
+    reference = make_email(
+        reference_body,
+        status=EmailStatus.PARSED,
+        schema_version=schema.version,
+        parsed_data=reference_data,
+        simhash=email_simhash(reference_body),
+    )
+    body = TEMPLATE.format(name="Ben", site="gadgetweekly.com", price="$150")
+    email = make_email(body, simhash=email_simhash(body))
+    return schema, reference, email
+
+
+def test_bands_are_derived_by_the_database(db, make_email):
+    body = TEMPLATE.format(name="Anna", site="techdaily.com", price="$150")
+    email = make_email(body, simhash=email_simhash(body))
+    db.refresh(email)
+
+    bands = [email.simhash_band0, email.simhash_band1, email.simhash_band2, email.simhash_band3]
+    assert bands == signature_bands(email.simhash)
+
+
+def test_sibling_fields_are_reused_only_when_set_and_unchanged(db, make_email):
+    schema, reference, email = sibling_pair(make_email, {
+        "offer_type": "guest_post",
+        "website_url": "techdaily.com",
+        "contact_name": None,
+    })
+
+    found = near_duplicates.find_reference(email.id, prompt_inputs(email), schema)
+    db.commit()
+
+    assert found["reference_id"] == reference.id
+    assert found["stable_data"] == {"offer_type": "guest_post"}
+    # The changed domain and the sibling's null are both asked again
+    assert "website_url" in found["unstable_paths"]
+    assert "contact_name" in found["unstable_paths"]
+    assert "offer_type" not in found["unstable_paths"]
+
+
+def test_other_schema_versions_are_not_siblings(db, make_email):
+    schema, reference, email = sibling_pair(make_email, {"offer_type": "guest_post"})
+    reference.schema_version = schema.version + 1
+    db.commit()
+
+    assert near_duplicates.find_reference(email.id, prompt_inputs(email), schema) is None
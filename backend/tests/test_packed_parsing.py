@@ -0,0 +1,38 @@
+"""Packed parse batches in which one email cannot be prepared."""
+import pytest
+
+from app.models.email import Email, EmailStatus
+from app.services.parsing_engine import parsing_engine
+from app.services.schema_registry import schema_registry
+
+
+@pytest.fixture(autouse=True)
+async def stop_heartbeat():
+    yield
+    if parsing_engine._heartbeat:
+        parsing_engine._heartbeat.cancel()
+
+
+async def test_failed_preparation_fails_only_that_email(db, make_email, monkeypatch):
+    emails = [make_email(f"Guest post on site{n}.com for ${n}0") for n in range(3)]
+    broken = emails[1].id
+    find_reference = parsing_engine._find_reference
+
+    async def flaky_find_reference(email_id, inputs, schema):
+        if email_id == broken:
+            raise RuntimeError("signature lookup failed")
+        return await find_reference(email_id, inputs, schema)
+
+    monkeypatch.setattr(parsing_engine, "_find_reference", flaky_find_reference)
+
+    results = [r async for r in parsing_engine.parse_many(
+        [e.id for e in emails], schema_registry.get_active(), pack=True,
+    )]
+
+    by_id = {r["email_id"]: r for r in results}
+    assert sorted(by_id) == sorted(e.id for e in emails)
+    assert (by_id[broken]["success"], by_id[broken]["error_code"]) == (False, "error")
+    assert all(r["success"] for email_id, r in by_id.items() if email_id != broken)
+    db.expire_all()
+    assert db.get(Email, broken).status == EmailStatus.FAILED
+    assert broken not in parsing_engine._parsing
@@ -0,0 +1,23 @@
+"""Parse cache keys: what copies of one template may share."""
+from datetime import datetime
+
+from app.services.parsing_engine import parsing_engine, prompt_inputs
+from app.services.schema_registry import schema_registry
+
+
+def key(make_email, **columns):
+    schema = schema_registry.get_active()
+    inputs = prompt_inputs(make_email("We offer guest posts for $150.", subject="Guest post", **columns))
+    return parsing_engine._cache_key(inputs, schema)
+
+
+def test_copies_received_at_different_times_share_a_key(make_email):
+    monday = key(make_email, sender="outreach@example.com", received_at=datetime(2026, 3, 2, 9, 0, 1))
+    friday = key(make_email, sender="outreach@example.com", received_at=datetime(2026, 3, 6, 17, 45, 59))
+    assert monday == friday
+
+
+def test_senders_of_one_template_do_not(make_email):
+    anna = key(make_email, sender="outreach@example.com", sender_name="Anna")
+    ben = key(make_email, sender="outreach@example.com", sender_name="Ben")
+    assert anna != ben
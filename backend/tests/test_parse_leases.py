@@ -0,0 +1,104 @@
+"""Queued parse tasks against reviews and leases taken since they were queued."""
+import pytest
+
+from app.models.email import Email, EmailStatus
+from app.services.email_leases import email_leases, job_lease_owner
+from app.services.job_queue import get_job_queue
+from app.services.parsing_engine import ParsingEngine
+from app.services.schema_registry import schema_registry
+
+CORRECTION = {"offer_type": "guest_post"}
+
+
+@pytest.fixture
+async def engines():
+    """Parsing engines for named workers; their lease heartbeats stop with the test."""
+    started = []
+
+    def engine(worker_id: str) -> ParsingEngine:
+        started.append(ParsingEngine(lease_owner=worker_id))
+        return started[-1]
+
+    yield engine
+    for engine in started:
+        if engine._heartbeat:
+            engine._heartbeat.cancel()
+
+
+def reload(db, email_id: int) -> Email:
+    db.expire_all()
+    return db.get(Email, email_id)
+
+
+async def test_task_skips_email_reviewed_since_it_was_queued(db, make_email, engines):
+    # The job's lease lapsed and the email was corrected before a worker got to it
+    email = make_email(status=EmailStatus.REVIEWED, corrected_data=CORRECTION, lease_owner=job_lease_owner("a"))
+
+    result = await engines("worker").parse_one(email.id, schema_registry.get_active(), ["a"])
+
+    assert (result["success"], result["error_code"]) == (False, "reviewed")
+    email = reload(db, email.id)
+    assert (email.status, email.corrected_data) == (EmailStatus.REVIEWED, CORRECTION)
+
+
+async def test_task_leaves_email_queued_again_by_another_job(db, make_email, engines):
+    email = make_email()
+    assert email_leases.claim_email(email.id, job_lease_owner("b"))
+    schema = schema_registry.get_active()
+
+    stale = await engines("worker-1").parse_one(email.id, schema, ["a"])
+    assert (stale["success"], stale["error_code"]) == (False, "leased")
+    assert reload(db, email.id).lease_owner == job_lease_owner("b")
+
+    current = await engines("worker-2").parse_one(email.id, schema, ["b"])
+    assert current["success"]
+    assert reload(db, email.id).status == EmailStatus.PARSED
+
+
+async def test_correction_is_refused_while_queued(api, db, make_email):
+    email = make_email(status=EmailStatus.PARSED, parsed_data={"offer_type": "link_insertion"})
+    assert email_leases.claim_email(email.id, job_lease_owner("a"))
+
+    response = await api.post(f"/parsing/correct/{email.id}", json={"corrected_data": CORRECTION})
+    assert response.status_code == 409
+    response = await api.patch(f"/emails/{email.id}", json={"corrected_data": CORRECTION, "status": "reviewed"})
+    assert response.status_code == 409
+    email = reload(db, email.id)
+    assert (email.status, email.corrected_data) == (EmailStatus.PARSING, None)
+
+
+async def test_correction_clears_an_expired_lease(api, db, make_email):
+    email = make_email()
+    assert email_leases.claim_email(email.id, job_lease_owner("a"), lease_seconds=-1)
+
+    response = await api.post(f"/parsing/correct/{email.id}", json={"corrected_data": CORRECTION})
+    assert response.status_code == 200
+    email = reload(db, email.id)
+    assert (email.status, email.lease_owner, email.lease_expires_at) == (EmailStatus.REVIEWED, None, None)
+
+
+@pytest.fixture
+def broken_queue(monkeypatch):
+    async def enqueue_parse(*args, **kwargs):
+        raise ConnectionError("queue unavailable")
+
+    monkeypatch.setattr(get_job_queue(), "enqueue_parse", enqueue_parse)
+
+
+async def test_failed_enqueue_releases_the_email(api, db, make_email, broken_queue):
+    email = make_email()
+
+    with pytest.raises(ConnectionError):
+        await api.post(f"/parsing/parse/{email.id}")
+
+    email = reload(db, email.id)
+    assert (email.status, email.lease_owner) == (EmailStatus.PENDING, None)
+
+
+async def test_failed_batch_enqueue_releases_the_emails(api, db, make_email, broken_queue):
+    emails = [make_email() for _ in range(2)]
+
+    with pytest.raises(ConnectionError):
+        await api.post("/parsing/parse-batch", json={"count": 2})
+
+    assert [(e.status, e.lease_owner) for e in (reload(db, e.id) for e in emails)] == [(EmailStatus.PENDING, None)] * 2
@@ -0,0 +1,81 @@
+"""Streamed /parse-batch requests that the client abandons."""
+import asyncio
+import json
+from collections import Counter
+
+import pytest
+
+from app.api.endpoints.parsing import parse_batch
+from app.models.email import Email, EmailStatus
+from app.services.openai_parser import email_parser
+from app.services.parsing_engine import parsing_engine
+
+
+@pytest.fixture
+async def slow_parses(monkeypatch):
+    """One parse at a time, each taking a while, so a stream can be cut short."""
+    monkeypatch.setattr(parsing_engine, "concurrency", 1)
+    monkeypatch.setattr(email_parser.backend, "latency_ms", 200)
+    yield
+    if parsing_engine._heartbeat:
+        parsing_engine._heartbeat.cancel()
+
+
+def states(db, emails) -> Counter:
+    db.expire_all()
+    return Counter((e.status, e.lease_owner) for e in (db.get(Email, email.id) for email in emails))
+
+
+def released(parsed: int, total: int) -> Counter:
+    return Counter({(EmailStatus.PARSED, None): parsed, (EmailStatus.PENDING, None): total - parsed})
+
+
+async def test_disconnect_releases_emails_not_parsed(db, make_email, slow_parses):
+    emails = [make_email() for _ in range(4)]
+    response = await parse_batch({"count": 4, "stream": True})
+    lines = []
+
+    async def client():
+        async for line in response.body_iterator:
+            lines.append(json.loads(line))
+
+    task = asyncio.create_task(client())
+    while not lines:
+        await asyncio.sleep(0.01)
+    task.cancel()  # What the server does when the client disconnects
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert lines[0]["success"]
+    assert states(db, emails) == released(parsed=1, total=4)
+
+
+async def test_closed_stream_releases_emails_not_parsed(db, make_email, slow_parses):
+    emails = [make_email() for _ in range(3)]
+    response = await parse_batch({"count": 3, "stream": True})
+
+    first = json.loads(await response.body_iterator.__anext__())
+    await response.body_iterator.aclose()
+
+    assert first["success"]
+    assert states(db, emails) == released(parsed=1, total=3)
+
+
+async def test_closed_stream_stops_parses_in_flight(db, make_email, slow_parses, monkeypatch):
+    # Kept alive, so closing it is up to the endpoint rather than the garbage collector
+    generators = []
+    parse_many = parsing_engine.parse_many
+
+    def kept_parse_many(*args, **kwargs):
+        generators.append(parse_many(*args, **kwargs))
+        return generators[-1]
+
+    monkeypatch.setattr(parsing_engine, "parse_many", kept_parse_many)
+    emails = [make_email() for _ in range(3)]
+    response = await parse_batch({"count": 3, "stream": True})
+
+    await response.body_iterator.__anext__()
+    await response.body_iterator.aclose()
+    await asyncio.sleep(0.5)  # Longer than the parse that was running
+
+    assert states(db, emails) == released(parsed=1, total=3)
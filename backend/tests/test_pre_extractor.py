@@ -0,0 +1,48 @@
+"""Confidence of the pre-extractor's guesses against PRE_EXTRACT_MIN_CONFIDENCE."""
+from app.core.config import settings
+from app.services.pre_extractor import HINT_MIN_CONFIDENCE, pre_extractor
+
+
+def extract(body: str, sender_name: str = "Jane Doe", sender_email: str = "jane@techdaily.com", subject: str = ""):
+    return pre_extractor.extract(body, subject, sender_email, sender_name)
+
+
+def trusted(extraction) -> bool:
+    return extraction.confidence >= settings.PRE_EXTRACT_MIN_CONFIDENCE
+
+
+def hint(extraction) -> bool:
+    return HINT_MIN_CONFIDENCE <= extraction.confidence < settings.PRE_EXTRACT_MIN_CONFIDENCE
+
+
+def test_display_name_alone_is_only_a_hint():
+    fields = extract("Hi, we'd love to write a guest post for your blog.")
+    assert fields["contact_name"].value == "Jane Doe"
+    assert hint(fields["contact_name"])
+
+
+def test_display_name_in_the_body_or_signature_is_trusted():
+    assert trusted(extract("Hi, I'm Jane Doe from TechDaily.")["contact_name"])
+    assert trusted(extract("Would you take a guest post?\n\nBest regards,\nJane Doe\nTechDaily")["contact_name"])
+    assert trusted(extract("Would you take a guest post?\n\nJane Doe | Outreach, TechDaily")["contact_name"])
+
+
+def test_lone_amount_is_trusted_only_when_quoted_as_a_price():
+    quoted = extract("We offer sponsored posts at $150 per article.")
+    assert (quoted["price.amount"].value, trusted(quoted["price.amount"])) == (150, True)
+
+    bare = extract("Our audience spends over $5,000 a month with partners like you. Shall we talk?")
+    assert bare["price.amount"].value == 5000
+    assert hint(bare["price.amount"])
+
+
+def test_dollar_sign_alone_does_not_settle_the_currency():
+    symbol = extract("Guest post price: $150.")
+    assert symbol["price.currency"].value == "USD"
+    assert hint(symbol["price.currency"])
+
+    assert trusted(extract("Guest post price: 150 USD.")["price.currency"])
+
+
+def test_revenue_figures_are_not_prices():
+    assert "price.amount" not in extract("Our site made $2M last year, and the guest post fee is negotiable.")
@@ -0,0 +1,75 @@
+"""AIMD concurrency and token budgets of the LLM rate limiter."""
+import asyncio
+
+import httpx
+import openai
+
+from app.services.rate_limiter import RateLimiter
+
+
+def limiter(**overrides) -> RateLimiter:
+    options = dict(rpm=0, tpm=0, max_concurrency=8, min_concurrency=1, max_retries=2, backoff_base=0.001, backoff_max=0.01)
+    return RateLimiter(**{**options, **overrides})
+
+
+def error(status_code: int) -> Exception:
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+    if status_code == 429:
+        return openai.RateLimitError("Rate limited", response=response, body=None)
+    return openai.InternalServerError("Server error", response=response, body=None)
+
+
+async def succeed():
+    return "ok"
+
+
+def failing_once(status_code: int):
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise error(status_code)
+        return "ok"
+
+    return fn
+
+
+async def test_throttled_round_halves_the_limit_once():
+    rate_limiter = limiter(max_retries=1)
+    gate = asyncio.Event()
+
+    async def throttled():
+        await gate.wait()
+        raise error(429)
+
+    calls = [asyncio.create_task(rate_limiter.acall(throttled, 1)) for _ in range(8)]
+    while rate_limiter.in_flight < 8:
+        await asyncio.sleep(0)
+
+    gate.set()  # All eight were sent under the same limit; their retries fail for good
+    results = await asyncio.gather(*calls, return_exceptions=True)
+
+    assert all(isinstance(result, openai.RateLimitError) for result in results)
+    assert rate_limiter.get_stats()["throttled"] == 8
+    assert rate_limiter.concurrency_limit == 4
+
+
+async def test_failed_attempt_gives_its_tokens_back():
+    rate_limiter = limiter(tpm=600)
+
+    assert await rate_limiter.acall(failing_once(500), 300) == "ok"
+
+    # One reservation outstanding (the response reports no usage), not two
+    assert rate_limiter.tokens.tokens >= 299
+
+
+async def test_waiting_for_tokens_holds_no_slot():
+    rate_limiter = limiter(tpm=6000)  # 100 tokens a second
+    await rate_limiter.acall(succeed, 6000)  # Empties the bucket
+
+    call = asyncio.create_task(rate_limiter.acall(succeed, 20))
+    await asyncio.sleep(0.1)  # Halfway through its wait for tokens
+
+    assert rate_limiter.in_flight == 0
+    await call
@@ -0,0 +1,40 @@
+"""Publishing and activating parsing schema versions."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.models.parsing_schema import ParsingSchema
+from app.services.schema_registry import DEFAULT_PARSING_SCHEMA, schema_registry
+
+
+@pytest.fixture(autouse=True)
+def restore_active():
+    """Schemas are kept between tests: put the active version back."""
+    version = schema_registry.get_active().version
+    yield
+    schema_registry.activate(version)
+
+
+def variant(n: int) -> dict:
+    return {**DEFAULT_PARSING_SCHEMA, "title": f"variant {n}"}
+
+
+def active_versions(db) -> list:
+    db.expire_all()
+    return [v for (v,) in db.query(ParsingSchema.version).filter(ParsingSchema.is_active.is_(True))]
+
+
+def test_concurrent_publishes_get_their_own_versions(db):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        published = list(pool.map(schema_registry.publish, [variant(n) for n in range(4)]))
+
+    versions = [compiled.version for compiled in published]
+    assert len(set(versions)) == 4
+    assert len(active_versions(db)) == 1
+
+
+def test_activating_the_active_version_keeps_it_active(db):
+    compiled = schema_registry.publish(variant(0))
+
+    assert schema_registry.activate(compiled.version).version == compiled.version
+    assert active_versions(db) == [compiled.version]